@@ -1,11 +1,12 @@
 from datetime import datetime
 
-from data.yahoo import preload_symbols
+from data.yahoo import preload_symbols, preload_universe
 from strategy.buy_and_hold import BuyAndHold
 from strategy.pattern_matching import PatternMatching
 from strategy.running_avg import RunningAvg
 from strategy.kelly_criterion import KellyCriterion
-from trading_environments import backtest_environment
+from trading_environments import backtest_environment, metrics
+from universe import load_sp500
 
 
 def main():
@@ -41,17 +42,22 @@ def main():
     #     end_date,
     # )
 
-    portfolio_cum_returns = tear_sheet["Portfolio Cumulative Returns"] + 1
-    portfolio_max_returns = portfolio_cum_returns.cummax()
-    benchmark_cum_returns = tear_sheet["Benchmark Cumulative Returns"] + 1
-    benchmark_max_returns = benchmark_cum_returns.cummax()
-
-    draw_down = (portfolio_cum_returns - portfolio_max_returns) / portfolio_max_returns
-    draw_down[draw_down == float('-inf')] = 0
-    print(draw_down.min())
-    draw_down = (benchmark_cum_returns - benchmark_max_returns) / benchmark_max_returns
-    draw_down[draw_down == float('-inf')] = 0
-    print(draw_down.min())
+    # sector neutral Kelly over the information technology names of the S&P 500
+    # sp500 = load_sp500()
+    # tech = sp500.subset(sp500.sector_symbols("Information Technology"))
+    # preload_universe(tech.symbols)
+    # tear_sheet = backtest_environment.run_open_close(
+    #     KellyCriterion(tech, covariance="ledoit_wolf", sector_neutral=True),
+    #     50000,
+    #     start_date,
+    #     end_date,
+    # )
+
+    portfolio_max_draw_down, benchmark_max_draw_down = metrics.max_drawdown(
+        tear_sheet[["Portfolio Value", "Benchmark Value"]].values
+    )
+    print(portfolio_max_draw_down)
+    print(benchmark_max_draw_down)
 
 
 if __name__ == "__main__":
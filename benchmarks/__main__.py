@@ -0,0 +1,38 @@
+import argparse
+
+from benchmarks.suite import (
+    HISTORY_LENGTHS,
+    UNIVERSE_SIZES,
+    compare,
+    load,
+    run_suite,
+    save,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the backtest hot paths on synthetic prices"
+    )
+    parser.add_argument(
+        "--output", default="benchmark_results.json", help="where to save the results"
+    )
+    parser.add_argument(
+        "--compare", help="a previous results file to compare against", default=None
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(UNIVERSE_SIZES))
+    parser.add_argument("--days", type=int, nargs="+", default=list(HISTORY_LENGTHS))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    report = run_suite(args.sizes, args.days, args.repeat)
+    save(report, args.output)
+    print(f"Saved results to {args.output}")
+    if args.compare:
+        print(
+            compare(load(args.compare), report).to_string(float_format="{:.2f}".format)
+        )
+
+
+if __name__ == "__main__":
+    main()
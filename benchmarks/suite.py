@@ -0,0 +1,239 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_prices, synthetic_tickers
+from broker.transparent import TransparentBroker
+from data.yahoobacktest import YahooBackTestDataSource
+from security import Equity
+from strategy.buy_and_hold import BuyAndHold
+from strategy.buy_hedge_spy import BuyHedgeSpy
+from strategy.kelly_criterion import KellyCriterion
+from strategy.markov import Markov
+from strategy.pattern_matching import PatternMatching
+from strategy.running_avg import RunningAvg
+from strategy.sell_and_hold import SellAndHold
+from strategy.util import get_pct_returns
+from trading_environments import backtest_environment
+
+UNIVERSE_SIZES = (6, 50, 500)
+HISTORY_LENGTHS = (504, 2520)
+
+# The strategies benchmarked by `before_close`, built from a list of tickers
+STRATEGIES: Dict[str, Callable[[List[str]], Any]] = {
+    "BuyAndHold": BuyAndHold,
+    "SellAndHold": SellAndHold,
+    "BuyHedgeSpy": BuyHedgeSpy,
+    "KellyCriterion": KellyCriterion,
+    "KellyCriterion[ledoit_wolf,incremental]": lambda symbols: KellyCriterion(
+        symbols, covariance="ledoit_wolf", incremental=True
+    ),
+    "RunningAvg": RunningAvg,
+    "PatternMatching": lambda symbols: PatternMatching(
+        symbols, look_back_window=200, match_window_length=10
+    ),
+    "Markov": lambda symbols: Markov(
+        symbols, look_back_window=200, match_window_length=5
+    ),
+}
+
+
+def time_call(
+    function: Callable[[], Any], repeat: int = 5, min_time: float = 0.05
+) -> Dict[str, Any]:
+    """
+    Times `function` by calling it in batches large enough to take at least `min_time` seconds
+    :param function: the function to time
+    :param repeat: the number of batches
+    :param min_time: the minimum duration of a batch in seconds
+    :return: the number of calls per batch and the min, median, and mean seconds per call
+    """
+    function()  # warm up caches (e.g. the returns matrix)
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 10**6:
+            break
+        number *= max(2, int(min_time / max(elapsed, 1e-9)))
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+    return {
+        "number": number,
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "mean_s": statistics.mean(timings),
+    }
+
+
+def run_suite(
+    sizes: Sequence[int] = UNIVERSE_SIZES,
+    history_lengths: Sequence[int] = HISTORY_LENGTHS,
+    repeat: int = 5,
+    end_to_end_days: int = 252,
+    log: bool = True,
+) -> Dict[str, Any]:
+    """
+    Benchmarks the data source, broker, strategies, and a full backtest on synthetic prices
+    for every combination of universe size and history length
+    :param sizes: the number of tickers of each universe
+    :param history_lengths: the number of trading days of price history
+    :param repeat: the number of timed batches of each benchmark
+    :param end_to_end_days: the number of days `run_open_close` trades for
+    :param log: whether to print each result as it completes
+    :return: the machine, commit, and results of the run, ready to be saved as JSON
+    """
+    results = list()
+
+    def record(name: str, size: int, days: int, function: Callable[[], Any]):
+        # some strategies print their weights, which would flood the output
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            timing = time_call(function, repeat)
+        result = {"name": name, "universe_size": size, "history_days": days, **timing}
+        results.append(result)
+        if log:
+            print(
+                f"{name:<45} n={size:<4} days={days:<5} "
+                f"{timing['median_s'] * 1e6:>12.1f} us"
+            )
+
+    for days in history_lengths:
+        for size in sizes:
+            prices = synthetic_prices(size, days)
+            tickers = synthetic_tickers(size)
+            securities = [Equity(ticker) for ticker in tickers]
+            data_source = YahooBackTestDataSource(prices.trading_days[-1], prices)
+
+            record(
+                "get_pct_returns",
+                size,
+                days,
+                lambda: get_pct_returns(tickers, "Close", 200, data_source),
+            )
+            record(
+                "YahooBackTestDataSource.price_history",
+                size,
+                days,
+                lambda: data_source.price_history(securities[0], bar_count=200),
+            )
+
+            broker = TransparentBroker(10**6, data_source)
+            for security in securities:
+                broker.place_order(security, 10)
+            record(
+                "TransparentBroker.get_portfolio_value",
+                size,
+                days,
+                broker.get_portfolio_value,
+            )
+
+            def place_orders():
+                for security in securities:
+                    broker.place_order_proportion(security, 1 / size)
+
+            record(
+                "TransparentBroker.place_order_proportion",
+                size,
+                days,
+                place_orders,
+            )
+
+            for name, build in STRATEGIES.items():
+                strategy = build(tickers)
+                strategy_broker = TransparentBroker(10**6, data_source)
+                record(
+                    f"{name}.before_close",
+                    size,
+                    days,
+                    lambda: strategy.before_close(strategy_broker, data_source),
+                )
+
+            if days > end_to_end_days:
+                start_date = prices.trading_days[-end_to_end_days]
+                end_date = prices.trading_days[-1]
+                record(
+                    "run_open_close",
+                    size,
+                    days,
+                    lambda: backtest_environment.run_open_close(
+                        STRATEGIES["PatternMatching"](tickers),
+                        10**6,
+                        start_date,
+                        end_date,
+                        plot_metrics=False,
+                        log=False,
+                        prices=prices,
+                    ),
+                )
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "commit": _git_commit(),
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+        },
+        "results": results,
+    }
+
+
+def save(report: Dict[str, Any], path: str):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline: Dict[str, Any], report: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Compares the median time of every benchmark in `report` with the same benchmark in
+    `baseline`
+    :return: a table of both medians and their ratio (above 1 means `report` is slower)
+    """
+    key = ["name", "universe_size", "history_days"]
+    baseline_results = pd.DataFrame(baseline["results"]).set_index(key)
+    results = pd.DataFrame(report["results"]).set_index(key)
+    comparison = pd.DataFrame(
+        {
+            "Baseline (us)": baseline_results["median_s"] * 1e6,
+            "Current (us)": results["median_s"] * 1e6,
+        }
+    ).dropna()
+    comparison["Ratio"] = comparison["Current (us)"] / comparison["Baseline (us)"]
+    return comparison
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,96 @@
+import threading
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data.alignedprices import AlignedPrices
+from data.data import PRICE_FIELDS
+
+
+def synthetic_tickers(count: int) -> List[str]:
+    return [f"SYN{i:03d}" for i in range(count)]
+
+
+def synthetic_prices(
+    ticker_count: int, day_count: int, seed: int = 0, benchmark: str = "SPY"
+) -> AlignedPrices:
+    """
+    Generates deterministic daily bars with geometric Brownian motion, so benchmarks run without
+    the network and give the same data on every machine
+    :param ticker_count: the number of tickers besides the benchmark (see `synthetic_tickers`)
+    :param day_count: the number of trading days, ending on 2020-12-31
+    :param seed: the random seed
+    :param benchmark: the ticker of the benchmark column, which comes first
+    :return: aligned prices of the benchmark and every ticker
+    """
+    rng = np.random.default_rng(seed)
+    trading_days = pd.bdate_range(end="2020-12-31", periods=day_count)
+    tickers = [benchmark] + synthetic_tickers(ticker_count)
+    count = len(tickers)
+
+    drift = rng.normal(0.0003, 0.0002, count)
+    volatility = rng.uniform(0.01, 0.03, count)
+    log_returns = rng.normal(drift, volatility, (day_count, count))
+    close = 100 * np.exp(np.cumsum(log_returns, axis=0))
+    gap = rng.normal(0, volatility / 4, (day_count, count))
+    open_ = close * np.exp(gap)
+    spread = np.abs(rng.normal(0, volatility / 2, (day_count, count)))
+    high = np.maximum(open_, close) * (1 + spread)
+    low = np.minimum(open_, close) * (1 - spread)
+    volume = rng.integers(10**5, 10**7, (day_count, count)).astype(np.float64)
+
+    bars = np.stack([open_, high, low, close, volume])
+    assert bars.shape[0] == len(PRICE_FIELDS)
+    return AlignedPrices(trading_days, np.ascontiguousarray(bars), tickers)
+
+
+class SyntheticFetcher:
+    """
+    A stand-in for the Yahoo download of `data.yahoo.preload_universe` that serves synthetic
+    daily bars, so the preloader runs offline. Every symbol gets its own deterministic history.
+    The first `failures` calls raise to exercise retries, and `missing` symbols have no data.
+    Every call is recorded in `calls`.
+    """
+
+    def __init__(
+        self,
+        day_count: int = 504,
+        failures: int = 0,
+        missing: Sequence[str] = (),
+    ):
+        """
+        :param day_count: the number of trading days of every symbol, ending on 2020-12-31
+        :param failures: the number of calls that fail before any succeeds
+        :param missing: symbols to return no data for
+        """
+        self.day_count = day_count
+        self.failures = failures
+        self.missing = set(missing)
+        self.calls: List[Tuple[List[str], Optional[datetime]]] = list()
+        self._lock = threading.Lock()
+
+    def __call__(
+        self, symbols: List[str], start: Optional[datetime] = None
+    ) -> Dict[str, pd.DataFrame]:
+        with self._lock:
+            self.calls.append((list(symbols), start))
+            if self.failures > 0:
+                self.failures -= 1
+                raise ConnectionError("Synthetic download failed")
+        frames = dict()
+        for symbol in symbols:
+            if symbol in self.missing:
+                continue
+            prices = synthetic_prices(
+                0, self.day_count, seed=zlib.crc32(symbol.encode()), benchmark=symbol
+            )
+            frame = pd.DataFrame(
+                prices.bars[:, :, 0].T,
+                index=prices.trading_days,
+                columns=list(PRICE_FIELDS),
+            )
+            frames[symbol] = frame if start is None else frame[frame.index >= start]
+        return frames
@@ -1,4 +1,7 @@
 from abc import ABC, abstractmethod
+from typing import Mapping, Optional, Sequence, Union
+
+import numpy as np
 
 from security import Security
 
@@ -55,6 +58,23 @@ class Broker(ABC):
         """
         pass
 
+    @abstractmethod
+    def rebalance_to_weights(
+        self,
+        weights: Union[Mapping[Security, float], np.ndarray],
+        securities: Optional[Sequence[Security]] = None,
+    ):
+        """
+        Places market orders so that each security occupies its target proportion of the current
+        capital. Unlike calling `place_order_proportion` once per security, every order is sized
+        against the same valuation of the portfolio, so the result does not depend on the order
+        of the securities.
+        :param weights: either a mapping from security to proportion, or an array of proportions
+        aligned with `securities`. Proportions have the same meaning as in `place_order_proportion`.
+        :param securities: the securities of each entry of `weights` when `weights` is an array
+        """
+        pass
+
     @property
     @abstractmethod
     def liquid_value(self) -> float:
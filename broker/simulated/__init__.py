@@ -0,0 +1,339 @@
+import math
+from typing import List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+
+from broker.simulated.models import (
+    CommissionModel,
+    NoCommission,
+    NoSlippage,
+    SlippageModel,
+)
+from broker.transparent import TransparentBroker
+from data.data import DataSource
+from security import Security
+
+# One record per fill. `security` is the id of the filled security.
+FILL_DTYPE = np.dtype(
+    [
+        ("order", np.int64),
+        ("security", np.int64),
+        ("quantity", np.int64),
+        ("price", np.float64),
+        ("commission", np.float64),
+    ]
+)
+
+# The number of matches an order rests for when it has no expiry
+_GOOD_TILL_CANCELLED = np.iinfo(np.int64).max
+
+
+class SimulatedBroker(TransparentBroker):
+    """
+    A broker that rests orders in an order book and fills them against the next bar.
+
+    Orders are not filled when they are placed. Every time `match` is called (once per bar by
+    the event engine) the open orders are matched against the current bar: market orders fill
+    at the open and limit orders fill when the bar's range reaches their limit, at the limit or
+    at the open if the bar opened through it. Each bar only has a share of its volume to give,
+    so large orders fill partially over several bars in the order they were placed. Fill
+    prices then go through a slippage model and every fill pays commission.
+
+    The book is held as parallel arrays with one entry per open order, so a whole book is
+    matched with a few array operations regardless of how many orders rest in it.
+    """
+
+    def __init__(
+        self,
+        initial_capital: float,
+        data_source: DataSource,
+        commission: Optional[CommissionModel] = None,
+        slippage: Optional[SlippageModel] = None,
+        volume_limit: Optional[float] = 0.025,
+    ):
+        """
+        :param initial_capital: the starting cash
+        :param data_source: the data source to get bars from
+        :param commission: the commission model (defaults to no commission)
+        :param slippage: the slippage model (defaults to no slippage)
+        :param volume_limit: the fraction of a bar's volume that orders may fill (if None,
+        orders always fill completely)
+        """
+        super().__init__(initial_capital, data_source)
+        self.commission = commission or NoCommission()
+        self.slippage = slippage or NoSlippage()
+        self.volume_limit = volume_limit
+        self._next_order_id = 0
+        self._order_count = 0
+        self._order_ids = np.empty(0, dtype=np.int64)
+        # the position index of each order's security, as in `_quantities`
+        self._order_indices = np.empty(0, dtype=np.int64)
+        # the signed quantity still to fill
+        self._order_quantities = np.empty(0, dtype=np.int64)
+        # NaN for market orders
+        self._order_limits = np.empty(0, dtype=np.float64)
+        # the number of matches left before the order is cancelled
+        self._order_lives = np.empty(0, dtype=np.int64)
+        self._fills: List[np.ndarray] = list()
+
+    @property
+    def open_orders(self) -> int:
+        return self._order_count
+
+    @property
+    def fills(self) -> np.ndarray:
+        """
+        Every fill so far as an array of `FILL_DTYPE` records
+        """
+        if len(self._fills) > 1:
+            self._fills = [np.concatenate(self._fills)]
+        return self._fills[0] if self._fills else np.empty(0, dtype=FILL_DTYPE)
+
+    def place_order(self, symbol: Security, quantity: int) -> Optional[int]:
+        """
+        Places a market order that fills at the open of the next matched bar
+        :return: the id of the order (None if `quantity` is 0)
+        """
+        return self._place(symbol, quantity, math.nan, None)
+
+    def place_limit_order(
+        self,
+        symbol: Security,
+        quantity: int,
+        limit_price: float,
+        expires_in: Optional[int] = None,
+    ) -> Optional[int]:
+        """
+        Places a limit order that rests until it fills, is cancelled, or expires
+        :param expires_in: the number of bars the order rests for (if None, until cancelled)
+        :return: the id of the order (None if `quantity` is 0)
+        """
+        return self._place(symbol, quantity, limit_price, expires_in)
+
+    def place_order_proportion(self, symbol: Security, proportion: float):
+        quantity = self._proportion_quantity(symbol, proportion)
+        self.place_order(symbol, quantity)
+
+    def place_limit_order_proportion(
+        self, symbol: Security, proportion: float, limit_price: float
+    ):
+        quantity = self._proportion_quantity(symbol, proportion)
+        self.place_limit_order(symbol, quantity, limit_price)
+
+    def cancel_order(self, order_id: int):
+        n = self._order_count
+        self._keep_orders(self._order_ids[:n] != order_id)
+
+    def cancel_all_orders(self):
+        self._order_count = 0
+
+    def rebalance_to_weights(
+        self,
+        weights: Union[Mapping[Security, float], np.ndarray],
+        securities: Optional[Sequence[Security]] = None,
+    ):
+        """
+        Places market orders that bring each security to its target proportion once they
+        fill. Market orders that have not filled yet count towards the targets.
+        """
+        indices, _, deltas = self._target_deltas(weights, securities)
+        traded = deltas != 0
+        self._add_orders(
+            indices[traded],
+            deltas[traded],
+            np.full(int(traded.sum()), np.nan),
+            _GOOD_TILL_CANCELLED,
+        )
+
+    def match(self) -> int:
+        """
+        Matches the open orders against the data source's current bar
+        :return: the number of orders that were filled (partially or completely)
+        """
+        n = self._order_count
+        if n == 0:
+            return 0
+        indices = self._order_indices[:n]
+        quantities = self._order_quantities[:n]
+        limits = self._order_limits[:n]
+
+        traded_indices, inverse = np.unique(indices, return_inverse=True)
+        securities = [self._securities[i] for i in traded_indices]
+        open_, high, low, volume = (
+            self._data_source.price_snapshot(securities, field)[inverse]
+            for field in ("Open", "High", "Low", "Volume")
+        )
+
+        buy = quantities > 0
+        market = np.isnan(limits)
+        with np.errstate(invalid="ignore"):
+            crossed = market | np.where(buy, low <= limits, high >= limits)
+            crossed &= np.isfinite(open_)
+        # a limit order fills at its limit, or at the open if the bar opened through it
+        prices = np.where(
+            market,
+            open_,
+            np.where(buy, np.fmin(limits, open_), np.fmax(limits, open_)),
+        )
+        wanted = np.where(crossed, np.abs(quantities), 0)
+        filled = (
+            wanted
+            if self.volume_limit is None
+            else self._fill_by_volume(inverse, wanted, volume)
+        )
+        signed_filled = np.sign(quantities) * filled
+
+        traded = filled > 0
+        if traded.any():
+            fill_quantities = signed_filled[traded]
+            fill_prices = self.slippage.fill_price(
+                prices[traded], fill_quantities, volume[traded]
+            )
+            # slippage never fills a limit order through its limit
+            fill_limits = limits[traded]
+            fill_prices = np.where(
+                np.isnan(fill_limits),
+                fill_prices,
+                np.where(
+                    fill_quantities > 0,
+                    np.fmin(fill_prices, fill_limits),
+                    np.fmax(fill_prices, fill_limits),
+                ),
+            )
+            commissions = self.commission.cost(fill_quantities, fill_prices)
+            self.liquid_capital -= float(
+                fill_prices @ fill_quantities + commissions.sum()
+            )
+            np.add.at(self._quantities, indices[traded], fill_quantities)
+
+            fills = np.empty(len(fill_quantities), dtype=FILL_DTYPE)
+            fills["order"] = self._order_ids[:n][traded]
+            fills["security"] = [
+                self._securities[i].id for i in indices[traded].tolist()
+            ]
+            fills["quantity"] = fill_quantities
+            fills["price"] = fill_prices
+            fills["commission"] = commissions
+            self._fills.append(fills)
+
+        quantities -= signed_filled
+        lives = self._order_lives[:n]
+        lives[lives != _GOOD_TILL_CANCELLED] -= 1
+        self._keep_orders((quantities != 0) & (lives > 0))
+        return int(traded.sum())
+
+    def _fill_by_volume(
+        self, groups: np.ndarray, wanted: np.ndarray, volume: np.ndarray
+    ) -> np.ndarray:
+        """
+        Shares out each security's available volume between its orders in the order they
+        were placed
+        :param groups: the security group of each order
+        :param wanted: the quantity each order can fill
+        :param volume: the bar volume of each order's security
+        :return: the quantity each order fills
+        """
+        capacity = np.floor(self.volume_limit * np.nan_to_num(volume)).astype(np.int64)
+        order = np.argsort(groups, kind="stable")
+        sorted_wanted = wanted[order]
+        taken_before = np.cumsum(sorted_wanted) - sorted_wanted
+        group_starts = np.ones(len(order), dtype=bool)
+        group_starts[1:] = groups[order][1:] != groups[order][:-1]
+        # restart the running total at the first order of each security
+        taken_before -= np.maximum.accumulate(np.where(group_starts, taken_before, 0))
+        filled = np.empty_like(wanted)
+        filled[order] = np.clip(capacity[order] - taken_before, 0, sorted_wanted)
+        return filled
+
+    def _committed_quantities(self) -> np.ndarray:
+        return self._quantities + self._pending_market()
+
+    def _pending_market(self) -> np.ndarray:
+        """
+        :return: the quantity of every position index still to fill from market orders
+        """
+        n = self._order_count
+        market = np.isnan(self._order_limits[:n])
+        return np.bincount(
+            self._order_indices[:n][market],
+            weights=self._order_quantities[:n][market],
+            minlength=len(self._securities),
+        ).astype(np.int64)
+
+    def _proportion_quantity(self, symbol: Security, proportion: float) -> int:
+        index = self._register(symbol)
+        price = self._get_curr_price(symbol)
+        stock_value = self.get_portfolio_value() * proportion
+        if math.isnan(price) or math.isnan(stock_value):
+            return 0
+        return (
+            int(round(stock_value / price))
+            - int(self._quantities[index])
+            - int(self._pending_market()[index])
+        )
+
+    def _place(
+        self,
+        symbol: Security,
+        quantity: int,
+        limit_price: float,
+        expires_in: Optional[int],
+    ) -> Optional[int]:
+        if quantity == 0:
+            return None
+        order_id = self._next_order_id
+        self._add_orders(
+            np.array([self._register(symbol)]),
+            np.array([quantity]),
+            np.array([limit_price], dtype=np.float64),
+            _GOOD_TILL_CANCELLED if expires_in is None else expires_in,
+        )
+        return order_id
+
+    def _add_orders(
+        self,
+        indices: np.ndarray,
+        quantities: np.ndarray,
+        limits: np.ndarray,
+        lives: int,
+    ):
+        count = len(indices)
+        n = self._order_count
+        if n + count > len(self._order_ids):
+            # Grow geometrically so placing orders one at a time stays amortized linear
+            capacity = max(2 * len(self._order_ids), n + count, 8)
+            for name in (
+                "_order_ids",
+                "_order_indices",
+                "_order_quantities",
+                "_order_limits",
+                "_order_lives",
+            ):
+                old = getattr(self, name)
+                grown = np.empty(capacity, dtype=old.dtype)
+                grown[:n] = old[:n]
+                setattr(self, name, grown)
+        self._order_ids[n : n + count] = np.arange(
+            self._next_order_id, self._next_order_id + count
+        )
+        self._order_indices[n : n + count] = indices
+        self._order_quantities[n : n + count] = quantities
+        self._order_limits[n : n + count] = limits
+        self._order_lives[n : n + count] = lives
+        self._next_order_id += count
+        self._order_count += count
+
+    def _keep_orders(self, keep: np.ndarray):
+        kept = int(keep.sum())
+        if kept == self._order_count:
+            return
+        for book in (
+            self._order_ids,
+            self._order_indices,
+            self._order_quantities,
+            self._order_limits,
+            self._order_lives,
+        ):
+            # compact in place, keeping the open orders in the order they were placed
+            book[:kept] = book[: self._order_count][keep]
+        self._order_count = kept
@@ -0,0 +1,102 @@
+"""
+Transaction cost models of `SimulatedBroker`. Every model works on arrays of fills at once:
+signed fill quantities (positive for buys), fill prices, and the volume of each fill's bar.
+"""
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+class CommissionModel(ABC):
+    @abstractmethod
+    def cost(self, quantities: np.ndarray, prices: np.ndarray) -> np.ndarray:
+        """
+        :param quantities: the signed quantity of each fill
+        :param prices: the price of each fill
+        :return: the commission of each fill
+        """
+        pass
+
+
+class NoCommission(CommissionModel):
+    def cost(self, quantities: np.ndarray, prices: np.ndarray) -> np.ndarray:
+        return np.zeros(len(quantities))
+
+
+class PerShareCommission(CommissionModel):
+    def __init__(self, cost_per_share: float = 0.005, minimum: float = 1.0):
+        """
+        :param cost_per_share: the commission per share traded
+        :param minimum: the minimum commission of a fill
+        """
+        self.cost_per_share = cost_per_share
+        self.minimum = minimum
+
+    def cost(self, quantities: np.ndarray, prices: np.ndarray) -> np.ndarray:
+        cost = np.maximum(np.abs(quantities) * self.cost_per_share, self.minimum)
+        return np.where(quantities != 0, cost, 0)
+
+
+class PercentCommission(CommissionModel):
+    def __init__(self, rate: float = 0.001):
+        """
+        :param rate: the commission as a fraction of the value traded
+        """
+        self.rate = rate
+
+    def cost(self, quantities: np.ndarray, prices: np.ndarray) -> np.ndarray:
+        return np.abs(quantities) * prices * self.rate
+
+
+class SlippageModel(ABC):
+    @abstractmethod
+    def fill_price(
+        self, prices: np.ndarray, quantities: np.ndarray, volumes: np.ndarray
+    ) -> np.ndarray:
+        """
+        :param prices: the price each order would fill at without slippage
+        :param quantities: the signed quantity of each fill
+        :param volumes: the volume of the bar of each fill
+        :return: the price each order fills at
+        """
+        pass
+
+
+class NoSlippage(SlippageModel):
+    def fill_price(
+        self, prices: np.ndarray, quantities: np.ndarray, volumes: np.ndarray
+    ) -> np.ndarray:
+        return prices
+
+
+class FixedSlippage(SlippageModel):
+    def __init__(self, spread: float = 0.001):
+        """
+        :param spread: the bid-ask spread as a fraction of the price. Buys pay half of it above
+        the price and sells receive half of it below.
+        """
+        self.spread = spread
+
+    def fill_price(
+        self, prices: np.ndarray, quantities: np.ndarray, volumes: np.ndarray
+    ) -> np.ndarray:
+        return prices * (1 + np.sign(quantities) * self.spread / 2)
+
+
+class VolumeShareSlippage(SlippageModel):
+    def __init__(self, price_impact: float = 0.1):
+        """
+        :param price_impact: the fraction the price moves against a fill that takes the entire
+        volume of its bar. The impact grows with the square of the share of volume taken.
+        """
+        self.price_impact = price_impact
+
+    def fill_price(
+        self, prices: np.ndarray, quantities: np.ndarray, volumes: np.ndarray
+    ) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            volume_share = np.where(
+                volumes > 0, np.minimum(np.abs(quantities) / volumes, 1), 0
+            )
+        return prices * (1 + np.sign(quantities) * self.price_impact * volume_share**2)
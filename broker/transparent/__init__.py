@@ -1,5 +1,7 @@
 import math
-from collections import defaultdict
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
 
 from broker.broker import Broker
 from data.data import DataSource
@@ -7,6 +9,15 @@ from security import Security
 
 
 class TransparentBroker(Broker):
+    """
+    A broker that fills every order immediately at the data source's current price.
+
+    Positions are held in an integer array indexed by a registry of every security the broker
+    has traded, so the portfolio can be marked to market with one price snapshot from the data
+    source and a single dot product. The registry maps each security's dense id to its position
+    index through an array, so no security is hashed when orders are placed.
+    """
+
     @property
     def liquid_value(self) -> float:
         return self.liquid_capital
@@ -17,15 +28,31 @@ class TransparentBroker(Broker):
 
     def __init__(self, initial_capital: float, data_source: DataSource):
         self.liquid_capital = initial_capital
-        self.positions = defaultdict(int)
         self._data_source = data_source
+        self._securities: List[Security] = list()
+        # the position index of each security id, or -1 if the broker hasn't traded it
+        self._registry = np.full(0, -1, dtype=np.int64)
+        self._quantities = np.zeros(0, dtype=np.int64)
+
+    @property
+    def positions(self) -> Dict[Security, int]:
+        """
+        The quantity held of every security the broker has traded
+        """
+        return {
+            security: int(quantity)
+            for security, quantity in zip(self._securities, self._quantities)
+        }
 
     def place_order(self, symbol: Security, quantity: int):
+        if quantity == 0:
+            return
+        index = self._register(symbol)
         price = self._get_curr_price(symbol)
         cost = price * quantity
         self.liquid_capital -= cost
         # self.liquid_capital -= abs(quantity) * 0.02  # add slippage
-        self.positions[symbol] += quantity
+        self._quantities[index] += quantity
 
     def place_limit_order(self, symbol: Security, quantity: int, limit_price: float):
         self.place_order(symbol, quantity)
@@ -37,7 +64,7 @@ class TransparentBroker(Broker):
         if math.isnan(price) or math.isnan(stock_value):
             quantity = 0
         else:
-            quantity = int(round(stock_value / price)) - self.positions[symbol]
+            quantity = int(round(stock_value / price)) - self._position(symbol)
         self.place_order(symbol, quantity)
 
     def place_limit_order_proportion(
@@ -45,15 +72,107 @@ class TransparentBroker(Broker):
     ):
         self.place_order_proportion(symbol, proportion)
 
+    def rebalance_to_weights(
+        self,
+        weights: Union[Mapping[Security, float], np.ndarray],
+        securities: Optional[Sequence[Security]] = None,
+    ):
+        indices, order_prices, deltas = self._target_deltas(weights, securities)
+        traded = deltas != 0
+        self.liquid_capital -= float(order_prices[traded] @ deltas[traded])
+        self._quantities[indices] += deltas
+
+    def _target_deltas(
+        self,
+        weights: Union[Mapping[Security, float], np.ndarray],
+        securities: Optional[Sequence[Security]],
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Sizes the orders of `rebalance_to_weights` against one valuation of the portfolio. A
+        security listed more than once targets the sum of its weights.
+        :return: a tuple of the position index, current price, and quantity to order of every
+        distinct security of `weights`
+        """
+        if isinstance(weights, Mapping):
+            securities = list(weights.keys())
+            weights = np.fromiter(
+                weights.values(), dtype=np.float64, count=len(weights)
+            )
+        else:
+            assert (
+                securities is not None
+            ), "Must pass the securities of an array of weights"
+            weights = np.asarray(weights, dtype=np.float64)
+            assert len(weights) == len(securities), "Need one weight per security"
+        indices = self._register_all(securities)
+        unique_indices, inverse = np.unique(indices, return_inverse=True)
+        if len(unique_indices) < len(indices):
+            # fold duplicates, since fancy-indexed updates would only apply one of them
+            weights = np.bincount(
+                inverse.ravel(), weights=weights, minlength=len(unique_indices)
+            )
+            indices = unique_indices
+
+        # value the portfolio once and size every order against that snapshot
+        prices = self._data_source.price_snapshot(self._securities)
+        held = self._quantities != 0
+        portfolio_value = self.liquid_capital + prices[held] @ self._quantities[held]
+        order_prices = prices[indices]
+        current = self._committed_quantities()[indices]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            targets = np.round(portfolio_value * weights / order_prices)
+        valid = np.isfinite(targets)
+        deltas = np.where(valid, targets, current).astype(np.int64) - current
+        return indices, order_prices, deltas
+
+    def _committed_quantities(self) -> np.ndarray:
+        """
+        :return: the quantity of every position index that orders are sized against
+        """
+        return self._quantities
+
+    def _register(self, symbol: Security) -> int:
+        index = self._index(symbol.id)
+        if index < 0:
+            index = len(self._securities)
+            self._registry[symbol.id] = index
+            self._securities.append(symbol)
+            self._quantities = np.append(self._quantities, 0)
+        return index
+
+    def _register_all(self, securities: Sequence[Security]) -> np.ndarray:
+        ids = np.fromiter(
+            (security.id for security in securities),
+            dtype=np.int64,
+            count=len(securities),
+        )
+        if len(ids) > 0 and ids.max() >= len(self._registry):
+            self._grow_registry(int(ids.max()))
+        indices = self._registry[ids]
+        for i in np.flatnonzero(indices < 0):
+            indices[i] = self._register(securities[i])
+        return indices
+
+    def _index(self, security_id: int) -> int:
+        if security_id >= len(self._registry):
+            self._grow_registry(security_id)
+        return int(self._registry[security_id])
+
+    def _grow_registry(self, security_id: int):
+        registry = np.full(max(2 * len(self._registry), security_id + 1), -1)
+        registry[: len(self._registry)] = self._registry
+        self._registry = registry
+
+    def _position(self, symbol: Security) -> int:
+        index = self._index(symbol.id)
+        return 0 if index < 0 else int(self._quantities[index])
+
     def _get_curr_price(self, symbol: Security) -> float:
-        price = self._data_source.price_history(
-            symbol, bar_count=1, approx_eod_close=True
-        ).iloc[-1]["Close"]
-        return price
+        return float(self._data_source.price_snapshot([symbol])[0])
 
     def get_portfolio_value(self) -> float:
-        total_value = self.liquid_capital
-        for symbol, quantity in self.positions.items():
-            price = self._get_curr_price(symbol)
-            total_value += price * quantity
-        return total_value
+        held = self._quantities != 0
+        if not held.any():
+            return self.liquid_capital
+        prices = self._data_source.price_snapshot(self._securities)
+        return self.liquid_capital + float(prices[held] @ self._quantities[held])
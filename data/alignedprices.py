@@ -0,0 +1,240 @@
+import hashlib
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from data.data import PRICE_FIELDS
+
+FIELD_INDEX = {field: i for i, field in enumerate(PRICE_FIELDS)}
+
+
+class AlignedPrices:
+    """
+    Price bars of many tickers aligned onto one shared trading-day axis.
+
+    Bars are held in a single contiguous float64 array of shape (fields, days, tickers) where
+    fields are ordered as in `PRICE_FIELDS`. Days a ticker has no bar for (e.g. before it was
+    listed) are NaN. Given a day index, the prices of every ticker on that day are a contiguous
+    row and the history of a single ticker is a strided view, so neither requires a copy.
+
+    The axis can grow while the prices are in use (see `append_day` and `set_bars`), e.g. as a
+    live feed delivers new bars. Both update the cached returns in place, one row at a time.
+    """
+
+    def __init__(
+        self,
+        trading_days: pd.DatetimeIndex,
+        bars: Optional[np.ndarray] = None,
+        tickers: Optional[List[str]] = None,
+    ):
+        """
+        :param trading_days: the shared trading-day axis
+        :param bars: optional pre-aligned bars of shape (fields, days, tickers)
+        :param tickers: the tickers of the columns of `bars`
+        """
+        self.trading_days = pd.DatetimeIndex(trading_days)
+        self.tickers = list(tickers or [])
+        self._columns = {ticker: i for i, ticker in enumerate(self.tickers)}
+        if bars is None:
+            bars = np.empty((len(PRICE_FIELDS), len(self.trading_days), 0))
+        assert bars.shape == (
+            len(PRICE_FIELDS),
+            len(self.trading_days),
+            len(self.tickers),
+        ), "Bars must have shape (fields, days, tickers)"
+        self._bars = bars
+        self._first_index = self._first_valid_index(bars)
+        self._returns = dict()
+        # the fingerprint of the first n days, by n
+        self._fingerprints: Dict[int, str] = dict()
+
+    @property
+    def bars(self) -> np.ndarray:
+        return self._bars[:, : len(self.trading_days), : len(self.tickers)]
+
+    @property
+    def first_index(self) -> np.ndarray:
+        """
+        The index of the first day with a closing price for each ticker
+        """
+        return self._first_index[: len(self.tickers)]
+
+    def returns(self, field: str = "Close") -> np.ndarray:
+        """
+        The percent returns of `field` for every ticker, computed once and cached.
+        As with pandas' `pct_change`, a return spans any missing bars before it.
+        :param field: one of "Open", "High", "Low", "Close", or "Volume"
+        :return: a (days, tickers) float64 array, NaN where a ticker has no bar or no earlier bar
+        """
+        cached = self._returns.get(field)
+        if cached is None or cached.shape[1] < len(self.tickers):
+            computed = 0 if cached is None else cached.shape[1]
+            new_returns = pct_change(self.bars[FIELD_INDEX[field], :, computed:])
+            cached = (
+                new_returns
+                if cached is None
+                else np.ascontiguousarray(np.hstack([cached, new_returns]))
+            )
+            cached.flags.writeable = False
+            self._returns[field] = cached
+        return cached
+
+    def last_prices(
+        self, field: str, day_index: int, columns: Sequence[int]
+    ) -> np.ndarray:
+        """
+        The last price of `field` on or before a day, i.e. the price a return on the next day
+        is relative to. As with `returns`, this spans any missing bars.
+        :param field: one of "Open", "High", "Low", "Close", or "Volume"
+        :param day_index: the index of the day
+        :param columns: the columns of the tickers
+        :return: the price of each ticker, NaN where it has no bar on or before the day
+        """
+        columns = np.asarray(columns, dtype=np.int64)
+        prices = self.bars[FIELD_INDEX[field], day_index, columns]
+        # walk back over missing bars, but not past a ticker's first bar
+        missing = np.isnan(prices) & (self.first_index[columns] < day_index)
+        day = day_index
+        while missing.any():
+            day -= 1
+            prices[missing] = self.bars[FIELD_INDEX[field], day, columns[missing]]
+            missing &= np.isnan(prices) & (self.first_index[columns] < day)
+        return prices
+
+    def fingerprint(self, day_count: Optional[int] = None) -> str:
+        """
+        A hash of the trading days, tickers, and bars of the first `day_count` days, e.g. to
+        tell whether cached results computed from these prices are still valid. Prices that
+        only differ after `day_count` days have the same fingerprint.
+        :param day_count: the number of days to hash (defaults to every day)
+        :return: a hex digest
+        """
+        if day_count is None:
+            day_count = len(self.trading_days)
+        fingerprint = self._fingerprints.get(day_count)
+        if fingerprint is None:
+            digest = hashlib.sha256()
+            digest.update(self.trading_days[:day_count].asi8.tobytes())
+            digest.update("\0".join(self.tickers).encode())
+            digest.update(np.ascontiguousarray(self.bars[:, :day_count]).tobytes())
+            fingerprint = self._fingerprints[day_count] = digest.hexdigest()
+        return fingerprint
+
+    def column(self, ticker: str) -> Optional[int]:
+        return self._columns.get(ticker)
+
+    def add(self, ticker: str, data: pd.DataFrame) -> int:
+        """
+        Aligns `data` onto the trading-day axis and adds it as a new column
+        :param ticker: the ticker of `data`
+        :param data: a DataFrame indexed by date with keys "Open", "High", "Low", "Close", and "Volume"
+        :return: the column of `ticker`
+        """
+        if ticker in self._columns:
+            return self._columns[ticker]
+        aligned = data[list(PRICE_FIELDS)].reindex(self.trading_days).values.T
+        column = len(self.tickers)
+        if column == self._bars.shape[2]:
+            # Grow geometrically so adding tickers one at a time stays amortized linear
+            capacity = max(2 * column, 8)
+            bars = np.full((len(PRICE_FIELDS), self._bars.shape[1], capacity), np.nan)
+            bars[:, : len(self.trading_days), :column] = self.bars
+            first_index = np.full(capacity, len(self.trading_days), dtype=np.int64)
+            first_index[:column] = self.first_index
+            self._bars = bars
+            self._first_index = first_index
+        self._bars[:, : len(self.trading_days), column] = aligned
+        self._first_index[column] = self._first_valid_index(aligned[:, :, None])[0]
+        self.tickers.append(ticker)
+        self._columns[ticker] = column
+        self._fingerprints = dict()
+        return column
+
+    def append_day(self, day: pd.Timestamp) -> int:
+        """
+        Adds a day after the last trading day, with no bars yet
+        :param day: the new trading day
+        :return: the index of the new day
+        """
+        assert (
+            len(self.trading_days) == 0 or day > self.trading_days[-1]
+        ), "Days must be appended in order"
+        day_index = len(self.trading_days)
+        if day_index == self._bars.shape[1]:
+            # Grow geometrically so appending days one at a time stays amortized linear
+            bars = np.full(
+                (len(PRICE_FIELDS), max(2 * day_index, 8), self._bars.shape[2]), np.nan
+            )
+            bars[:, :day_index] = self._bars
+            self._bars = bars
+        else:
+            self._bars[:, day_index] = np.nan
+        self.trading_days = self.trading_days.append(pd.DatetimeIndex([day]))
+        self._fingerprints = dict()
+        # tickers without a price yet still start after the last day
+        self._first_index[self._first_index == day_index] = day_index + 1
+        for field, cached in self._returns.items():
+            cached = np.vstack([cached, np.full((1, cached.shape[1]), np.nan)])
+            cached.flags.writeable = False
+            self._returns[field] = cached
+        return day_index
+
+    def set_bars(self, day_index: int, columns: Sequence[int], bars: np.ndarray):
+        """
+        Overwrites the bars of some tickers on one day, e.g. with the latest bar of a live feed.
+        Only the returns of those tickers from that day on are recomputed.
+        :param day_index: the index of the day
+        :param columns: the columns of the tickers
+        :param bars: a (fields, len(columns)) array of the new bars
+        """
+        columns = np.asarray(columns, dtype=np.int64)
+        self._bars[:, day_index, columns] = bars
+        self._fingerprints = dict()
+        self._first_index[columns] = np.where(
+            np.isnan(bars[FIELD_INDEX["Close"]]),
+            self._first_index[columns],
+            np.minimum(self._first_index[columns], day_index),
+        )
+        day_count = len(self.trading_days)
+        for field, cached in self._returns.items():
+            cached_columns = columns[columns < cached.shape[1]]
+            if len(cached_columns) == 0:
+                continue
+            prices = self._bars[FIELD_INDEX[field], :day_count]
+            # start from the last day on which every ticker had a price, which the new returns
+            # are relative to
+            start = day_index - 1
+            while start > 0 and np.isnan(prices[start, cached_columns]).any():
+                start -= 1
+            start = max(start, 0)
+            returns = pct_change(prices[start:, cached_columns])
+            cached.flags.writeable = True
+            cached[day_index:, cached_columns] = returns[day_index - start :]
+            cached.flags.writeable = False
+
+    @staticmethod
+    def _first_valid_index(bars: np.ndarray) -> np.ndarray:
+        valid = ~np.isnan(bars[FIELD_INDEX["Close"]])
+        if valid.shape[0] == 0:
+            # with no days yet, every ticker starts after the last day
+            return np.zeros(valid.shape[1], dtype=np.int64)
+        return np.where(valid.any(axis=0), valid.argmax(axis=0), valid.shape[0])
+
+
+def pct_change(prices: np.ndarray) -> np.ndarray:
+    """
+    The percent change of every column of `prices` from its last valid price, as with pandas'
+    `pct_change`
+    :param prices: a (rows, columns) array of prices, NaN where there is no price
+    :return: an array of the same shape, NaN in the first row and where there is no price
+    """
+    valid = ~np.isnan(prices)
+    # the index of the last valid price at or before each day
+    last_valid = np.where(valid, np.arange(len(prices))[:, None], 0)
+    np.maximum.accumulate(last_valid, axis=0, out=last_valid)
+    filled = np.take_along_axis(prices, last_valid, axis=0)
+    returns = np.full(prices.shape, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        returns[1:] = prices[1:] / filled[:-1] - 1
+    return returns
@@ -1,7 +1,9 @@
 from abc import ABC, abstractmethod
 from enum import Enum, auto
-from typing import Optional
+from functools import reduce
+from typing import Optional, Sequence, Tuple
 
+import numpy as np
 import pandas as pd
 
 from data.quotedata import QuoteData
@@ -16,6 +18,10 @@ class Frequency(Enum):
     YEAR = auto()
 
 
+# The columns of every price history DataFrame, in storage order
+PRICE_FIELDS = ("Open", "High", "Low", "Close", "Volume")
+
+
 class DataSource(ABC):
     @abstractmethod
     def price_history(
@@ -47,3 +53,69 @@ class DataSource(ABC):
         :raises DataNotFoundException: if the data cannot be found
         """
         pass
+
+    def price_snapshot(
+        self, securities: Sequence[Security], field: str = "Close"
+    ) -> np.ndarray:
+        """
+        Gets the current price of many securities at once. The current trading day's price is
+        approximated as with `approx_eod_close` in `price_history`.
+        :param securities: the securities to get prices for
+        :param field: one of "Open", "High", "Low", "Close", or "Volume"
+        :return: a float64 array with the price of each security in `securities` (NaN if the
+        security has no data yet)
+        """
+        prices = np.full(len(securities), np.nan)
+        for i, security in enumerate(securities):
+            data = self.price_history(security, bar_count=1, approx_eod_close=True)
+            if len(data) > 0:
+                prices[i] = data.iloc[-1][field]
+        return prices
+
+    def pct_returns(
+        self, securities: Sequence[Security], field: str, bar_count: int
+    ) -> pd.DataFrame:
+        """
+        Gets the percent returns of many securities over the last `bar_count` bars of `field`,
+        aligned by date. Dates where any security has no return are dropped. The current trading
+        day is approximated as with `approx_eod_close` in `price_history`.
+        :param securities: the securities to get returns for
+        :param field: one of "Open", "High", "Low", "Close", or "Volume"
+        :param bar_count: the number of bars of prices (giving up to `bar_count` - 1 returns)
+        :return: a pandas DataFrame indexed by date with one column per security ticker
+        """
+        prices = [
+            self.price_history(security, bar_count=bar_count, approx_eod_close=True)[
+                field
+            ].pct_change()
+            for security in securities
+        ]
+        for price, security in zip(prices, securities):
+            price.name = security.ticker
+        past_returns = reduce(
+            lambda left, right: pd.merge(
+                left, right, left_index=True, right_index=True, how="outer"
+            ),
+            prices,
+        )
+        past_returns.dropna(inplace=True)
+        return past_returns
+
+    def pct_returns_matrix(
+        self, securities: Sequence[Security], field: str, bar_count: int
+    ) -> np.ndarray:
+        """
+        Same as `pct_returns` but returns a (days, securities) float64 array
+        """
+        return self.pct_returns(securities, field, bar_count).values
+
+    def pct_returns_dated(
+        self, securities: Sequence[Security], field: str, bar_count: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Same as `pct_returns_matrix` but also returns the date of every row
+        :return: a tuple of the (days, securities) float64 array and a datetime64 array of the
+        date of each row
+        """
+        past_returns = self.pct_returns(securities, field, bar_count)
+        return past_returns.values, past_returns.index.values
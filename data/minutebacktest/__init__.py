@@ -0,0 +1,233 @@
+from datetime import datetime
+from functools import reduce
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data import DataNotFoundException, Frequency, QuoteData
+from data.alignedprices import FIELD_INDEX, pct_change
+from data.data import PRICE_FIELDS, DataSource
+from data.pricestore import DEFAULT_MINUTE_STORE_ROOT, PriceStore
+from security import Security
+
+_NS_PER_DAY = 24 * 60 * 60 * 10**9
+
+
+class MinuteBackTestDataSource(DataSource):
+    """
+    A point-in-time view over minute bars for intraday backtesting.
+
+    Bars are served straight from the memory-mapped files of a `PriceStore`, so only the pages
+    that are actually read are loaded and a dataset can be far larger than RAM. The current
+    time is a cursor: a bar is visible once its timestamp is at or before it. Each security's
+    files are opened once, the first time it is requested. Returns are aligned once per day
+    for every set of securities queried and then served as views for every bar of that day.
+    """
+
+    def __init__(self, curr_time: datetime, store: Optional[PriceStore] = None):
+        """
+        :param curr_time: the current time of the backtest
+        :param store: the store of minute bars (defaults to the minute store under `data_cache/`)
+        """
+        self.store = store or PriceStore(DEFAULT_MINUTE_STORE_ROOT)
+        # the memory-mapped (timestamps, bars) of each security, indexed by security id
+        self._arrays: List[Optional[Tuple[np.ndarray, np.ndarray]]] = list()
+        # the (day, minutes, returns) of the last `_day_returns` of every returns query
+        self._day_returns_cache: Dict[Tuple, Tuple[int, np.ndarray, np.ndarray]] = (
+            dict()
+        )
+        self.curr_time_ns = 0
+        self.curr_time = curr_time
+
+    @property
+    def curr_time(self) -> pd.Timestamp:
+        return pd.Timestamp(self.curr_time_ns)
+
+    @curr_time.setter
+    def curr_time(self, curr_time: datetime):
+        self.curr_time_ns = pd.Timestamp(curr_time).value
+
+    def price_history(
+        self,
+        security: Security,
+        frequency: Frequency = Frequency.MINUTE,
+        bar_count: Optional[int] = None,
+        approx_eod_close: bool = True,
+    ) -> pd.DataFrame:
+        """
+        Gets the minute bars up to the current time as a DataFrame over the memory-mapped bars
+        :param approx_eod_close: if False, exclude the current bar
+        """
+        assert (
+            frequency == Frequency.MINUTE
+        ), "Minute backtests only support minute data"
+        dates, bars = self._arrays_of(security)
+        start, end = self._window(dates, bar_count, approx_eod_close)
+        return pd.DataFrame(
+            bars[start:end],
+            index=pd.DatetimeIndex(dates[start:end].astype("datetime64[ns]")),
+            columns=list(PRICE_FIELDS),
+            copy=False,
+        )
+
+    def price_array(
+        self,
+        security: Security,
+        field: str = "Close",
+        bar_count: Optional[int] = None,
+        approx_eod_close: bool = True,
+    ) -> np.ndarray:
+        """
+        Same as `price_history` but returns a single field as a read-only view of the
+        memory-mapped bars instead of building a DataFrame
+        :param security: the security to get data for
+        :param field: one of "Open", "High", "Low", "Close", or "Volume"
+        :param bar_count: the number of minutes to fetch (if None, fetch everything)
+        :param approx_eod_close: if False, exclude the current bar
+        :return: a 1-D float64 array ending at the current time
+        """
+        dates, bars = self._arrays_of(security)
+        start, end = self._window(dates, bar_count, approx_eod_close)
+        return bars[start:end, FIELD_INDEX[field]]
+
+    def price_snapshot(
+        self, securities: Sequence[Security], field: str = "Close"
+    ) -> np.ndarray:
+        prices = np.full(len(securities), np.nan)
+        column = FIELD_INDEX[field]
+        for i, security in enumerate(securities):
+            dates, bars = self._arrays_of(security)
+            index = self._bar_index(dates)
+            if index >= 0:
+                prices[i] = bars[index, column]
+        return prices
+
+    def pct_returns(
+        self, securities: Sequence[Security], field: str, bar_count: int
+    ) -> pd.DataFrame:
+        window, times = self._returns_window(securities, field, bar_count)
+        return pd.DataFrame(
+            window,
+            index=pd.DatetimeIndex(times.astype("datetime64[ns]")),
+            columns=[security.ticker for security in securities],
+            copy=False,
+        )
+
+    def pct_returns_matrix(
+        self, securities: Sequence[Security], field: str, bar_count: int
+    ) -> np.ndarray:
+        window, _ = self._returns_window(securities, field, bar_count)
+        return window
+
+    def pct_returns_dated(
+        self, securities: Sequence[Security], field: str, bar_count: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        window, times = self._returns_window(securities, field, bar_count)
+        return window, times.astype("datetime64[ns]")
+
+    def bar_times(self, security: Security) -> np.ndarray:
+        """
+        :return: the memory-mapped int64 nanosecond timestamps of every bar of `security`
+        """
+        dates, _ = self._arrays_of(security)
+        return dates
+
+    def quote(self, security: Security) -> QuoteData:
+        raise DataNotFoundException
+
+    def _arrays_of(self, security: Security) -> Tuple[np.ndarray, np.ndarray]:
+        if security.id >= len(self._arrays):
+            self._arrays.extend([None] * (security.id + 1 - len(self._arrays)))
+        arrays = self._arrays[security.id]
+        if arrays is None:
+            if not self.store.has(security.ticker):
+                raise DataNotFoundException(
+                    f"No minute data found for {security.ticker}"
+                )
+            arrays = self.store.read_arrays(security.ticker)
+            self._arrays[security.id] = arrays
+        return arrays
+
+    def _returns_window(
+        self, securities: Sequence[Security], field: str, bar_count: Optional[int]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: a tuple of the returns of `securities` over their last `bar_count` bars,
+        aligned on the minutes they all traded in, and the int64 nanosecond timestamp of each
+        row. Served from the aligned returns of the current day (see `_day_returns`).
+        """
+        arrays = [self._arrays_of(security) for security in securities]
+        day = self.curr_time_ns // _NS_PER_DAY
+        key = (tuple(security.id for security in securities), field, bar_count)
+        cached = self._day_returns_cache.get(key)
+        if cached is None or cached[0] != day:
+            cached = self._day_returns_cache[key] = (
+                day,
+                *self._day_returns(arrays, field, bar_count, day),
+            )
+        _, times, returns = cached
+
+        # the first minute within the window of every security
+        start_time = -1
+        for dates, _ in arrays:
+            end = self._bar_index(dates) + 1
+            if end == 0:
+                return returns[:0], times[:0]
+            start = 0 if bar_count is None else max(end - bar_count, 0)
+            start_time = max(start_time, int(dates[start]))
+        # row i is the return from minute i to minute i + 1, so both must be in the window
+        first = int(times.searchsorted(start_time, side="left"))
+        last = int(times.searchsorted(self.curr_time_ns, side="right")) - 1
+        window = returns[first : max(last, first)]
+        row_times = times[first + 1 : max(last, first) + 1]
+        valid = ~np.isnan(window).any(axis=1)
+        if not valid.all():
+            window = window[valid]
+            row_times = row_times[valid]
+        return window, row_times
+
+    def _day_returns(
+        self,
+        arrays: List[Tuple[np.ndarray, np.ndarray]],
+        field: str,
+        bar_count: Optional[int],
+        day: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Aligns the bars of every security over a whole day, plus the `bar_count` bars before
+        it that windows during the day can reach back to, on the minutes they all traded in
+        :return: a tuple of the aligned minutes and the returns between consecutive minutes
+        """
+        day_start = day * _NS_PER_DAY
+        ranges = list()
+        for dates, _ in arrays:
+            first_today = int(dates.searchsorted(day_start, side="left"))
+            start = 0 if bar_count is None else max(first_today - bar_count, 0)
+            end = int(dates.searchsorted(day_start + _NS_PER_DAY, side="left"))
+            ranges.append((start, end))
+        times = reduce(
+            np.intersect1d,
+            (dates[start:end] for (dates, _), (start, end) in zip(arrays, ranges)),
+        )
+        prices = np.empty((len(times), len(arrays)))
+        column = FIELD_INDEX[field]
+        for i, ((dates, bars), (start, end)) in enumerate(zip(arrays, ranges)):
+            rows = start + dates[start:end].searchsorted(times)
+            prices[:, i] = bars[rows, column]
+        return times, pct_change(prices)[1:]
+
+    def _bar_index(self, dates: np.ndarray) -> int:
+        """
+        :return: the index of the last bar at or before the current time (-1 if there is none)
+        """
+        return int(dates.searchsorted(self.curr_time_ns, side="right")) - 1
+
+    def _window(
+        self, dates: np.ndarray, bar_count: Optional[int], approx_eod_close: bool
+    ) -> Tuple[int, int]:
+        end = self._bar_index(dates) + 1
+        if not approx_eod_close and end > 0 and dates[end - 1] == self.curr_time_ns:
+            end -= 1
+        start = 0 if bar_count is None else max(end - bar_count, 0)
+        return start, end
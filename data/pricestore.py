@@ -0,0 +1,173 @@
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data.data import PRICE_FIELDS
+
+DEFAULT_STORE_ROOT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data_cache", "prices"
+)
+
+# Minute bars are stored separately so they never mix with daily bars of the same ticker
+DEFAULT_MINUTE_STORE_ROOT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "data_cache",
+    "minute_prices",
+)
+
+_DATES_FILE = "dates.i8"
+_BARS_FILE = "bars.f8"
+_METADATA_FILE = "metadata.json"
+
+
+class PriceStore:
+    """
+    A persistent on-disk store of price bars keyed by ticker.
+
+    Each ticker gets its own directory holding two raw, append-only binary files: the bar
+    timestamps as int64 nanoseconds and the bars themselves as a row-major float64 matrix with
+    one column per entry in `PRICE_FIELDS`. A small JSON metadata file records the number of
+    committed rows and when the ticker was last refreshed. Reads are memory-mapped, so
+    opening a ticker costs a file open rather than a parse.
+    """
+
+    def __init__(self, root: str = DEFAULT_STORE_ROOT):
+        self.root = root
+
+    def has(self, ticker: str) -> bool:
+        return self._metadata(ticker) is not None
+
+    def row_count(self, ticker: str) -> int:
+        metadata = self._metadata(ticker)
+        return 0 if metadata is None else metadata["rows"]
+
+    def last_date(self, ticker: str) -> Optional[pd.Timestamp]:
+        dates, _ = self.read_arrays(ticker)
+        if len(dates) == 0:
+            return None
+        return pd.Timestamp(int(dates[-1]))
+
+    def last_refresh(self, ticker: str) -> Optional[datetime]:
+        metadata = self._metadata(ticker)
+        if metadata is None:
+            return None
+        return datetime.fromisoformat(metadata["lastRefresh"])
+
+    def read_arrays(self, ticker: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Memory-maps the stored bars of `ticker`
+        :param ticker: the ticker to read
+        :return: a tuple of (int64 nanosecond timestamps, float64 bars of shape (rows, fields)).
+        Both arrays are read-only and empty if nothing is stored.
+        """
+        metadata = self._metadata(ticker)
+        if metadata is None or metadata["rows"] == 0:
+            return np.empty(0, dtype=np.int64), np.empty((0, len(PRICE_FIELDS)))
+        location = metadata["cacheLocation"]
+        rows = metadata["rows"]
+        dates = np.memmap(
+            os.path.join(location, _DATES_FILE), dtype=np.int64, mode="r", shape=(rows,)
+        )
+        bars = np.memmap(
+            os.path.join(location, _BARS_FILE),
+            dtype=np.float64,
+            mode="r",
+            shape=(rows, len(PRICE_FIELDS)),
+        )
+        return dates, bars
+
+    def read(self, ticker: str) -> pd.DataFrame:
+        """
+        Reads the stored bars of `ticker` into a DataFrame indexed by timestamp
+        :param ticker: the ticker to read
+        :return: a pandas DataFrame with keys "Open", "High", "Low", "Close", and "Volume"
+        """
+        dates, bars = self.read_arrays(ticker)
+        return pd.DataFrame(
+            np.array(bars),
+            index=pd.DatetimeIndex(np.array(dates).astype("datetime64[ns]")),
+            columns=list(PRICE_FIELDS),
+        )
+
+    def write(self, ticker: str, data: pd.DataFrame):
+        """
+        Replaces everything stored for `ticker` with `data`
+        """
+        location = self._location(ticker)
+        if os.path.isdir(location):
+            shutil.rmtree(location)
+        os.makedirs(location)
+        self._write_metadata(ticker, 0)
+        self.append(ticker, data)
+
+    def append(self, ticker: str, data: pd.DataFrame):
+        """
+        Appends the bars in `data` that come after the last stored bar of `ticker`
+        and marks the ticker as refreshed
+        """
+        last_date = self.last_date(ticker)
+        if last_date is not None:
+            data = data[data.index > last_date]
+        rows = self.row_count(ticker)
+        location = self._location(ticker)
+        os.makedirs(location, exist_ok=True)
+        if len(data) > 0:
+            dates = data.index.values.astype("datetime64[ns]").view(np.int64)
+            bars = np.ascontiguousarray(
+                data[list(PRICE_FIELDS)].values, dtype=np.float64
+            )
+            # Data files are sized by the metadata row count, so a write that was
+            # interrupted before the metadata update is simply overwritten next time
+            self._write_rows(os.path.join(location, _DATES_FILE), dates, rows)
+            self._write_rows(os.path.join(location, _BARS_FILE), bars, rows)
+            rows += len(data)
+        self._write_metadata(ticker, rows)
+
+    def truncate(self, ticker: str, rows: int):
+        """
+        Drops every stored bar of `ticker` after the first `rows`
+        """
+        if rows < self.row_count(ticker):
+            self._write_metadata(ticker, rows)
+
+    def touch(self, ticker: str):
+        """
+        Marks `ticker` as refreshed without changing its bars
+        """
+        self._write_metadata(ticker, self.row_count(ticker))
+
+    def _location(self, ticker: str) -> str:
+        return os.path.join(self.root, ticker)
+
+    def _metadata(self, ticker: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self._location(ticker), _METADATA_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_metadata(self, ticker: str, rows: int):
+        location = self._location(ticker)
+        metadata = {
+            "cacheLocation": location,
+            "rows": rows,
+            "columns": list(PRICE_FIELDS),
+            "lastRefresh": datetime.now().isoformat(),
+        }
+        tmp_path = os.path.join(location, _METADATA_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(metadata, f)
+        os.replace(tmp_path, os.path.join(location, _METADATA_FILE))
+
+    @staticmethod
+    def _write_rows(path: str, values: np.ndarray, offset_rows: int):
+        row_bytes = values.itemsize * int(np.prod(values.shape[1:], dtype=np.int64))
+        with open(path, "ab") as f:
+            f.truncate(offset_rows * row_bytes)
+            f.seek(offset_rows * row_bytes)
+            f.write(values.tobytes())
@@ -0,0 +1,274 @@
+import asyncio
+from datetime import datetime, time
+from typing import AsyncIterator, Dict, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data.alignedprices import FIELD_INDEX, AlignedPrices
+from data.data import PRICE_FIELDS
+from data.yahoobacktest import YahooBackTestDataSource
+from data.yahoolive import YahooLiveDataSource
+from security import Equity
+
+# The kinds of feed events, in the order they occur on every trading day
+OPEN = 0  # the market opened and `bars` are the opening bars
+TICK = 1  # `bars` are the bars of the current day so far
+BEFORE_CLOSE = 2  # the market is about to close, so it's time to trade
+CLOSE = 3  # the market closed and `bars` are the final bars of the day
+
+# at open, the current day's high, low, and close are the open
+_OPEN_PRICE_FIELDS = [FIELD_INDEX["High"], FIELD_INDEX["Low"], FIELD_INDEX["Close"]]
+
+
+class FeedEvent(NamedTuple):
+    """
+    An event of a live feed. `bars` is a (fields, tickers) array with fields ordered as in
+    `PRICE_FIELDS` and one column per ticker of `tickers`.
+    """
+
+    kind: int
+    time: pd.Timestamp
+    tickers: Sequence[str] = ()
+    bars: Optional[np.ndarray] = None
+
+
+class StreamingDataSource(YahooBackTestDataSource):
+    """
+    A data source whose history grows as bars stream in from a feed.
+
+    The prices are held in memory as `AlignedPrices`: every trading day is appended to the
+    trading-day axis when it starts and the bars of the current day are overwritten in place
+    as ticks arrive, which only recomputes the returns of the current day. Queries behave as
+    in a backtest with the cursor on the current day, so strategies (and the incremental
+    `WindowMatcher`) run unchanged.
+    """
+
+    def __init__(self, prices: AlignedPrices):
+        """
+        :param prices: the price history up to the last completed trading day (may be empty)
+        """
+        trading_days = prices.trading_days
+        super().__init__(
+            trading_days[-1] if len(trading_days) > 0 else datetime.min, prices
+        )
+        # without any history there is no current day until `start_day`
+        self.curr_index = len(trading_days) - 1
+        self._update_columns: Dict[Tuple[str, ...], np.ndarray] = dict()
+
+    def start_day(self, day: datetime):
+        """
+        Moves the cursor to `day`, appending it to the trading days if it's new
+        """
+        day = pd.Timestamp(day).normalize()
+        trading_days = self.prices.trading_days
+        if len(trading_days) == 0 or day > trading_days[-1]:
+            self.prices.append_day(day)
+        else:
+            assert day == trading_days[-1], "Days must stream in order"
+        self.curr_index = len(self.prices.trading_days) - 1
+
+    def update(self, tickers: Sequence[str], bars: np.ndarray):
+        """
+        Overwrites the current day's bars of `tickers`
+        :param tickers: the tickers of the columns of `bars`
+        :param bars: a (fields, tickers) array of bars, with fields ordered as in `PRICE_FIELDS`
+        """
+        key = tuple(tickers)
+        columns = self._update_columns.get(key)
+        if columns is None:
+            columns = self._update_columns[key] = np.array(
+                [self._stream_column(ticker) for ticker in tickers], dtype=np.int64
+            )
+        self.prices.set_bars(self.curr_index, columns, bars)
+
+    def _stream_column(self, ticker: str) -> int:
+        column = self.prices.column(ticker)
+        if column is None:
+            # a ticker without history starts with this feed
+            column = self.prices.add(ticker, pd.DataFrame(columns=list(PRICE_FIELDS)))
+        return column
+
+
+class ReplayFeed:
+    """
+    Streams historical bars as live feed events, so a live runner can be tested offline.
+
+    Every trading day yields an `OPEN` event with the opening bars, `ticks_per_day` `TICK`
+    events moving the close from the open to the real close, a last `TICK` with the real bars,
+    then `BEFORE_CLOSE` and `CLOSE`. With no intermediate ticks, a live runner sees the same
+    prices as `run_open_close`.
+    """
+
+    def __init__(
+        self,
+        prices: AlignedPrices,
+        start_date: datetime,
+        end_date: datetime,
+        tickers: Optional[Sequence[str]] = None,
+        ticks_per_day: int = 0,
+        delay: float = 0.0,
+    ):
+        """
+        :param prices: the bars to replay
+        :param start_date: the first day to replay
+        :param end_date: the last day to replay
+        :param tickers: the tickers to replay (defaults to every ticker of `prices`)
+        :param ticks_per_day: the number of intermediate ticks of every day
+        :param delay: the number of seconds to wait between days
+        """
+        self.prices = prices
+        trading_days = prices.trading_days
+        self.start_index = int(trading_days.searchsorted(start_date, side="left"))
+        self.end_index = max(
+            int(trading_days.searchsorted(end_date, side="right")), self.start_index
+        )
+        self.tickers = list(prices.tickers if tickers is None else tickers)
+        self._columns = np.array(
+            [prices.column(ticker) for ticker in self.tickers], dtype=np.int64
+        )
+        self.ticks_per_day = ticks_per_day
+        self.delay = delay
+
+    def history(self) -> AlignedPrices:
+        """
+        :return: a copy of the prices before the first replayed day, to start a
+        `StreamingDataSource` from
+        """
+        return AlignedPrices(
+            self.prices.trading_days[: self.start_index],
+            self.prices.bars[:, : self.start_index].copy(),
+            list(self.prices.tickers),
+        )
+
+    def __aiter__(self) -> AsyncIterator[FeedEvent]:
+        return self._events()
+
+    async def _events(self) -> AsyncIterator[FeedEvent]:
+        trading_days = self.prices.trading_days
+        for day_index in range(self.start_index, self.end_index):
+            day = trading_days[day_index]
+            bars = self.prices.bars[:, day_index, self._columns]
+            opening = bars.copy()
+            opening[_OPEN_PRICE_FIELDS] = bars[FIELD_INDEX["Open"]]
+            opening[FIELD_INDEX["Volume"]] = 0
+            yield FeedEvent(
+                OPEN, day + pd.Timedelta(hours=9, minutes=30), self.tickers, opening
+            )
+            for tick in range(1, self.ticks_per_day + 1):
+                fraction = tick / (self.ticks_per_day + 1)
+                yield FeedEvent(
+                    TICK,
+                    day + pd.Timedelta(hours=9, minutes=30 + 390 * fraction),
+                    self.tickers,
+                    _partial_bar(bars, fraction),
+                )
+            yield FeedEvent(
+                TICK, day + pd.Timedelta(hours=15, minutes=50), self.tickers, bars
+            )
+            yield FeedEvent(BEFORE_CLOSE, day + pd.Timedelta(hours=15, minutes=50))
+            yield FeedEvent(CLOSE, day + pd.Timedelta(hours=16), self.tickers, bars)
+            # let other tasks run between days
+            await asyncio.sleep(self.delay)
+
+
+class YahooQuoteFeed:
+    """
+    Streams the current day's bars from Yahoo finance quotes, polled every `interval` seconds
+    during the session. Times are in the exchange's time zone. Every weekday is treated as a
+    trading day; on holidays the quotes simply don't move. The price history is refreshed with
+    the first event of every day and only the quotes are fetched on the events after it.
+    """
+
+    def __init__(
+        self,
+        tickers: Sequence[str],
+        data_source: Optional[YahooLiveDataSource] = None,
+        interval: float = 60.0,
+        market_open: time = time(9, 30),
+        before_close: time = time(15, 50),
+        market_close: time = time(16, 0),
+        timezone: str = "America/New_York",
+    ):
+        """
+        :param tickers: the tickers to stream
+        :param data_source: the live data source to fetch quotes with
+        :param interval: the number of seconds between ticks
+        :param market_open: the time of the `OPEN` event
+        :param before_close: the time of the `BEFORE_CLOSE` event
+        :param market_close: the time of the `CLOSE` event
+        :param timezone: the time zone of the exchange
+        """
+        self.tickers = list(tickers)
+        self.securities = [Equity(ticker) for ticker in self.tickers]
+        self.data_source = data_source or YahooLiveDataSource()
+        self.interval = interval
+        self.market_open = market_open
+        self.before_close = before_close
+        self.market_close = market_close
+        self.timezone = timezone
+        # the day the price history was last refreshed on
+        self._history_day: Optional[pd.Timestamp] = None
+
+    def __aiter__(self) -> AsyncIterator[FeedEvent]:
+        return self._events()
+
+    async def _events(self) -> AsyncIterator[FeedEvent]:
+        while True:
+            now = pd.Timestamp.now(tz=self.timezone)
+            day = now.normalize()
+            if day.weekday() >= 5 or now.time() >= self.market_close:
+                await self._sleep_until(day + pd.Timedelta(days=1))
+                continue
+            await self._sleep_until(self._at(day, self.market_open))
+            yield await self._event(OPEN)
+            close_time = self._at(day, self.before_close)
+            while (
+                pd.Timestamp.now(tz=self.timezone) + pd.Timedelta(seconds=self.interval)
+                < close_time
+            ):
+                await asyncio.sleep(self.interval)
+                yield await self._event(TICK)
+            await self._sleep_until(close_time)
+            yield await self._event(TICK)
+            yield FeedEvent(BEFORE_CLOSE, self._now())
+            await self._sleep_until(self._at(day, self.market_close))
+            yield await self._event(CLOSE)
+
+    async def _event(self, kind: int) -> FeedEvent:
+        now = self._now()
+        if now.normalize() != self._history_day:
+            await self.data_source.fetch(self.securities)
+            self._history_day = now.normalize()
+        else:
+            await self.data_source.fetch_quotes(self.securities)
+        return FeedEvent(
+            kind,
+            now,
+            self.tickers,
+            self.data_source.current_bars(self.securities),
+        )
+
+    def _now(self) -> pd.Timestamp:
+        # feed times are naive exchange times, like the trading days of the prices
+        return pd.Timestamp.now(tz=self.timezone).tz_localize(None)
+
+    def _at(self, day: pd.Timestamp, at: time) -> pd.Timestamp:
+        return day + pd.Timedelta(hours=at.hour, minutes=at.minute, seconds=at.second)
+
+    async def _sleep_until(self, when: pd.Timestamp):
+        delay = (when - pd.Timestamp.now(tz=self.timezone)).total_seconds()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _partial_bar(bars: np.ndarray, fraction: float) -> np.ndarray:
+    # the close moves linearly from the open towards the real close, within the real range
+    partial = bars.copy()
+    opening = bars[FIELD_INDEX["Open"]]
+    close = opening + (bars[FIELD_INDEX["Close"]] - opening) * fraction
+    partial[FIELD_INDEX["Close"]] = close
+    partial[FIELD_INDEX["High"]] = np.maximum(opening, close)
+    partial[FIELD_INDEX["Low"]] = np.minimum(opening, close)
+    partial[FIELD_INDEX["Volume"]] = bars[FIELD_INDEX["Volume"]] * fraction
+    return partial
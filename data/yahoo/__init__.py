@@ -1,31 +1,239 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Protocol
 
+import numpy as np
 import pandas as pd
 import yfinance as yf
 
 from data import DataNotFoundException, Frequency, QuoteData
-from data.data import DataSource
+from data.data import PRICE_FIELDS, DataSource
+from data.pricestore import DEFAULT_MINUTE_STORE_ROOT, PriceStore
 from security import Security, SecurityType
 
 _cache = dict()
+_store = PriceStore()
+_minute_store = PriceStore(DEFAULT_MINUTE_STORE_ROOT)
 
+# yfinance collects the frames of a download in module globals, so concurrent downloads would
+# clobber each other's results. A single download still fetches its symbols concurrently.
+_download_lock = threading.Lock()
 
-def preload_symbols(symbols: List[str]):
+
+class Fetcher(Protocol):
+    def __call__(
+        self, symbols: List[str], start: Optional[datetime] = None
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Downloads the bars of many symbols
+        :param symbols: the tickers to download
+        :param start: the first date to download (if None, download everything)
+        :return: the bars of every symbol that has any, keyed by symbol
+        """
+        ...
+
+
+def preload_symbols(symbols: List[str], store: Optional[PriceStore] = None):
+    """
+    Brings the local price store up to date for `symbols` and loads them into memory.
+    Only the bars after the last stored bar of each symbol are downloaded.
+    :param symbols: tickers to load
+    :param store: the price store to use (defaults to the store under `data_cache/`)
+    """
+    store = store or _store
+    symbols = list(map(lambda x: x.replace(".", "-"), symbols))
+    _refresh_store(symbols, store)
+    for symbol in symbols:
+        if store.has(symbol):
+            _cache[symbol] = (store.read(symbol), datetime.now())
+
+
+def preload_minute_symbols(symbols: List[str], store: Optional[PriceStore] = None):
+    """
+    Appends the latest minute bars of `symbols` to the local minute price store. Yahoo only
+    serves the last 7 days of minute bars, so calling this regularly accumulates a longer
+    history on disk for `MinuteBackTestDataSource`.
+    :param symbols: tickers to load
+    :param store: the price store to use (defaults to the minute store under `data_cache/`)
+    """
+    store = store or _minute_store
     symbols = list(map(lambda x: x.replace(".", "-"), symbols))
-    data = yf.download(symbols, auto_adjust=True, progress=True, threads=True)
+    with _download_lock:
+        data = yf.download(
+            symbols,
+            period="7d",
+            interval="1m",
+            auto_adjust=True,
+            progress=True,
+            threads=True,
+        )
+    if data.index.tz is not None:
+        # keep exchange local time so every session falls within one calendar day
+        data.index = data.index.tz_localize(None)
+    data.sort_index(inplace=True)
+    for symbol, frame in _split_frames(data, symbols).items():
+        store.append(symbol, frame)
+
+
+def _download(
+    symbols: List[str], start: Optional[datetime] = None
+) -> Dict[str, pd.DataFrame]:
+    with _download_lock:
+        data = yf.download(
+            symbols, start=start, auto_adjust=True, progress=True, threads=True
+        )
     data.sort_index(inplace=True, na_position="first")
+    return _split_frames(data, symbols)
+
+
+def _split_frames(data: pd.DataFrame, symbols: List[str]) -> Dict[str, pd.DataFrame]:
+    """
+    Splits the result of `yf.download` into the bars of each symbol
+    :param data: the downloaded bars, with (field, symbol) columns if there are many symbols
+    :param symbols: the downloaded tickers
+    :return: the bars of every symbol that has any, keyed by symbol
+    """
     if isinstance(data.columns, pd.MultiIndex):
         data = data.reorder_levels([1, 0], axis=1)
-        for symbol in symbols:
-            _cache[symbol] = (data[symbol], datetime.now())
+        frames = {symbol: data[symbol] for symbol in symbols}
     else:
-        _cache[symbols[0]] = (data, datetime.now())
+        frames = {symbols[0]: data}
+    frames = {
+        symbol: frame[list(PRICE_FIELDS)].dropna(how="all")
+        for symbol, frame in frames.items()
+    }
+    return {symbol: frame for symbol, frame in frames.items() if len(frame) > 0}
+
+
+def _refresh_store(
+    symbols: List[str], store: PriceStore, download: Fetcher = _download
+):
+    stale = [
+        symbol
+        for symbol in symbols
+        if not store.has(symbol)
+        or not YahooDataSource._fresh_cache(store.last_refresh(symbol))
+    ]
+    # Symbols with fewer than two stored bars are cheaper to just download in full
+    missing = [symbol for symbol in stale if store.row_count(symbol) < 2]
+    existing = [symbol for symbol in stale if store.row_count(symbol) >= 2]
+
+    if missing:
+        for symbol, data in download(missing).items():
+            store.write(symbol, data)
+
+    if existing:
+        # Re-download from the second to last stored bar. The last stored bar may have been
+        # a partial intraday bar, and the bar before it tells us if Yahoo has re-adjusted
+        # the history for a split or dividend since we stored it.
+        anchors = dict()
+        for symbol in existing:
+            dates, bars = store.read_arrays(symbol)
+            anchors[symbol] = (
+                pd.Timestamp(int(dates[-2])),
+                float(bars[-2, PRICE_FIELDS.index("Close")]),
+            )
+        start = min(anchor_date for anchor_date, _ in anchors.values())
+        frames = download(existing, start=start)
+        readjusted = list()
+        for symbol in existing:
+            data = frames.get(symbol)
+            anchor_date, anchor_close = anchors[symbol]
+            if data is None or anchor_date not in data.index:
+                store.touch(symbol)
+                continue
+            if not np.isclose(data.loc[anchor_date, "Close"], anchor_close, rtol=1e-6):
+                readjusted.append(symbol)
+                continue
+            store.truncate(symbol, store.row_count(symbol) - 1)
+            store.append(symbol, data)
+        if readjusted:
+            for symbol, data in download(readjusted).items():
+                store.write(symbol, data)
+
+
+def preload_universe(
+    symbols: List[str],
+    chunk_size: int = 50,
+    max_workers: int = 4,
+    retries: int = 3,
+    backoff: float = 1.0,
+    fetcher: Optional[Fetcher] = None,
+    store: Optional[PriceStore] = None,
+    log: bool = True,
+) -> List[str]:
+    """
+    Brings the local price store up to date for a large universe of symbols. The universe is
+    split into chunks that are refreshed concurrently and retried with exponential backoff.
+    Yahoo downloads themselves run one at a time (see `_download_lock`), so the concurrency
+    overlaps one chunk's download with the store reads and writes of the others. Each chunk is
+    written to the store as soon as it completes, so an interrupted run resumes where it left
+    off: symbols refreshed today are skipped. Any `Fetcher` can stand in for Yahoo, e.g.
+    `benchmarks.synthetic.SyntheticFetcher` to run offline.
+    :param symbols: tickers to load
+    :param chunk_size: the number of symbols per download
+    :param max_workers: the maximum number of chunks refreshed concurrently
+    :param retries: the number of times to retry a failed chunk
+    :param backoff: the delay in seconds before the first retry, doubled on every retry
+    :param fetcher: the function that downloads the bars of a chunk (defaults to Yahoo finance)
+    :param store: the price store to use (defaults to the store under `data_cache/`)
+    :param log: whether to print progress
+    :return: the symbols that could not be loaded
+    """
+    store = store or _store
+    fetcher = fetcher or _download
+    symbols = list(map(lambda x: x.replace(".", "-"), symbols))
+    pending = [
+        symbol
+        for symbol in symbols
+        if not store.has(symbol)
+        or not YahooDataSource._fresh_cache(store.last_refresh(symbol))
+    ]
+    if log:
+        print(
+            f"{len(symbols) - len(pending)}/{len(symbols)} symbols already up to date"
+        )
+    chunks = [pending[i : i + chunk_size] for i in range(0, len(pending), chunk_size)]
+
+    def load_chunk(chunk: List[str]):
+        for attempt in range(retries + 1):
+            try:
+                _refresh_store(chunk, store, fetcher)
+                return
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                if log:
+                    print(f"Retrying chunk starting at {chunk[0]} after error: {e}")
+                time.sleep(backoff * 2**attempt)
+
+    failed = list()
+    loaded = 0
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(load_chunk, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            if future.exception() is not None:
+                failed.extend(chunk)
+            else:
+                missing = [symbol for symbol in chunk if not store.has(symbol)]
+                failed.extend(missing)
+                loaded += len(chunk) - len(missing)
+            if log:
+                elapsed = time.time() - start_time
+                print(
+                    f"Loaded {loaded}/{len(pending)} symbols "
+                    f"({loaded / max(elapsed, 1e-9):.1f} symbols/s, {len(failed)} failed)"
+                )
+    return failed
 
 
 class YahooDataSource(DataSource):
-    def __init__(self):
-        pass
+    def __init__(self, store: Optional[PriceStore] = None):
+        self._store = store or _store
 
     def price_history(
         self,
@@ -55,21 +263,17 @@ class YahooDataSource(DataSource):
                 del _cache[security.ticker]
         # if no cached data is found or if data is stale
         if data is None:
-            # download from Yahoo finance
-            print(f"Downloading data for {security.ticker}")
-            data = yf.download(security.ticker, auto_adjust=True, progress=True)
-            data.sort_index(inplace=True, na_position="first")
+            # bring the local store up to date and read from it
+            _refresh_store([security.ticker], self._store)
+            if not self._store.has(security.ticker):
+                raise DataNotFoundException(f"No data found for {security.ticker}")
+            data = self._store.read(security.ticker)
             _cache[security.ticker] = (data, datetime.now())
         return data.iloc[-bar_count:]
 
     def quote(self, security: Security) -> QuoteData:
         raise DataNotFoundException("Quote data not available on Yahoo finance")
 
-    @staticmethod
-    def _load_from_metadata(metadata) -> pd.DataFrame:
-        cache_loc = metadata["cacheLocation"]
-        return pd.read_csv(cache_loc)
-
     @staticmethod
     def _fresh_cache(last_refresh: datetime) -> bool:
         return datetime.today().date() == last_refresh.date()
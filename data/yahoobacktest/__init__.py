@@ -1,20 +1,72 @@
-from datetime import datetime, timedelta
-from typing import List, Optional
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
 
+import numpy as np
 import pandas as pd
 
 from data import DataNotFoundException, Frequency, QuoteData
-from data.data import DataSource
+from data.alignedprices import FIELD_INDEX, AlignedPrices
+from data.data import PRICE_FIELDS, DataSource
 from data.yahoo import YahooDataSource
-from security import Security
+from security import Equity, Security
+
+# at open, the current day's high, low, and close are approximated by its open
+_OPEN_PRICE_FIELDS = [FIELD_INDEX["High"], FIELD_INDEX["Low"], FIELD_INDEX["Close"]]
+
+
+def load_aligned_prices(symbols: List[str], benchmark: str = "SPY") -> AlignedPrices:
+    """
+    Loads `symbols` and `benchmark` from Yahoo and aligns them onto the trading days of SPY.
+    Useful to prepare prices once and share them between many backtests. Columns are added in
+    the order of `symbols`, so loading `universe.symbols` lays a `Universe` out contiguously
+    in universe order and its returns are served as views.
+    :param symbols: tickers to load
+    :param benchmark: the benchmark ticker of the backtests
+    :return: the aligned prices
+    """
+    data_source = YahooDataSource()
+    prices = AlignedPrices(data_source.price_history(Equity("SPY")).index)
+    for ticker in [benchmark] + list(symbols):
+        prices.add(ticker, data_source.price_history(Equity(ticker)))
+    return prices
 
 
 class YahooBackTestDataSource(DataSource):
-    def __init__(self, curr_date: datetime):
+    """
+    A point-in-time view over Yahoo price history for backtesting.
+
+    Every security is aligned onto one shared trading-day axis (see `AlignedPrices`) the first
+    time it is requested, and the current day is an integer cursor into that axis. Windows of
+    history are returned as views of the aligned arrays rather than as date-sliced copies.
+    """
+
+    def __init__(self, curr_date: datetime, prices: Optional[AlignedPrices] = None):
+        """
+        :param curr_date: the current day of the backtest
+        :param prices: the aligned prices to serve (if None, the trading days of SPY are used
+        as the axis and securities are loaded from Yahoo as they are requested)
+        """
         self.data_source = YahooDataSource()
+        if prices is None:
+            prices = AlignedPrices(self.data_source.price_history(Equity("SPY")).index)
+        self.prices = prices
+        # the column of each security id in `prices`, or -1 if it hasn't been requested yet
+        self._column_by_id = np.full(0, -1, dtype=np.int64)
+        self.curr_index = 0
         self.curr_date = curr_date
         self.is_open = False
 
+    @property
+    def curr_date(self) -> datetime:
+        return self.prices.trading_days[self.curr_index]
+
+    @curr_date.setter
+    def curr_date(self, curr_date: datetime):
+        # the cursor points at the last trading day on or before `curr_date`
+        self.curr_index = max(
+            int(self.prices.trading_days.searchsorted(curr_date, side="right")) - 1, 0
+        )
+
     def price_history(
         self,
         security: Security,
@@ -23,20 +75,174 @@ class YahooBackTestDataSource(DataSource):
         approx_eod_close: bool = True,
     ) -> pd.DataFrame:
         assert frequency == Frequency.DAY, "Yahoo only supports daily data"
-        data = self.data_source.price_history(security, frequency)
-        data.sort_index(inplace=True, na_position="first")
-        end_date = self.curr_date
-        if not approx_eod_close:
-            end_date -= timedelta(1)
-        else:
-            if self.is_open:
-                # if we're at open, then set the close, high, and low to the open price
-                print("Making copy")
-                data = data.copy()
-                open_price = data[self.curr_date]["Open"]
-                data[self.curr_date][["Close", "High", "Low"]] = open_price
-                data[self.curr_date]["Volume"] = 0
-        return data[: self.curr_date][-bar_count:]
+        column = self._column(security)
+        start, end = self._window(column, bar_count, approx_eod_close)
+        window = self.prices.bars[:, start:end, column].T
+        if approx_eod_close and self.is_open and end > start:
+            # if we're at open, then set the close, high, and low to the open price
+            window = window.copy()
+            window[-1, _OPEN_PRICE_FIELDS] = window[-1, FIELD_INDEX["Open"]]
+            window[-1, FIELD_INDEX["Volume"]] = 0
+        return pd.DataFrame(
+            window,
+            index=self.prices.trading_days[start:end],
+            columns=list(PRICE_FIELDS),
+            copy=False,
+        )
+
+    def price_array(
+        self,
+        security: Security,
+        field: str = "Close",
+        bar_count: Optional[int] = None,
+        approx_eod_close: bool = True,
+    ) -> np.ndarray:
+        """
+        Same as `price_history` but returns a single field as a read-only view of the aligned
+        prices instead of building a DataFrame
+        :param security: the security to get data for
+        :param field: one of "Open", "High", "Low", "Close", or "Volume"
+        :param bar_count: the number of days to fetch (if None, fetch everything)
+        :param approx_eod_close: if True, include the current day
+        :return: a 1-D float64 array ending at the current day
+        """
+        column = self._column(security)
+        start, end = self._window(column, bar_count, approx_eod_close)
+        if approx_eod_close and self.is_open and end > start and field != "Open":
+            window = self.prices.bars[FIELD_INDEX[field], start:end, column].copy()
+            if field == "Volume":
+                window[-1] = 0
+            else:
+                window[-1] = self.prices.bars[FIELD_INDEX["Open"], end - 1, column]
+            return window
+        window = self.prices.bars[FIELD_INDEX[field], start:end, column]
+        window.flags.writeable = False
+        return window
+
+    def price_snapshot(
+        self, securities: Sequence[Security], field: str = "Close"
+    ) -> np.ndarray:
+        columns = self._columns(securities)
+        if self.is_open and field != "Open":
+            if field == "Volume":
+                return np.zeros(len(columns))
+            field = "Open"
+        prices = self.prices.bars[FIELD_INDEX[field], self.curr_index, columns]
+        missing = np.isnan(prices)
+        if missing.any():
+            listed = missing & (self.prices.first_index[columns] <= self.curr_index)
+            if field == "Volume":
+                # nothing traded on a day without a bar
+                prices[listed] = 0
+            elif self.curr_index > 0:
+                # a security without a bar on the current day is still worth its last close
+                prices[missing] = self.prices.last_prices(
+                    "Close", self.curr_index - 1, columns[missing]
+                )
+        return prices
+
+    def pct_returns(
+        self, securities: Sequence[Security], field: str, bar_count: int
+    ) -> pd.DataFrame:
+        window, rows = self._returns_window(securities, field, bar_count)
+        return pd.DataFrame(
+            window,
+            index=self.prices.trading_days[rows],
+            columns=[security.ticker for security in securities],
+            copy=False,
+        )
+
+    def pct_returns_matrix(
+        self, securities: Sequence[Security], field: str, bar_count: int
+    ) -> np.ndarray:
+        window, _ = self._returns_window(securities, field, bar_count)
+        return window
+
+    def pct_returns_dated(
+        self, securities: Sequence[Security], field: str, bar_count: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        window, rows = self._returns_window(securities, field, bar_count)
+        return window, self.prices.trading_days.values[rows]
 
     def quote(self, security: Security) -> QuoteData:
         raise DataNotFoundException
+
+    def _column(self, security: Security) -> int:
+        if security.id < len(self._column_by_id):
+            column = int(self._column_by_id[security.id])
+            if column >= 0:
+                return column
+        column = self.prices.column(security.ticker)
+        if column is None:
+            column = self.prices.add(
+                security.ticker, self.data_source.price_history(security)
+            )
+        if security.id >= len(self._column_by_id):
+            column_by_id = np.full(
+                max(2 * len(self._column_by_id), security.id + 1), -1
+            )
+            column_by_id[: len(self._column_by_id)] = self._column_by_id
+            self._column_by_id = column_by_id
+        self._column_by_id[security.id] = column
+        return column
+
+    def _columns(self, securities: Sequence[Security]) -> np.ndarray:
+        """
+        :return: the column of every security in `securities`, looked up by dense id
+        """
+        ids = np.fromiter(
+            (security.id for security in securities),
+            dtype=np.int64,
+            count=len(securities),
+        )
+        if len(ids) > 0 and ids.max() < len(self._column_by_id):
+            columns = self._column_by_id[ids]
+            if (columns >= 0).all():
+                return columns
+        return np.array(
+            [self._column(security) for security in securities], dtype=np.int64
+        )
+
+    def _window(self, column: int, bar_count: Optional[int], approx_eod_close: bool):
+        end = self.curr_index + 1 if approx_eod_close else self.curr_index
+        start = int(self.prices.first_index[column])
+        if bar_count is not None:
+            start = max(start, end - bar_count)
+        return start, max(start, end)
+
+    def _returns_window(
+        self, securities: Sequence[Security], field: str, bar_count: int
+    ):
+        columns = self._columns(securities)
+        end = self.curr_index + 1
+        # `bar_count` prices give `bar_count` - 1 returns
+        start = 0 if bar_count is None else max(end - bar_count + 1, 0)
+        returns = self.prices.returns(field)
+        if len(columns) > 0 and (len(columns) == 1 or (np.diff(columns) == 1).all()):
+            window = returns[start:end, columns[0] : columns[0] + len(columns)]
+        else:
+            window = returns[start:end, columns]
+        if self.is_open and end > start and field != "Open":
+            # at open, the current day's price is approximated by its open
+            window = window.copy()
+            if field == "Volume":
+                window[-1] = -1
+            else:
+                # the first day has no earlier price to be relative to
+                previous = (
+                    self.prices.last_prices(field, end - 2, columns)
+                    if end >= 2
+                    else np.full(len(columns), np.nan)
+                )
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    window[-1] = (
+                        self.prices.bars[FIELD_INDEX["Open"], end - 1, columns]
+                        / previous
+                        - 1
+                    )
+        rows = np.arange(start, end)
+        valid = ~np.isnan(window).any(axis=1)
+        if not valid.all():
+            window = window[valid]
+            rows = rows[valid]
+        return window, rows
@@ -0,0 +1,305 @@
+import asyncio
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from data import DataNotFoundException, Frequency, QuoteData
+from data.data import PRICE_FIELDS, DataSource
+from data.pricestore import PriceStore
+from data.yahoo import Fetcher, YahooDataSource, _download, _refresh_store, _store
+from security import Security, SecurityType
+
+# Fetches the current quote of a symbol: its "bid" and "ask" and the "Open", "High", "Low",
+# "Close" (last price), and "Volume" of the current trading day so far
+QuoteFetcher = Callable[[str], Dict[str, float]]
+
+
+def _fetch_quote(symbol: str) -> Dict[str, float]:
+    info = yf.Ticker(symbol).info
+    return {
+        "bid": info.get("bid"),
+        "ask": info.get("ask"),
+        "Open": info.get("regularMarketOpen") or info.get("open"),
+        "High": info.get("dayHigh") or info.get("regularMarketDayHigh"),
+        "Low": info.get("dayLow") or info.get("regularMarketDayLow"),
+        "Close": info.get("regularMarketPrice") or info.get("currentPrice"),
+        "Volume": info.get("regularMarketVolume") or info.get("volume"),
+    }
+
+
+class YahooLiveDataSource(DataSource):
+    """
+    A data source for live trading that fetches the price history delta and the current quote
+    of every symbol concurrently with asyncio.
+
+    `start` schedules the requests and returns immediately; `wait` returns as soon as the data
+    of the given securities has arrived, so a strategy can be evaluated while the data of
+    other strategies is still downloading. Requests run on a pool of `max_connections` threads
+    (yfinance is blocking) and each one times out after `timeout` seconds and is retried with
+    exponential backoff. History deltas are downloaded in chunks of `chunk_size` symbols into
+    the local price store, as with `preload_symbols`. yfinance downloads can't run
+    concurrently (see `data.yahoo._download_lock`), so Yahoo history chunks are downloaded one
+    at a time, queued before their timeout starts, while quotes are fetched concurrently.
+
+    With `approx_eod_close`, the price history ends with a bar for the current day built from
+    the quote, so the last close is the current price. Symbols that were never fetched fall
+    back to the blocking `YahooDataSource`.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 16,
+        timeout: float = 10.0,
+        retries: int = 2,
+        backoff: float = 0.5,
+        chunk_size: int = 25,
+        history_fetcher: Optional[Fetcher] = None,
+        quote_fetcher: Optional[QuoteFetcher] = None,
+        store: Optional[PriceStore] = None,
+    ):
+        """
+        :param max_connections: the maximum number of requests in flight
+        :param timeout: the number of seconds before a request is abandoned
+        :param retries: the number of times to retry a failed request
+        :param backoff: the delay in seconds before the first retry, doubled on every retry
+        :param chunk_size: the number of symbols per history request
+        :param history_fetcher: the function that downloads the bars of a chunk (defaults to
+        Yahoo finance)
+        :param quote_fetcher: the function that fetches the quote of a symbol (defaults to
+        Yahoo finance)
+        :param store: the price store to use (defaults to the store under `data_cache/`)
+        """
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+        self._history_fetcher = history_fetcher or _download
+        self._quote_fetcher = quote_fetcher or _fetch_quote
+        self._store = store or _store
+        self._fallback = YahooDataSource(self._store)
+        self._executor = ThreadPoolExecutor(max_workers=max_connections)
+        self._loop = None
+        self._semaphore = None
+        self._history_semaphore = None
+        self._tasks: Dict[str, asyncio.Future] = dict()
+        self._chunk_locks: Dict[Tuple[str, ...], threading.Lock] = dict()
+        self._history: Dict[str, pd.DataFrame] = dict()
+        self._quotes: Dict[str, Tuple[Dict[str, float], datetime]] = dict()
+        self._frames: Dict[Tuple[str, bool], pd.DataFrame] = dict()
+        # the error of every symbol whose history or quote could not be fetched by its last
+        # request. A symbol with history but a quote error has a stale current bar.
+        self.errors: Dict[str, Exception] = dict()
+
+    def start(self, securities: Iterable[Security]):
+        """
+        Schedules the requests for the history delta and quote of `securities` that haven't been
+        requested yet. Must be called from a running event loop.
+        """
+        loop = self._bind_loop()
+        tickers = list(
+            dict.fromkeys(
+                security.ticker
+                for security in securities
+                if security.ticker not in self._tasks
+            )
+        )
+        for ticker in tickers:
+            self.errors.pop(ticker, None)
+        for i in range(0, len(tickers), self.chunk_size):
+            chunk = tickers[i : i + self.chunk_size]
+            history = loop.create_task(self._fetch_history(chunk))
+            for ticker in chunk:
+                quote = loop.create_task(self._fetch_quote(ticker))
+                self._tasks[ticker] = asyncio.gather(history, quote)
+
+    async def wait(self, securities: Iterable[Security]):
+        """
+        Waits until the history and quote of every security in `securities` has arrived or
+        failed, starting any requests that weren't started yet
+        """
+        securities = list(securities)
+        self.start(securities)
+        await asyncio.gather(*(self._tasks[security.ticker] for security in securities))
+
+    async def fetch(self, securities: Iterable[Security]):
+        """
+        Fetches the history and quote of `securities` again, even if they were fetched before
+        """
+        securities = list(securities)
+        for security in securities:
+            self._tasks.pop(security.ticker, None)
+        await self.wait(securities)
+
+    async def fetch_quotes(self, securities: Iterable[Security]):
+        """
+        Fetches the quote of `securities` again without refreshing their history, e.g. to poll
+        the current prices during the day
+        """
+        self._bind_loop()
+        tickers = list(dict.fromkeys(security.ticker for security in securities))
+        for ticker in tickers:
+            if ticker in self._history:
+                # a symbol without history keeps its history error until the next `fetch`
+                self.errors.pop(ticker, None)
+        await asyncio.gather(*(self._fetch_quote(ticker) for ticker in tickers))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def price_history(
+        self,
+        security: Security,
+        frequency: Frequency = Frequency.DAY,
+        bar_count: Optional[int] = None,
+        approx_eod_close: bool = True,
+    ) -> pd.DataFrame:
+        if security.type != SecurityType.EQUITY:
+            raise ValueError(
+                "Yahoo finance only support price history on Equity securities"
+            )
+        if frequency != Frequency.DAY:
+            raise ValueError("Yahoo data source only provides daily data")
+        if bar_count is not None:
+            assert bar_count > 0, "Must request a positive number of bar data"
+        else:
+            bar_count = 0
+
+        ticker = security.ticker
+        if ticker not in self._history:
+            if ticker in self.errors:
+                raise DataNotFoundException(
+                    f"No data found for {ticker}: {self.errors[ticker]!r}"
+                )
+            return self._fallback.price_history(
+                security, frequency, bar_count or None, approx_eod_close
+            )
+        key = (ticker, approx_eod_close)
+        if key not in self._frames:
+            self._frames[key] = self._with_current_bar(ticker, approx_eod_close)
+        return self._frames[key].iloc[-bar_count:]
+
+    def quote(self, security: Security) -> QuoteData:
+        if security.ticker not in self._quotes:
+            raise DataNotFoundException(f"No quote fetched for {security.ticker}")
+        values, data_time = self._quotes[security.ticker]
+        return QuoteData(
+            _to_float(values.get("bid")), _to_float(values.get("ask")), data_time
+        )
+
+    def current_bars(self, securities: Sequence[Security]) -> np.ndarray:
+        """
+        :param securities: the securities to get the current day's bar of
+        :return: a (fields, securities) array of the current day's bar so far, as fetched with
+        the last quote, with fields ordered as in `PRICE_FIELDS` (NaN if there is no quote)
+        """
+        bars = np.full((len(PRICE_FIELDS), len(securities)), np.nan)
+        for i, security in enumerate(securities):
+            bar = self._current_bar(security.ticker)
+            if bar is not None:
+                bars[:, i] = [bar[field] for field in PRICE_FIELDS]
+        return bars
+
+    def _current_bar(self, ticker: str) -> Optional[Dict[str, float]]:
+        if ticker not in self._quotes:
+            return None
+        values, _ = self._quotes[ticker]
+        bar = {field: _to_float(values.get(field)) for field in PRICE_FIELDS}
+        if np.isnan(bar["Close"]):
+            return None
+        for field in ("Open", "High", "Low"):
+            if np.isnan(bar[field]):
+                bar[field] = bar["Close"]
+        return bar
+
+    def _with_current_bar(self, ticker: str, approx_eod_close: bool) -> pd.DataFrame:
+        data = self._history[ticker]
+        today = pd.Timestamp(datetime.today().date())
+        # the store may hold a partial bar for today, which the quote replaces
+        data = data[data.index < today]
+        bar = self._current_bar(ticker) if approx_eod_close else None
+        if bar is None:
+            return data
+        return pd.concat([data, pd.DataFrame([bar], index=[today])[data.columns]])
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # requests of a previous event loop can't be awaited on this one, so start over
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+            self._history_semaphore = asyncio.Semaphore(
+                1 if self._history_fetcher is _download else self.max_connections
+            )
+            self._tasks = dict()
+        return loop
+
+    async def _request(
+        self, function: Callable, *args, slot: Optional[asyncio.Semaphore] = None
+    ):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            # acquire a connection before starting the clock, so queueing doesn't time out
+            async with slot or contextlib.nullcontext(), self._semaphore:
+                try:
+                    return await asyncio.wait_for(
+                        loop.run_in_executor(self._executor, function, *args),
+                        self.timeout,
+                    )
+                except Exception:
+                    if attempt == self.retries:
+                        raise
+            await asyncio.sleep(self.backoff * 2**attempt)
+
+    async def _fetch_history(self, chunk: List[str]):
+        try:
+            await self._request(self._refresh, chunk, slot=self._history_semaphore)
+        except Exception as e:
+            for ticker in chunk:
+                self.errors[ticker] = e
+            return
+        for ticker in chunk:
+            if self._store.has(ticker):
+                self._history[ticker] = self._store.read(ticker)
+            else:
+                self.errors[ticker] = DataNotFoundException(
+                    f"No data found for {ticker}"
+                )
+            self._invalidate(ticker)
+
+    def _refresh(self, chunk: List[str]):
+        # a request that timed out keeps running in its thread, so its retry waits for it
+        # rather than writing to the same files at the same time
+        with self._chunk_locks.setdefault(tuple(chunk), threading.Lock()):
+            _refresh_store(chunk, self._store, self._history_fetcher)
+
+    async def _fetch_quote(self, ticker: str):
+        try:
+            values = await self._request(self._quote_fetcher, ticker)
+        except Exception as e:
+            # without a fresh quote the history ends at the last stored bar or quote, so
+            # record the error to tell a stale close from a live one
+            self.errors[ticker] = e
+            return
+        self._quotes[ticker] = (values, datetime.now())
+        self._invalidate(ticker)
+
+    def _invalidate(self, ticker: str):
+        self._frames.pop((ticker, True), None)
+        self._frames.pop((ticker, False), None)
+
+
+def _to_float(value: Optional[float]) -> float:
+    return np.nan if value is None else float(value)
@@ -1,18 +1,72 @@
-from data.yahoo import YahooDataSource, preload_symbols
+import asyncio
+import sys
+from typing import List
+
+from data.stream import StreamingDataSource, YahooQuoteFeed
+from data.yahoobacktest import load_aligned_prices
+from data.yahoolive import YahooLiveDataSource
 from broker.transparent import TransparentBroker
 from security.security import Equity
 from strategy.strategy import OpenCloseStrategy
 from strategy.pattern_matching import PatternMatching
 from strategy.buy_and_hold import BuyAndHold
+from trading_environments.live_environment import LiveRunner
 
 
-def get_strategy_positions(liquid_capital: float, strategy: OpenCloseStrategy) -> TransparentBroker:
-    data_source = YahooDataSource()
+async def get_strategy_positions(
+    liquid_capital: float,
+    strategy: OpenCloseStrategy,
+    data_source: YahooLiveDataSource,
+) -> TransparentBroker:
+    # evaluate the strategy as soon as its own symbols have arrived
+    await data_source.wait(strategy.securities)
     broker = TransparentBroker(liquid_capital, data_source)
     strategy.before_close(broker, data_source)
     return broker
 
 
+async def get_all_strategy_positions(
+    liquid_capital: float, strategies: List[OpenCloseStrategy]
+) -> List[TransparentBroker]:
+    with YahooLiveDataSource() as data_source:
+        # request the data of every strategy up front so it downloads concurrently
+        for strategy in strategies:
+            data_source.start(strategy.securities)
+        brokers = await asyncio.gather(
+            *(
+                get_strategy_positions(liquid_capital, strategy, data_source)
+                for strategy in strategies
+            )
+        )
+        for ticker, error in data_source.errors.items():
+            print(f"Failed to fetch {ticker}: {error!r}")
+        return brokers
+
+
+def stream_main():
+    symbols = ["AAPL", "MSFT", "AMZN", "GOOGL", "FB", "BRK-B"]
+    strategy = PatternMatching(
+        symbols,
+        look_back_window=153,
+        match_window_length=5,
+        incremental=True,
+    )
+    with YahooLiveDataSource() as live_data_source:
+        runner = LiveRunner(
+            [strategy],
+            51841,
+            StreamingDataSource(load_aligned_prices(symbols)),
+            on_positions=lambda strategy, broker: print(
+                f"{strategy.name} targets: "
+                + ", ".join(
+                    f"{symbol.ticker}: {quantity}"
+                    for symbol, quantity in broker.positions.items()
+                )
+            ),
+        )
+        asyncio.run(runner.run(YahooQuoteFeed(symbols, live_data_source)))
+
+
 def main():
     symbols = [
         # "SPY",
@@ -28,7 +82,6 @@ def main():
         # "RL",
         # "PVH",
     ]
-    preload_symbols(symbols)
 
     # strategy = PatternMatching(
     #     symbols,
@@ -38,7 +91,7 @@ def main():
     strategy = BuyAndHold(
         symbols
     )
-    broker = get_strategy_positions(51841, strategy)
+    broker = asyncio.run(get_all_strategy_positions(51841, [strategy]))[0]
     print(f"{strategy.name} positions")
     for symbol, quantity in broker.positions.items():
         print(f"{symbol.ticker}: {quantity}")
@@ -46,4 +99,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "stream":
+        stream_main()
+    else:
+        main()
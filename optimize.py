@@ -1,13 +1,16 @@
+import sys
 from datetime import datetime
 
-import matplotlib.pyplot as plt
 import numpy as np
-from skopt import gp_minimize
 from skopt.space.space import Integer, Real
 
+from data.alignedprices import AlignedPrices
 from data.yahoo import preload_symbols
+from data.yahoobacktest import load_aligned_prices
 from strategy.pattern_matching import PatternMatching
-from trading_environments import backtest_environment
+from trading_environments.result_cache import ResultCache, evaluate_cached
+from trading_environments.sweep import ParameterSweep, best
+from trading_environments.walk_forward import walk_forward
 
 symbols = [
     "AAPL",
@@ -17,12 +20,14 @@ symbols = [
     "FB",
     "BRK-B",
 ]
-preload_symbols(symbols)
 
+# shared by the worker processes, so repeated parameter sets (and reruns) aren't backtested again
+result_cache = ResultCache()
 
-def optimize(args):
-    look_back_window = int(round(args[0]))
-    match_window_length = int(round(args[1]))
+
+def optimize(params, prices: AlignedPrices):
+    look_back_window = int(round(params["look_back_window"]))
+    match_window_length = int(round(params["match_window_length"]))
 
     start_date = datetime(2020, 4, 1)
     end_date = datetime(2020, 12, 1)
@@ -34,48 +39,52 @@ def optimize(args):
     )
 
     try:
-        ts = backtest_environment.run_open_close(
-            PatternMatching(
-                symbols,
-                look_back_window=look_back_window,
-                match_window_length=match_window_length,
-            ),
+        result = evaluate_cached(
+            PatternMatching,
+            [
+                {
+                    "symbols": symbols,
+                    "look_back_window": look_back_window,
+                    "match_window_length": match_window_length,
+                }
+            ],
             50000,
             start_date,
             end_date,
-            log=False,
-            plot_metrics=False,
-        )
+            prices,
+            result_cache,
+        )[0]
     except Exception as e:
         print(e)
         return 0
 
-    avg_sharpe = ts["Portfolio Sharpe Ratio"].mean()
-    cumulative_returns = ts["Portfolio Cumulative Returns"][-1] + 1
+    avg_sharpe = result.mean_rolling_sharpe_ratio
+    cumulative_returns = result.cumulative_return + 1
     if np.isnan(avg_sharpe):
         avg_sharpe = 0
     if np.isnan(cumulative_returns):
         cumulative_returns = 0
     print(f"Sharpe: {avg_sharpe:.3f} Returns: {cumulative_returns-1:.3f}")
     # return -avg_sharpe * cumulative_returns
-    return -cumulative_returns / ts["Portfolio Daily Returns"].std()
+    return -cumulative_returns / result.daily_return_std
 
 
 def main():
-    opt_res = gp_minimize(
-        optimize,
-        [
-            Integer(20, 200),
-            Integer(5, 90),
-        ],
-        verbose=True,
-        n_jobs=-1,
-        n_calls=3000,
-    )
-    opt_x = opt_res.x
-    fun = opt_res.fun
-    x_iters = opt_res.x_iters
-    func_vals = opt_res.func_vals
+    import matplotlib.pyplot as plt
+
+    preload_symbols(symbols)
+    prices = load_aligned_prices(symbols)
+    with ParameterSweep(optimize, prices) as sweep:
+        results = sweep.bayesian(
+            {
+                "look_back_window": Integer(20, 200),
+                "match_window_length": Integer(5, 90),
+            },
+            n_calls=3000,
+        )
+    opt_x, fun = best(results)
+    x_iters = [params for params, _ in results]
+    func_vals = [value for _, value in results]
     print(f"Optimal found at {opt_x} with value: {fun}")
     print(x_iters)
     print(func_vals)
@@ -84,5 +93,40 @@ def main():
     plt.show()
 
 
+def walk_forward_main():
+    preload_symbols(symbols)
+    prices = load_aligned_prices(symbols)
+    candidates = [
+        {"look_back_window": look_back_window, "match_window_length": match_length}
+        for look_back_window in range(20, 201, 20)
+        for match_length in range(5, 91, 10)
+    ]
+    result = walk_forward(
+        PatternMatching,
+        {"symbols": symbols},
+        candidates,
+        prices,
+        datetime(2018, 1, 1),
+        datetime(2020, 12, 1),
+        train_days=252,
+        test_days=63,
+        cache=result_cache,
+    )
+    for fold in result.folds:
+        print(
+            f"Test {fold.test.trading_days[0]} - {fold.test.trading_days[-1]}: "
+            f"{fold.params} Returns: {fold.test.cumulative_return:.3f} "
+            f"Sharpe: {fold.test.sharpe_ratio:.3f}"
+        )
+    print(
+        f"Out of sample returns: {result.test.cumulative_return:.3f} "
+        f"Sharpe: {result.test.sharpe_ratio:.3f} "
+        f"Max drawdown: {result.test.max_drawdown:.3f}"
+    )
+
+
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "walk-forward":
+        walk_forward_main()
+    else:
+        main()
@@ -1,4 +1,6 @@
+import threading
 from enum import Enum, auto
+from typing import Dict, List, Tuple
 
 
 class SecurityType(Enum):
@@ -6,20 +8,71 @@ class SecurityType(Enum):
 
 
 class Security:
-    def __init__(self, ticker: str, security_type: SecurityType):
-        self.ticker = ticker
-        self.type = security_type
+    """
+    A tradable security, interned by class and ticker.
+
+    Constructing a security of a class for a ticker that already has one returns the existing
+    instance, so securities compare and hash by identity. Each one also carries a dense integer
+    `id` (0, 1, 2, ... in order of creation) that array-backed brokers and data sources can use
+    as an index instead of hashing the security.
+    """
+
+    __slots__ = ("ticker", "type", "id")
+
+    _instances: Dict[Tuple[type, str], "Security"] = dict()
+    _by_id: List["Security"] = list()
+    _lock = threading.Lock()
+
+    # Every attribute is set once, when the security is interned in `__new__`, so neither this
+    # class nor its subclasses define `__init__`
+    def __new__(cls, ticker: str, security_type: SecurityType):
+        key = (cls, ticker)
+        security = Security._instances.get(key)
+        if security is None:
+            with Security._lock:
+                security = Security._instances.get(key)
+                if security is None:
+                    security = super().__new__(cls)
+                    security.ticker = ticker
+                    security.type = security_type
+                    security.id = len(Security._by_id)
+                    Security._by_id.append(security)
+                    Security._instances[key] = security
+        assert (
+            security.type == security_type
+        ), f"{ticker} is already a {security.type.name} security"
+        return security
+
+    @staticmethod
+    def from_id(security_id: int) -> "Security":
+        """
+        :return: the security with the dense id `security_id`
+        """
+        return Security._by_id[security_id]
+
+    @staticmethod
+    def count() -> int:
+        """
+        :return: the number of securities created so far (one more than the largest id)
+        """
+        return len(Security._by_id)
 
     def __hash__(self):
-        return hash(self.ticker)
+        return self.id
 
-    def __eq__(self, other):
-        return isinstance(other, Security) and self.ticker == other.ticker
+    def __reduce__(self):
+        # re-intern on unpickling (e.g. in a worker process), where the id may differ
+        return Security, (self.ticker, self.type)
 
-    def __ne__(self, other):
-        return not (self == other)
+    def __repr__(self):
+        return f"{type(self).__name__}({self.ticker!r})"
 
 
 class Equity(Security):
-    def __init__(self, ticker: str):
-        super().__init__(ticker, SecurityType.EQUITY)
+    __slots__ = ()
+
+    def __new__(cls, ticker: str):
+        return super().__new__(cls, ticker, SecurityType.EQUITY)
+
+    def __reduce__(self):
+        return Equity, (self.ticker,)
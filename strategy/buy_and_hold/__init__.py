@@ -17,8 +17,9 @@ class BuyAndHold(OpenCloseStrategy):
         :param data_source:
         :return:
         """
-        for symbol in self.symbols:
-            broker.place_order_proportion(symbol, 1 / len(self.symbols))
+        broker.rebalance_to_weights(
+            {symbol: 1 / len(self.symbols) for symbol in self.symbols}
+        )
 
     @property
     def name(self):
@@ -9,13 +9,17 @@ from broker.broker import Broker
 from data.data import DataSource
 from security import Equity
 from strategy.strategy import OpenCloseStrategy
-from strategy.util import get_pct_returns
+from strategy.util import get_pct_returns_matrix
 
 
 class BuyHedgeSpy(OpenCloseStrategy):
     def __init__(self, symbols: List[str]):
         self.symbols = list(map(Equity, symbols))
 
+    @property
+    def securities(self) -> List[Equity]:
+        return self.symbols + [Equity("SPY")]
+
     def before_close(self, broker: Broker, data_source: DataSource):
         """
         buy and hold strategy
@@ -24,24 +28,20 @@ class BuyHedgeSpy(OpenCloseStrategy):
         :return:
         """
         bar_count = 100
-        past_returns = get_pct_returns(self.symbols, "Close", bar_count, data_source)
-        spy_returns = (
-            data_source.price_history(Equity("SPY"), bar_count=bar_count)["Close"]
-            .pct_change()
-            .dropna()
+        past_returns = get_pct_returns_matrix(
+            self.symbols + [Equity("SPY")], "Close", bar_count, data_source
         )
+        spy_returns = past_returns[:, -1]
         hedge_weight = 0
-        for symbol in self.symbols:
-            beta = stats.linregress(spy_returns, past_returns[symbol.ticker])[0]
+        for i in range(len(self.symbols)):
+            beta = stats.linregress(spy_returns, past_returns[:, i])[0]
             hedge_weight -= beta
-        weights = np.ones(len(self.symbols) + 1, dtype=np.float)
+        weights = np.ones(len(self.symbols) + 1, dtype=np.float64)
         for i, symbol in enumerate(self.symbols):
             weights[i] = 1
         weights[-1] = hedge_weight
         weights /= np.sum(np.abs(weights))
-        for weight, symbol in zip(weights, self.symbols):
-            broker.place_order_proportion(symbol, weight)
-        broker.place_order_proportion(Equity("SPY"), weights[-1])
+        broker.rebalance_to_weights(weights, self.symbols + [Equity("SPY")])
 
     @property
     def name(self):
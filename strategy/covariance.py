@@ -0,0 +1,304 @@
+"""
+Covariance estimation for mean-variance strategies.
+
+Strategies need Σ⁻¹μ for the covariance Σ and mean μ of some returns. `CovarianceEstimator`
+estimates Σ from a returns matrix, optionally shrunk towards a scaled identity (Ledoit-Wolf) or
+reduced to a one factor market model, and the resulting `Covariance` solves Σ⁻¹b with a
+Cholesky factorization rather than the SVD of `np.linalg.pinv`. A singular estimate (e.g. the
+sample covariance of fewer days than symbols) falls back to `pinv`, which gives the same
+minimum norm solution as before.
+
+`RollingCovariance` estimates the covariance of a trailing window of returns from rolling sums
+Σx and Σxxᵀ, which only need a rank two update per day instead of a pass over the window.
+"""
+
+from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy import linalg
+
+from data.data import DataSource
+from security import Equity
+from strategy.util import get_pct_returns_dated
+
+# The covariance estimates of `CovarianceEstimator`
+SAMPLE = "sample"
+LEDOIT_WOLF = "ledoit_wolf"
+FACTOR = "factor"
+
+# Cholesky factors whose smallest pivot is this small relative to the largest are treated as
+# singular, since solving with them would amplify noise far more than `pinv` does
+_MIN_PIVOT_RATIO = 1e-7
+
+
+class Covariance(ABC):
+    @property
+    @abstractmethod
+    def matrix(self) -> np.ndarray:
+        """
+        The (symbols, symbols) covariance matrix
+        """
+        pass
+
+    @abstractmethod
+    def solve(self, b: np.ndarray) -> np.ndarray:
+        """
+        :return: Σ⁻¹b, or the minimum norm least squares solution if Σ is singular
+        """
+        pass
+
+
+class DenseCovariance(Covariance):
+    def __init__(self, matrix: np.ndarray, singular: bool = False):
+        """
+        :param matrix: the covariance matrix
+        :param singular: whether the matrix is known to be singular (e.g. it was estimated from
+        fewer samples than dimensions), so `solve` goes straight to `pinv`
+        """
+        self._matrix = matrix
+        self._singular = singular
+        self._factor = None
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix
+
+    def solve(self, b: np.ndarray) -> np.ndarray:
+        if not self._singular and self._factor is None:
+            try:
+                self._factor = linalg.cho_factor(self._matrix, check_finite=False)
+                pivots = np.abs(np.diag(self._factor[0]))
+                self._singular = pivots.min() <= _MIN_PIVOT_RATIO * pivots.max()
+            except linalg.LinAlgError:
+                self._singular = True
+        if self._singular:
+            return np.linalg.pinv(self._matrix) @ b
+        return linalg.cho_solve(self._factor, b, check_finite=False)
+
+
+class FactorCovariance(Covariance):
+    """
+    A one factor model Σ = σ²ββᵀ + D of the covariance, where β are the loadings of every symbol
+    on the factor, σ² the factor variance, and D the diagonal of specific variances. Systems are
+    solved with the Woodbury identity in O(symbols) instead of factoring Σ.
+    """
+
+    def __init__(
+        self,
+        loadings: np.ndarray,
+        factor_variance: float,
+        specific_variances: np.ndarray,
+    ):
+        self.loadings = loadings
+        self.factor_variance = factor_variance
+        self.specific_variances = specific_variances
+
+    @property
+    def matrix(self) -> np.ndarray:
+        matrix = self.factor_variance * np.outer(self.loadings, self.loadings)
+        matrix[np.diag_indices_from(matrix)] += self.specific_variances
+        return matrix
+
+    def solve(self, b: np.ndarray) -> np.ndarray:
+        if not (self.specific_variances > 0).all() or not self.factor_variance > 0:
+            return DenseCovariance(self.matrix).solve(b)
+        # (D + σ²ββᵀ)⁻¹b = D⁻¹b - D⁻¹β βᵀD⁻¹b / (1/σ² + βᵀD⁻¹β)
+        scaled_b = b / self.specific_variances
+        scaled_loadings = self.loadings / self.specific_variances
+        return scaled_b - scaled_loadings * (self.loadings @ scaled_b) / (
+            1 / self.factor_variance + self.loadings @ scaled_loadings
+        )
+
+
+class CovarianceEstimator:
+    def __init__(self, method: str = SAMPLE, ddof: int = 1):
+        """
+        :param method: one of `SAMPLE` (the sample covariance), `LEDOIT_WOLF` (the sample
+        covariance shrunk towards a scaled identity by the Ledoit-Wolf optimal amount), or
+        `FACTOR` (a one factor model whose factor is the mean return of all symbols)
+        :param ddof: the delta degrees of freedom of the sample covariance, as in `np.cov`.
+        Ledoit-Wolf shrinks the biased (ddof=0) estimate as in its definition.
+        """
+        assert method in (SAMPLE, LEDOIT_WOLF, FACTOR), f"Unknown method {method}"
+        self.method = method
+        self.ddof = ddof
+
+    def estimate(
+        self, returns: np.ndarray, weights: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, Covariance]:
+        """
+        :param returns: a (samples, symbols) returns matrix
+        :param weights: optional weights of the samples, as the `aweights` of `np.cov`
+        :return: a tuple of the (weighted) mean and the covariance of `returns`
+        """
+        if weights is None:
+            weights = np.full(len(returns), 1 / len(returns))
+        else:
+            weights = weights / np.sum(weights)
+        mean = weights @ returns
+        centered = returns - mean
+        biased = (centered * weights[:, None]).T @ centered
+        return mean, self.from_biased(biased, centered, weights)
+
+    def from_biased(
+        self, biased: np.ndarray, centered: np.ndarray, weights: np.ndarray
+    ) -> Covariance:
+        """
+        :param biased: the biased (ddof=0) covariance matrix of the samples
+        :param centered: the samples minus their mean
+        :param weights: the normalized weights of the samples
+        :return: the covariance estimate
+        """
+        symbol_count = biased.shape[0]
+        if self.method == LEDOIT_WOLF:
+            return DenseCovariance(_ledoit_wolf(biased, centered, weights))
+        # the same normalization as `np.cov` with `aweights`
+        correction = 1 - self.ddof * np.sum(weights**2)
+        matrix = biased / correction
+        if self.method == FACTOR:
+            return _market_factor_model(matrix)
+        # the centered samples span at most one dimension less than their number
+        sample_count = np.count_nonzero(weights)
+        return DenseCovariance(matrix, singular=sample_count - 1 < symbol_count)
+
+
+class RollingCovariance:
+    """
+    Estimates the mean and covariance of the trailing returns of a set of symbols for the
+    current day of a data source.
+
+    In incremental mode the window of returns is kept in a ring buffer along with the rolling
+    sums Σx and Σxxᵀ. When the data source has moved forward by one bar, only the new row of
+    returns is fetched and the sums are updated by adding the new row's outer product and
+    removing the oldest row's, an O(symbols²) update instead of O(days × symbols²). The sums are
+    recomputed from the window every `bar_count` updates to keep floating point error from
+    accumulating. The results match the stateless computation up to floating point error.
+    """
+
+    def __init__(
+        self,
+        symbols: List[Equity],
+        bar_count: int,
+        estimator: Optional[CovarianceEstimator] = None,
+        incremental: bool = False,
+    ):
+        """
+        :param symbols: the symbols to compute returns for
+        :param bar_count: the number of bars of prices the returns are computed from
+        :param estimator: the covariance estimator (defaults to the sample covariance)
+        :param incremental: if True, keep state between days
+        """
+        self.symbols = symbols
+        self.bar_count = bar_count
+        self.estimator = estimator or CovarianceEstimator()
+        self.incremental = incremental
+        self._rows = None
+        self._oldest = 0
+        self._sum = None
+        self._outer = None
+        self._updates = 0
+        self._dates = None
+
+    def update(self, data_source: DataSource) -> Tuple[np.ndarray, Covariance]:
+        """
+        :param data_source: the data source to get returns from
+        :return: a tuple of the mean and the covariance of the trailing returns
+        """
+        if self.incremental and self._rows is not None:
+            tail, dates = get_pct_returns_dated(self.symbols, "Close", 3, data_source)
+            if len(tail) == 2:
+                if dates[0] == self._dates[1]:
+                    self._replace(self._oldest, tail[1])
+                    self._oldest = (self._oldest + 1) % self._row_count
+                    self._dates = (dates[0], dates[1])
+                    return self._estimate()
+                if (dates[0], dates[1]) == self._dates:
+                    # the same day again, so only the newest row changed
+                    self._replace((self._oldest - 1) % self._row_count, tail[1])
+                    return self._estimate()
+
+        past_returns, dates = get_pct_returns_dated(
+            self.symbols, "Close", self.bar_count, data_source
+        )
+        self._rows = None
+        if self.incremental and len(past_returns) == self._row_count >= 2:
+            # no rows were dropped, so the last two rows are consecutive days
+            self._rows = np.array(past_returns, dtype=np.float64)
+            self._oldest = 0
+            self._dates = (dates[-2], dates[-1])
+            self._resync()
+            return self._estimate()
+        return self.estimator.estimate(past_returns)
+
+    @property
+    def _row_count(self) -> int:
+        return self.bar_count - 1
+
+    def _replace(self, index: int, row: np.ndarray):
+        old_row = self._rows[index].copy()
+        self._rows[index] = row
+        self._updates += 1
+        if self._updates >= self._row_count:
+            self._resync()
+            return
+        self._sum += row - old_row
+        # rank two update: + row rowᵀ - old_row old_rowᵀ
+        rows = np.stack([row, old_row])
+        self._outer += rows.T @ (rows * np.array([[1.0], [-1.0]]))
+
+    def _resync(self):
+        self._sum = self._rows.sum(axis=0)
+        self._outer = self._rows.T @ self._rows
+        self._updates = 0
+
+    def _estimate(self) -> Tuple[np.ndarray, Covariance]:
+        count = len(self._rows)
+        mean = self._sum / count
+        biased = self._outer / count - np.outer(mean, mean)
+        weights = np.full(count, 1 / count)
+        # only Ledoit-Wolf needs the centered rows
+        centered = (
+            self._rows - mean if self.estimator.method == LEDOIT_WOLF else self._rows
+        )
+        return mean, self.estimator.from_biased(biased, centered, weights)
+
+
+def _ledoit_wolf(
+    biased: np.ndarray, centered: np.ndarray, weights: np.ndarray
+) -> np.ndarray:
+    # shrink towards μI with intensity min(β, δ) / δ, where δ = ||S - μI||² and β estimates the
+    # error of S as Σᵢ wᵢ² ||xᵢxᵢᵀ - S||², expanded so no (symbols, symbols) matrix per sample
+    # is formed
+    symbol_count = biased.shape[0]
+    target = np.trace(biased) / symbol_count
+    norm = np.sum(biased**2)
+    delta = norm - 2 * target * np.trace(biased) + target**2 * symbol_count
+    squared_weights = weights**2
+    row_norms = np.einsum("ij,ij->i", centered, centered)
+    if (weights == weights[0]).all():
+        # Σᵢ wᵢ² xᵢxᵢᵀ is S / n for equal weights, which saves a pass over the samples
+        weighted_outer = biased * weights[0]
+    else:
+        weighted_outer = (centered * squared_weights[:, None]).T @ centered
+    beta = (
+        squared_weights @ row_norms**2
+        - 2 * np.sum(biased * weighted_outer)
+        + np.sum(squared_weights) * norm
+    )
+    shrinkage = 0.0 if delta <= 0 else min(max(beta, 0.0), delta) / delta
+    shrunk = (1 - shrinkage) * biased
+    shrunk[np.diag_indices_from(shrunk)] += shrinkage * target
+    return shrunk
+
+
+def _market_factor_model(matrix: np.ndarray) -> FactorCovariance:
+    # the factor is the equal weighted mean return, whose covariance with every symbol is the
+    # mean of that symbol's row of the covariance matrix
+    factor_covariances = matrix.mean(axis=1)
+    factor_variance = float(factor_covariances.mean())
+    if not factor_variance > 0:
+        return FactorCovariance(np.zeros(len(matrix)), 0.0, np.diag(matrix).copy())
+    loadings = factor_covariances / factor_variance
+    specific_variances = np.diag(matrix) - factor_variance * loadings**2
+    return FactorCovariance(loadings, factor_variance, specific_variances)
@@ -1,5 +1,5 @@
 from functools import reduce
-from typing import List
+from typing import List, Union
 
 import numpy as np
 import pandas as pd
@@ -7,13 +7,41 @@ import pandas as pd
 from broker.broker import Broker
 from data.data import DataSource
 from security import Equity
+from strategy.covariance import SAMPLE, CovarianceEstimator, RollingCovariance
 from strategy.strategy import OpenCloseStrategy
-from strategy.util import get_pct_returns
+from universe import Universe
 
 
 class KellyCriterion(OpenCloseStrategy):
-    def __init__(self, symbols: List[str]):
-        self.symbols = list(map(Equity, symbols))
+    def __init__(
+        self,
+        symbols: Union[List[str], Universe],
+        covariance: str = SAMPLE,
+        incremental: bool = False,
+        sector_neutral: bool = False,
+    ):
+        """
+        :param symbols: the symbols to trade, or a universe to trade every symbol of
+        :param covariance: the covariance estimate (see `CovarianceEstimator`)
+        :param incremental: if True, update the covariance with each new day of returns
+        instead of recomputing it (see `RollingCovariance`)
+        :param sector_neutral: if True, subtract the mean weight of each sector from the
+        weights of its symbols, so the portfolio has no net exposure to any sector. `symbols`
+        must be a `Universe`.
+        """
+        if isinstance(symbols, Universe):
+            self.universe = symbols
+            self.symbols = symbols.securities
+        else:
+            self.universe = None
+            self.symbols = list(map(Equity, symbols))
+        assert (
+            not sector_neutral or self.universe is not None
+        ), "Sector neutral weights need the sectors of a Universe"
+        self.sector_neutral = sector_neutral
+        self._covariance = RollingCovariance(
+            self.symbols, 101, CovarianceEstimator(covariance), incremental
+        )
 
     def before_close(self, broker: Broker, data_source: DataSource):
         """
@@ -22,17 +50,15 @@ class KellyCriterion(OpenCloseStrategy):
         :param data_source:
         :return:
         """
-        past_returns = get_pct_returns(self.symbols, "Close", 101, data_source)
-        past_returns = past_returns.values
-        c = np.cov(past_returns, rowvar=False)
-        m = np.mean(past_returns, axis=0)
-        weights = np.linalg.pinv(c) @ m / 2
+        m, c = self._covariance.update(data_source)
+        weights = c.solve(m) / 2
+        if self.sector_neutral:
+            weights = self.universe.sector_neutral(weights)
         leverage = np.sum(np.abs(weights))
         if leverage > 2:
             weights = weights / leverage * 2
-        for weight, symbol in zip(weights, self.symbols):
-            assert not np.isnan(weight), "Can't have NaN weight"
-            broker.place_order_proportion(symbol, weight)
+        assert not np.isnan(weights).any(), "Can't have NaN weight"
+        broker.rebalance_to_weights(weights, self.symbols)
 
     @property
     def name(self):
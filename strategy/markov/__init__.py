@@ -1,5 +1,5 @@
 from functools import reduce
-from typing import List
+from typing import Any, Dict, List, Sequence
 
 import numpy as np
 import pandas as pd
@@ -8,8 +8,9 @@ from scipy import stats
 from broker.broker import Broker
 from data.data import DataSource
 from security import Equity
-from strategy.strategy import OpenCloseStrategy
-from strategy.util import get_pct_returns
+from strategy.covariance import SAMPLE, CovarianceEstimator
+from strategy.strategy import BatchedStrategy, OpenCloseStrategy
+from strategy.util import BatchedWindowMatcher, WindowMatcher
 
 
 class Markov(OpenCloseStrategy):
@@ -20,12 +21,18 @@ class Markov(OpenCloseStrategy):
         match_window_length: int = 2,
         match_threshold: float = 0.7,
         min_matches_threshold: int = 5,
+        incremental: bool = False,
+        covariance: str = SAMPLE,
     ):
         self.symbols = list(map(Equity, symbols))
         self.look_back_window = look_back_window
         self.match_window_length = match_window_length
         self.match_threshold = match_threshold
         self.min_matches_threshold = min_matches_threshold
+        self.covariance = covariance
+        self._matcher = WindowMatcher(
+            self.symbols, look_back_window, match_window_length, incremental
+        )
         assert (
             self.min_matches_threshold >= 2
         ), "Must have at least 2 matches to calculate covariance matrix"
@@ -37,38 +44,109 @@ class Markov(OpenCloseStrategy):
         :param data_source:
         :return:
         """
-        bar_count = self.look_back_window
-        past_returns = get_pct_returns(self.symbols, "Close", bar_count, data_source)
-        future_returns = list()
+        past_returns, match_scores = self._matcher.match(data_source)
+        weights = markov_weights(
+            past_returns,
+            match_scores,
+            self.match_window_length,
+            self.match_threshold,
+            self.min_matches_threshold,
+            self.covariance,
+        )
+        assert not np.isnan(weights).any(), "Can't have NaN weight"
+        broker.rebalance_to_weights(weights, self.symbols)
 
-        match_length = self.match_window_length
-        curr_returns = past_returns.iloc[-match_length:].values.flatten()
-        for i in range(len(past_returns) - 1, match_length - 1, -1):
-            past_return_window = past_returns.iloc[
-                i - match_length : i
-            ].values.flatten()
-            match_score = np.dot(curr_returns, past_return_window)
-            match_score /= np.linalg.norm(curr_returns) * np.linalg.norm(
-                past_return_window
-            )
-            if match_score > self.match_threshold:
-                future_returns.append(past_returns.iloc[i])
-        future_returns = pd.DataFrame(future_returns)
-        if len(future_returns) < self.min_matches_threshold:
-            weights = np.zeros((len(past_returns.columns),), dtype=np.float)
-        else:
-            m = future_returns.mean().values
-            cov_inv = np.linalg.pinv(future_returns.cov().values)
-            weights = cov_inv @ m
-            weights /= np.sum(np.abs(weights)) / 4
-            # weights *= 2
-            # debit = np.sum(weights) / 2
-            # debit_weights = (1 - debit) / len(weights)
-            # weights += debit_weights
-        for weight, symbol in zip(weights, self.symbols):
-            assert not np.isnan(weight), "Can't have NaN weight"
-            broker.place_order_proportion(symbol, weight)
+    @property
+    def name(self):
+        return "Markov"
+
+
+class MarkovBatch(BatchedStrategy):
+    """
+    Evaluates many parameter sets of `Markov` together. Parameter sets with the same
+    `match_window_length` share one returns matrix and one set of match scores, computed for
+    their longest `look_back_window`; shorter look back windows are truncations of it, and
+    every `match_threshold` is applied to the same scores.
+    """
+
+    def __init__(
+        self,
+        symbols: List[str],
+        configs: Sequence[Dict[str, Any]],
+        incremental: bool = False,
+    ):
+        """
+        :param symbols: the symbols to trade
+        :param configs: the parameters of every parameter set, as keyword arguments of `Markov`
+        ("look_back_window", "match_window_length", "match_threshold",
+        "min_matches_threshold", and "covariance"). Missing parameters take the defaults of
+        `Markov`.
+        :param incremental: if True, keep the window state between days (see `WindowMatcher`)
+        """
+        defaults = {
+            "look_back_window": 200,
+            "match_window_length": 2,
+            "match_threshold": 0.7,
+            "min_matches_threshold": 5,
+            "covariance": SAMPLE,
+        }
+        super().__init__(symbols, [{**defaults, **config} for config in configs])
+        assert all(
+            config["min_matches_threshold"] >= 2 for config in self.configs
+        ), "Must have at least 2 matches to calculate covariance matrix"
+        self._matcher = BatchedWindowMatcher(
+            self.symbols,
+            [config["look_back_window"] for config in self.configs],
+            [config["match_window_length"] for config in self.configs],
+            incremental,
+        )
+
+    def compute_weights(self, data_source: DataSource) -> np.ndarray:
+        matches = self._matcher.match(data_source)
+        return np.array(
+            [
+                markov_weights(
+                    past_returns,
+                    match_scores,
+                    config["match_window_length"],
+                    config["match_threshold"],
+                    config["min_matches_threshold"],
+                    config["covariance"],
+                )
+                for config, (past_returns, match_scores) in zip(self.configs, matches)
+            ]
+        )
 
     @property
     def name(self):
         return "Markov"
+
+
+def markov_weights(
+    past_returns: np.ndarray,
+    match_scores: np.ndarray,
+    match_length: int,
+    match_threshold: float,
+    min_matches_threshold: int,
+    covariance: str = SAMPLE,
+) -> np.ndarray:
+    """
+    :param past_returns: the trailing returns matrix
+    :param match_scores: the match score of every window of `past_returns`
+    :param match_length: the number of rows in each window
+    :param match_threshold: the minimum score of a matching window
+    :param min_matches_threshold: the minimum number of matches to trade on
+    :param covariance: the covariance estimate (see `CovarianceEstimator`)
+    :return: the weight of each symbol
+    """
+    future_returns = past_returns[match_length:][match_scores > match_threshold]
+    if len(future_returns) < min_matches_threshold:
+        return np.zeros((past_returns.shape[1],), dtype=np.float64)
+    m, cov = CovarianceEstimator(covariance).estimate(future_returns)
+    weights = cov.solve(m)
+    weights /= np.sum(np.abs(weights)) / 4
+    # weights *= 2
+    # debit = np.sum(weights) / 2
+    # debit_weights = (1 - debit) / len(weights)
+    # weights += debit_weights
+    return weights
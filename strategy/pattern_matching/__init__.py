@@ -1,22 +1,39 @@
-from typing import List
+from typing import Any, Dict, List, Sequence
 
 import numpy as np
-import pandas as pd
 
 from broker.broker import Broker
 from data.data import DataSource
 from security import Equity
-from strategy.strategy import OpenCloseStrategy
-from strategy.util import get_pct_returns
+from strategy.covariance import SAMPLE, CovarianceEstimator
+from strategy.strategy import BatchedStrategy, OpenCloseStrategy
+from strategy.util import BatchedWindowMatcher, WindowMatcher
 
 
 class PatternMatching(OpenCloseStrategy):
     def __init__(
-        self, symbols: List[str], look_back_window: int, match_window_length: int
+        self,
+        symbols: List[str],
+        look_back_window: int,
+        match_window_length: int,
+        incremental: bool = False,
+        covariance: str = SAMPLE,
     ):
+        """
+        :param symbols: the symbols to trade
+        :param look_back_window: the number of days of history to search for matches
+        :param match_window_length: the number of days in each matched pattern
+        :param incremental: if True, keep the window state between days instead of recomputing
+        it from scratch (see `WindowMatcher`)
+        :param covariance: the covariance estimate (see `CovarianceEstimator`)
+        """
         self.symbols = list(map(Equity, symbols))
         self.look_back_window = look_back_window
         self.match_window_length = match_window_length
+        self.covariance = covariance
+        self._matcher = WindowMatcher(
+            self.symbols, look_back_window, match_window_length, incremental
+        )
 
     def before_close(self, broker: Broker, data_source: DataSource):
         """
@@ -25,41 +42,90 @@ class PatternMatching(OpenCloseStrategy):
         :param data_source:
         :return:
         """
-        bar_count = self.look_back_window
-        past_returns = get_pct_returns(self.symbols, "Close", bar_count, data_source)
-        future_returns = list()
+        past_returns, match_scores = self._matcher.match(data_source)
+        weights = pattern_matching_weights(
+            past_returns, match_scores, self.match_window_length, self.covariance
+        )
+        assert not np.isnan(weights).any(), "Can't have NaN weight"
+        broker.rebalance_to_weights(weights, self.symbols)
+
+    @property
+    def name(self):
+        return "Pattern Matching"
+
 
-        match_length = self.match_window_length
-        curr_returns = past_returns.iloc[-match_length:].values.flatten()
-        match_scores = list()
-        for i in range(len(past_returns) - 1, match_length - 1, -1):
-            past_return_window = past_returns.iloc[
-                i - match_length : i
-            ].values.flatten()
-            match_score = np.dot(curr_returns, past_return_window)
-            match_score /= np.linalg.norm(curr_returns) * np.linalg.norm(
-                past_return_window
-            )
-            if match_score > 0:
-                match_scores.append(match_score**2)
-                future_returns.append(past_returns.iloc[i].values)
+class PatternMatchingBatch(BatchedStrategy):
+    """
+    Evaluates many parameter sets of `PatternMatching` together. Parameter sets with the same
+    `match_window_length` share one returns matrix and one set of match scores, computed for
+    their longest `look_back_window`; shorter look back windows are truncations of it.
+    """
 
-        match_scores = np.array(match_scores) ** 2
-        match_scores /= np.sum(match_scores)
-        future_returns = np.array(future_returns)
+    def __init__(
+        self,
+        symbols: List[str],
+        configs: Sequence[Dict[str, Any]],
+        incremental: bool = False,
+    ):
+        """
+        :param symbols: the symbols to trade
+        :param configs: the "look_back_window", "match_window_length", and optionally
+        "covariance" of every parameter set
+        :param incremental: if True, keep the window state between days (see `WindowMatcher`)
+        """
+        super().__init__(
+            symbols, [{"covariance": SAMPLE, **config} for config in configs]
+        )
+        self._matcher = BatchedWindowMatcher(
+            self.symbols,
+            [config["look_back_window"] for config in self.configs],
+            [config["match_window_length"] for config in self.configs],
+            incremental,
+        )
 
-        mean = np.sum(future_returns * match_scores[:, None], axis=0)
-        cov = np.cov(future_returns, ddof=0, rowvar=False, aweights=match_scores)
-        cov_inv = np.linalg.pinv(cov)
-        weights = cov_inv @ mean
-        max_weight = np.max(np.abs(weights))
-        if max_weight > 2:
-            weights /= max_weight
-        # weights /= np.sum(np.abs(weights))
-        for weight, symbol in zip(weights, self.symbols):
-            assert not np.isnan(weight), "Can't have NaN weight"
-            broker.place_order_proportion(symbol, weight)
+    def compute_weights(self, data_source: DataSource) -> np.ndarray:
+        matches = self._matcher.match(data_source)
+        return np.array(
+            [
+                pattern_matching_weights(
+                    past_returns,
+                    match_scores,
+                    config["match_window_length"],
+                    config["covariance"],
+                )
+                for config, (past_returns, match_scores) in zip(self.configs, matches)
+            ]
+        )
 
     @property
     def name(self):
         return "Pattern Matching"
+
+
+def pattern_matching_weights(
+    past_returns: np.ndarray,
+    match_scores: np.ndarray,
+    match_length: int,
+    covariance: str = SAMPLE,
+) -> np.ndarray:
+    """
+    :param past_returns: the trailing returns matrix
+    :param match_scores: the match score of every window of `past_returns`
+    :param match_length: the number of rows in each window
+    :param covariance: the covariance estimate (see `CovarianceEstimator`)
+    :return: the weight of each symbol
+    """
+    matched = match_scores > 0
+    match_scores = (match_scores[matched] ** 2) ** 2
+    match_scores /= np.sum(match_scores)
+    future_returns = past_returns[match_length:][matched]
+
+    mean, cov = CovarianceEstimator(covariance, ddof=0).estimate(
+        future_returns, match_scores
+    )
+    weights = cov.solve(mean)
+    max_weight = np.max(np.abs(weights))
+    if max_weight > 2:
+        weights /= max_weight
+    # weights /= np.sum(np.abs(weights))
+    return weights
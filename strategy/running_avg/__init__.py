@@ -6,7 +6,7 @@ from broker.broker import Broker
 from data.data import DataSource
 from security import Equity
 from strategy.strategy import OpenCloseStrategy
-from strategy.util import get_pct_returns
+from strategy.util import get_pct_returns_matrix
 
 
 class RunningAvg(OpenCloseStrategy):
@@ -20,16 +20,15 @@ class RunningAvg(OpenCloseStrategy):
         :param data_source:
         :return:
         """
-        past_returns = get_pct_returns(self.symbols, "Close", 10, data_source)
+        past_returns = get_pct_returns_matrix(self.symbols, "Close", 10, data_source)
         print(past_returns)
-        m = past_returns.mean().values
+        m = past_returns.mean(axis=0)
         weights = m / (np.sum(m) + 0.0001)
         for w in weights:
             print(f"{w:.4f}", end=" ")
         print()
-        for weight, symbol in zip(weights, self.symbols):
-            assert not np.isnan(weight), "Can't have NaN weight"
-            broker.place_order_proportion(symbol, weight)
+        assert not np.isnan(weights).any(), "Can't have NaN weight"
+        broker.rebalance_to_weights(weights, self.symbols)
 
     @property
     def name(self):
@@ -1,7 +1,11 @@
 from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
 
 from broker.broker import Broker
 from data.data import DataSource
+from security import Equity
 
 
 class OpenCloseStrategy(ABC):
@@ -10,6 +14,14 @@ class OpenCloseStrategy(ABC):
     def name(self):
         pass
 
+    @property
+    def securities(self) -> List[Equity]:
+        """
+        Every security the strategy reads prices of or trades, so live data sources can fetch
+        them up front. Defaults to the strategy's `symbols`.
+        """
+        return list(getattr(self, "symbols", ()))
+
     def on_open(self, broker: Broker, data_source: DataSource):
         """
         Called on market open to place trades
@@ -26,3 +38,114 @@ class OpenCloseStrategy(ABC):
         approx_eod_close can be used here to approximate the current trading day's closing price
         """
         pass
+
+
+class IntradayStrategy(ABC):
+    @property
+    @abstractmethod
+    def name(self):
+        pass
+
+    def on_open(self, broker: Broker, data_source: DataSource):
+        """
+        Called on the first bar of every trading day, before `on_bar`
+        :param broker: the broker to use to place orders
+        :param data_source: the data source to get pricing and quotes
+        """
+        pass
+
+    def on_bar(self, broker: Broker, data_source: DataSource):
+        """
+        Called once every bar has closed to place trades
+        :param broker: the broker to use to place orders
+        :param data_source: the data source to get pricing and quotes. The bar that just closed
+        is the last bar of its price history
+        """
+        pass
+
+    def before_close(self, broker: Broker, data_source: DataSource):
+        """
+        Called on the last bar of every trading day, after `on_bar`
+        :param broker: the broker to use to place orders
+        :param data_source: the data source to get pricing and quotes
+        """
+        pass
+
+
+class BatchedStrategy(ABC):
+    """
+    Many parameter sets of one strategy evaluated together, so that work shared between them
+    (e.g. the returns matrix and match scores) is done once per day.
+
+    `compute_weights` returns the (configs, symbols) weights of every parameter set for the
+    current day. `strategies` returns one `OpenCloseStrategy` per parameter set, each trading
+    its row of the weights, so the whole batch can be backtested with `run_open_close_many`:
+    the weights are computed by whichever strategy asks first on a given day and reused by
+    the others.
+    """
+
+    def __init__(self, symbols: List[str], configs: Sequence[Dict[str, Any]]):
+        """
+        :param symbols: the symbols to trade
+        :param configs: the parameters of every parameter set
+        """
+        assert len(configs) > 0, "Need at least one parameter set"
+        self.symbols = list(map(Equity, symbols))
+        self.configs = [dict(config) for config in configs]
+        self._weights: Optional[np.ndarray] = None
+        # the parameter sets that traded on the current weights
+        self._consumed = set()
+
+    @property
+    @abstractmethod
+    def name(self):
+        pass
+
+    @abstractmethod
+    def compute_weights(self, data_source: DataSource) -> np.ndarray:
+        """
+        :param data_source: the data source to get pricing and quotes
+        :return: the (configs, symbols) weights of every parameter set for the current day
+        """
+        pass
+
+    def weights(self, data_source: DataSource, config_index: int) -> np.ndarray:
+        """
+        :return: the weights of the parameter set at `config_index` for the current day. Every
+        parameter set trades once a day, so the weights are recomputed as soon as a parameter
+        set asks again.
+        """
+        if self._weights is None or config_index in self._consumed:
+            self._weights = self.compute_weights(data_source)
+            self._consumed = set()
+        self._consumed.add(config_index)
+        return self._weights[config_index]
+
+    def strategies(self) -> List[OpenCloseStrategy]:
+        """
+        :return: one strategy per parameter set, in the order of `configs`
+        """
+        return [_BatchMember(self, i) for i in range(len(self.configs))]
+
+
+class _BatchMember(OpenCloseStrategy):
+    def __init__(self, batch: BatchedStrategy, config_index: int):
+        self.batch = batch
+        self.config_index = config_index
+
+    @property
+    def securities(self) -> List[Equity]:
+        return list(self.batch.symbols)
+
+    def before_close(self, broker: Broker, data_source: DataSource):
+        weights = self.batch.weights(data_source, self.config_index)
+        assert not np.isnan(weights).any(), "Can't have NaN weight"
+        broker.rebalance_to_weights(weights, self.batch.symbols)
+
+    @property
+    def name(self):
+        params = ", ".join(
+            f"{key}={value}"
+            for key, value in self.batch.configs[self.config_index].items()
+        )
+        return f"{self.batch.name} ({params})"
@@ -1,7 +1,8 @@
-from functools import reduce
-from typing import List, Union
+from typing import Dict, List, Sequence, Tuple, Union
 
+import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import as_strided
 
 from data.data import DataSource
 from security import Equity
@@ -12,21 +13,268 @@ def get_pct_returns(
     field: str,
     bar_count: int,
     data_source: DataSource,
-):
+) -> pd.DataFrame:
     symbols = [Equity(s) if isinstance(s, str) else s for s in symbols]
-    prices = [
-        data_source.price_history(symbol, bar_count=bar_count, approx_eod_close=True)[
-            field
-        ].pct_change()
-        for symbol in symbols
-    ]
-    for price, symbol in zip(prices, symbols):
-        price.name = symbol.ticker
-    past_returns = reduce(
-        lambda left, right: pd.merge(
-            left, right, left_index=True, right_index=True, how="outer"
-        ),
-        prices,
+    return data_source.pct_returns(symbols, field, bar_count)
+
+
+def get_pct_returns_matrix(
+    symbols: List[Union[str, Equity]],
+    field: str,
+    bar_count: int,
+    data_source: DataSource,
+) -> np.ndarray:
+    """
+    Same as `get_pct_returns` but returns a (days, symbols) array. Backtest data sources serve
+    this straight from a precomputed returns matrix without building any DataFrames.
+    """
+    symbols = [Equity(s) if isinstance(s, str) else s for s in symbols]
+    return data_source.pct_returns_matrix(symbols, field, bar_count)
+
+
+def get_pct_returns_dated(
+    symbols: List[Union[str, Equity]],
+    field: str,
+    bar_count: int,
+    data_source: DataSource,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Same as `get_pct_returns_matrix` but also returns the date of every row, without building
+    any DataFrames on backtest data sources
+    """
+    symbols = [Equity(s) if isinstance(s, str) else s for s in symbols]
+    return data_source.pct_returns_dated(symbols, field, bar_count)
+
+
+def window_match_scores(returns: np.ndarray, match_length: int) -> np.ndarray:
+    """
+    Computes the cosine similarity between the last `match_length` rows of `returns` and every
+    earlier window of `match_length` rows that is followed by at least one more row
+    :param returns: a (days, symbols) matrix of returns
+    :param match_length: the number of rows in each window
+    :return: an array where entry j is the similarity of rows [j, j + match_length), i.e. the
+    window right before row j + match_length
+    """
+    returns = np.ascontiguousarray(returns, dtype=np.float64)
+    window_count = len(returns) - match_length
+    if window_count <= 0:
+        return np.empty(0)
+
+    # window norms from prefix sums of the squared row norms
+    row_norms = np.einsum("ij,ij->i", returns, returns)
+    prefix = np.concatenate(([0.0], np.cumsum(row_norms)))
+    window_norms = (
+        prefix[match_length : match_length + window_count] - prefix[:window_count]
     )
-    past_returns.dropna(inplace=True)
-    return past_returns
+    return _cosine_scores(returns, match_length, window_norms)
+
+
+def _cosine_scores(
+    returns: np.ndarray, match_length: int, window_norms: np.ndarray
+) -> np.ndarray:
+    # `returns` must be C-contiguous and `window_norms` holds squared norms
+    row_count, symbol_count = returns.shape
+    window_count = row_count - match_length
+
+    # consecutive rows are contiguous, so every flattened window is a strided view of the matrix
+    flat = returns.reshape(-1)
+    window_size = match_length * symbol_count
+    windows = as_strided(
+        flat,
+        shape=(window_count, window_size),
+        strides=(symbol_count * flat.itemsize, flat.itemsize),
+        writeable=False,
+    )
+    curr_returns = flat[-window_size:]
+    dots = windows @ curr_returns
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return dots / np.sqrt(
+            np.maximum(window_norms, 0) * (curr_returns @ curr_returns)
+        )
+
+
+class WindowMatcher:
+    """
+    Computes the trailing returns of a set of symbols and the match score of every window in
+    them (see `window_match_scores`) for the current day of a data source.
+
+    In incremental mode the returns matrix and the norms of every window are kept between days.
+    When the data source has moved forward by one bar, only the new row of returns is fetched,
+    the oldest row is dropped, and a single new window norm is added, instead of recomputing
+    everything from `bar_count` bars of history. The dot products against the current window
+    still need one matrix-vector product per day because the current window changes every day.
+    The results are the same as the stateless computation up to floating point error.
+    """
+
+    def __init__(
+        self,
+        symbols: List[Equity],
+        bar_count: int,
+        match_length: int,
+        incremental: bool = False,
+    ):
+        """
+        :param symbols: the symbols to compute returns for
+        :param bar_count: the number of bars of prices the returns are computed from
+        :param match_length: the number of rows in each window
+        :param incremental: if True, keep state between days
+        """
+        self.symbols = symbols
+        self.bar_count = bar_count
+        self.match_length = match_length
+        self.incremental = incremental
+        self._returns = None
+        self._window_norms = None
+        self._start = 0
+        self._dates = None
+
+    def match(self, data_source: DataSource) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param data_source: the data source to get returns from
+        :return: a tuple of the (days, symbols) returns matrix, as from `get_pct_returns`, and the
+        match scores of its windows, as from `window_match_scores`
+        """
+        if self.incremental and self._returns is not None:
+            tail, dates = get_pct_returns_dated(self.symbols, "Close", 3, data_source)
+            if len(tail) == 2:
+                if dates[0] == self._dates[1]:
+                    self._append(tail[1])
+                    self._dates = (dates[0], dates[1])
+                    return self._scores()
+                if (dates[0], dates[1]) == self._dates:
+                    # the same day again, so only the current window changed
+                    self._returns[self._start + self._row_count - 1] = tail[1]
+                    return self._scores()
+
+        past_returns, dates = get_pct_returns_dated(
+            self.symbols, "Close", self.bar_count, data_source
+        )
+        match_scores = window_match_scores(past_returns, self.match_length)
+        self._returns = None
+        if (
+            self.incremental
+            and len(past_returns) == self._row_count
+            and len(match_scores) > 0
+        ):
+            # no rows were dropped, so the last two rows are consecutive days
+            self._reset(past_returns, match_scores, (dates[-2], dates[-1]))
+        return past_returns, match_scores
+
+    @property
+    def _row_count(self) -> int:
+        return self.bar_count - 1
+
+    def _reset(self, past_returns: np.ndarray, match_scores: np.ndarray, dates):
+        # Room for as many rows again so appends only shift the buffers every `_row_count` days
+        capacity = 2 * self._row_count
+        window_count = len(match_scores)
+        self._returns = np.empty((capacity, len(self.symbols)))
+        self._returns[: self._row_count] = past_returns
+        row_norms = np.einsum(
+            "ij,ij->i",
+            self._returns[: self._row_count],
+            self._returns[: self._row_count],
+        )
+        prefix = np.concatenate(([0.0], np.cumsum(row_norms)))
+        self._window_norms = np.empty(capacity)
+        self._window_norms[:window_count] = (
+            prefix[self.match_length : self.match_length + window_count]
+            - prefix[:window_count]
+        )
+        self._start = 0
+        self._dates = dates
+
+    def _append(self, row: np.ndarray):
+        window_count = self._row_count - self.match_length
+        if self._start + self._row_count == len(self._returns):
+            self._returns[: self._row_count] = self._returns[self._start :][
+                : self._row_count
+            ]
+            self._window_norms[:window_count] = self._window_norms[self._start :][
+                :window_count
+            ]
+            self._start = 0
+        # the current window becomes the newest window and the oldest window drops out
+        curr_returns = self._returns[self._start + window_count :][: self.match_length]
+        self._window_norms[self._start + window_count] = np.einsum(
+            "ij,ij->", curr_returns, curr_returns
+        )
+        self._returns[self._start + self._row_count] = row
+        self._start += 1
+
+    def _scores(self) -> Tuple[np.ndarray, np.ndarray]:
+        returns = self._returns[self._start : self._start + self._row_count]
+        window_norms = self._window_norms[self._start :][
+            : self._row_count - self.match_length
+        ]
+        return returns, _cosine_scores(returns, self.match_length, window_norms)
+
+
+class BatchedWindowMatcher:
+    """
+    Computes the returns and match scores of many (bar count, match length) pairs for the
+    current day of a data source. Pairs with the same match length share one `WindowMatcher`
+    over the longest of their bar counts: the windows of a shorter history are the most recent
+    windows of the longer one and are compared with the same current window, so their match
+    scores are the tail of the longer history's scores. On days with missing returns, the
+    tail is sized by the rows the shorter history keeps rather than by its bar count.
+    """
+
+    def __init__(
+        self,
+        symbols: List[Equity],
+        bar_counts: Sequence[int],
+        match_lengths: Sequence[int],
+        incremental: bool = False,
+    ):
+        """
+        :param symbols: the symbols to compute returns for
+        :param bar_counts: the number of bars of prices of each pair
+        :param match_lengths: the number of rows in each window of each pair
+        :param incremental: if True, keep state between days (see `WindowMatcher`)
+        """
+        assert len(bar_counts) == len(
+            match_lengths
+        ), "Need a match length per bar count"
+        self.symbols = symbols
+        self.pairs = list(zip(bar_counts, match_lengths))
+        longest: Dict[int, int] = dict()
+        for bar_count, match_length in self.pairs:
+            longest[match_length] = max(bar_count, longest.get(match_length, 0))
+        self._matchers = {
+            match_length: WindowMatcher(symbols, bar_count, match_length, incremental)
+            for match_length, bar_count in longest.items()
+        }
+
+    def match(self, data_source: DataSource) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        :param data_source: the data source to get returns from
+        :return: the returns matrix and match scores of each pair, as from `WindowMatcher.match`.
+        These are views of shared arrays, so they must not be modified.
+        """
+        matches = {
+            match_length: matcher.match(data_source)
+            for match_length, matcher in self._matchers.items()
+        }
+        results = list()
+        for bar_count, match_length in self.pairs:
+            past_returns, match_scores = matches[match_length]
+            row_count = bar_count - 1
+            if len(past_returns) < self._matchers[match_length]._row_count:
+                # rows with missing returns were dropped, so the last `row_count` rows reach
+                # back past the days of the shorter history. Its own rows are the rows of
+                # those days that weren't dropped.
+                row_count = len(
+                    get_pct_returns_matrix(
+                        self.symbols, "Close", bar_count, data_source
+                    )
+                )
+            row_count = min(row_count, len(past_returns))
+            window_count = max(row_count - match_length, 0)
+            results.append(
+                (
+                    past_returns[len(past_returns) - row_count :],
+                    match_scores[len(match_scores) - window_count :],
+                )
+            )
+        return results
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from data.alignedprices import FIELD_INDEX, AlignedPrices
+from data.data import PRICE_FIELDS
+
+
+def make_prices(close: np.ndarray) -> AlignedPrices:
+    """
+    :param close: a (days, tickers) array of closing prices, used for every field
+    """
+    trading_days = pd.bdate_range("2020-01-01", periods=close.shape[0])
+    bars = np.repeat(close[None], len(PRICE_FIELDS), axis=0)
+    bars[FIELD_INDEX["Open"]] = close * 1.01
+    tickers = [f"T{i}" for i in range(close.shape[1])]
+    return AlignedPrices(trading_days, np.ascontiguousarray(bars), tickers)
+
+
+def test_returns_span_missing_bars():
+    prices = make_prices(np.array([[np.nan, 10.0], [1.0, np.nan], [2.0, 12.0]]))
+    returns = prices.returns("Close")
+    assert np.isnan(returns[:2]).all()
+    np.testing.assert_allclose(returns[2], [1.0, 0.2])
+
+
+def test_last_prices_spans_missing_bars():
+    prices = make_prices(
+        np.array([[np.nan, 10.0, 5.0], [1.0, np.nan, 6.0], [np.nan, np.nan, 7.0]])
+    )
+    np.testing.assert_allclose(prices.last_prices("Close", 2, [0, 1, 2]), [1, 10, 7])
+    np.testing.assert_allclose(prices.last_prices("Close", 1, [2, 1]), [6, 10])
+    assert np.isnan(prices.last_prices("Close", 0, [0]))[0]
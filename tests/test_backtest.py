@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import synthetic_prices, synthetic_tickers
+from data.alignedprices import AlignedPrices
+from security import Equity
+
+pytest.importorskip("yfinance")
+
+from strategy.buy_and_hold import BuyAndHold  # noqa: E402
+from trading_environments.backtest_environment import run_open_close  # noqa: E402
+from trading_environments.profiler import Profiler  # noqa: E402
+
+
+def test_tear_sheet_aligns_a_benchmark_listed_after_the_start():
+    prices = synthetic_prices(2, 60)
+    bars = prices.bars.copy()
+    # the benchmark is only listed from the 30th day on
+    bars[:, :30, prices.column("SPY")] = np.nan
+    prices = AlignedPrices(prices.trading_days, bars, prices.tickers)
+    trading_days = prices.trading_days
+    tear_sheet = run_open_close(
+        BuyAndHold(synthetic_tickers(2)),
+        10000,
+        trading_days[20],
+        trading_days[-1],
+        plot_metrics=False,
+        log=False,
+        prices=prices,
+    )
+    assert (tear_sheet.index == trading_days[20:]).all()
+    assert tear_sheet["Benchmark Value"][:10].isna().all()
+    np.testing.assert_allclose(
+        tear_sheet["Benchmark Value"][10:],
+        prices.bars[3, 30:, prices.column("SPY")],
+    )
+
+
+def test_tear_sheet_with_another_benchmark():
+    prices = synthetic_prices(2, 60)
+    tickers = synthetic_tickers(2)
+    tear_sheet = run_open_close(
+        BuyAndHold(tickers[:1]),
+        10000,
+        prices.trading_days[10],
+        prices.trading_days[-1],
+        benchmark=Equity(tickers[1]),
+        plot_metrics=False,
+        log=False,
+        prices=prices,
+    )
+    assert len(tear_sheet) == 50
+
+
+def test_profiler_times_dated_returns():
+    # the covariance estimates of PatternMatching need scipy
+    pytest.importorskip("scipy")
+    from strategy.pattern_matching import PatternMatching
+
+    prices = synthetic_prices(3, 80)
+    profiler = Profiler()
+    run_open_close(
+        PatternMatching(synthetic_tickers(3), 30, 5),
+        10000,
+        prices.trading_days[40],
+        prices.trading_days[-1],
+        plot_metrics=False,
+        log=False,
+        prices=prices,
+        profiler=profiler,
+    )
+    summary = profiler.summary()
+    assert summary.loc["YahooBackTestDataSource.pct_returns_dated", "Calls"] == 40
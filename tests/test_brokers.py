@@ -0,0 +1,83 @@
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from broker.simulated import SimulatedBroker
+from broker.transparent import TransparentBroker
+from data.data import DataSource, Frequency
+from data.quotedata import QuoteData
+from security import Equity, Security
+
+
+class FixedPriceDataSource(DataSource):
+    """
+    A data source whose every field of every security is a fixed price
+    """
+
+    def __init__(self, prices: Dict[str, float]):
+        self.prices = prices
+
+    def price_history(
+        self,
+        security: Security,
+        frequency: Frequency = Frequency.DAY,
+        bar_count: Optional[int] = None,
+        approx_eod_close: bool = True,
+    ) -> pd.DataFrame:
+        price = self.prices[security.ticker]
+        return pd.DataFrame(
+            {field: [price] for field in ("Open", "High", "Low", "Close", "Volume")},
+            index=[pd.Timestamp("2020-01-02")],
+        )
+
+    def quote(self, security: Security) -> QuoteData:
+        raise NotImplementedError
+
+    def price_snapshot(
+        self, securities: Sequence[Security], field: str = "Close"
+    ) -> np.ndarray:
+        return np.array([self.prices[security.ticker] for security in securities])
+
+
+def test_rebalance_to_weights_folds_duplicate_securities():
+    data_source = FixedPriceDataSource({"AAA": 10.0, "SPY": 100.0})
+    broker = TransparentBroker(10000, data_source)
+    broker.rebalance_to_weights(
+        np.array([0.5, 0.25, 0.25]), [Equity("AAA"), Equity("SPY"), Equity("SPY")]
+    )
+    assert broker.positions == {Equity("AAA"): 500, Equity("SPY"): 50}
+    assert broker.liquid_value == 0
+    assert broker.get_portfolio_value() == 10000
+
+
+def test_rebalance_to_weights_matches_mapping_and_array():
+    data_source = FixedPriceDataSource({"AAA": 10.0, "BBB": 40.0})
+    securities = [Equity("AAA"), Equity("BBB")]
+    from_array = TransparentBroker(10000, data_source)
+    from_array.rebalance_to_weights(np.array([0.3, -0.2]), securities)
+    from_mapping = TransparentBroker(10000, data_source)
+    from_mapping.rebalance_to_weights(dict(zip(securities, [0.3, -0.2])))
+    assert (
+        from_array.positions
+        == from_mapping.positions
+        == {
+            Equity("AAA"): 300,
+            Equity("BBB"): -50,
+        }
+    )
+    assert from_array.liquid_value == from_mapping.liquid_value == 9000
+
+
+def test_simulated_rebalance_folds_duplicates_and_counts_pending_orders():
+    data_source = FixedPriceDataSource({"AAA": 10.0, "SPY": 100.0})
+    broker = SimulatedBroker(10000, data_source, volume_limit=None)
+    broker.place_order(Equity("AAA"), 200)
+    broker.rebalance_to_weights(
+        np.array([0.5, 0.25, 0.25]), [Equity("AAA"), Equity("SPY"), Equity("SPY")]
+    )
+    # the pending order for 200 AAA counts towards its target of 500
+    assert broker.open_orders == 3
+    broker.match()
+    assert broker.positions == {Equity("AAA"): 500, Equity("SPY"): 50}
+    assert broker.liquid_value == 0
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from trading_environments import metrics
+
+stats = pytest.importorskip("scipy.stats")
+
+
+def test_beta_alpha_matches_least_squares_and_skips_nan():
+    rng = np.random.default_rng(0)
+    benchmark = rng.normal(0, 0.01, 100)
+    returns = 1.5 * benchmark + 0.001 + rng.normal(0, 0.002, 100)
+    benchmark[3] = np.nan
+    returns[7] = np.nan
+    beta, alpha, correlation, _, _ = metrics.beta_alpha(benchmark, returns)
+    valid = ~(np.isnan(benchmark) | np.isnan(returns))
+    expected_beta, expected_alpha = np.polyfit(benchmark[valid], returns[valid], 1)
+    np.testing.assert_allclose([beta, alpha], [expected_beta, expected_alpha])
+    np.testing.assert_allclose(
+        correlation, np.corrcoef(benchmark[valid], returns[valid])[0, 1]
+    )
+
+
+def test_beta_alpha_matches_linregress():
+    rng = np.random.default_rng(1)
+    benchmark = rng.normal(0, 0.01, (50, 1))
+    returns = np.hstack([0.2 * benchmark, -benchmark]) + rng.normal(0, 0.01, (50, 2))
+    results = metrics.beta_alpha(benchmark[:, 0], returns)
+    for i in range(returns.shape[1]):
+        expected = stats.linregress(benchmark[:, 0], returns[:, i])
+        np.testing.assert_allclose(
+            [result[i] for result in results],
+            [
+                expected.slope,
+                expected.intercept,
+                expected.rvalue,
+                expected.pvalue,
+                expected.stderr,
+            ],
+        )
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from data.data import PRICE_FIELDS
+from data.minutebacktest import MinuteBackTestDataSource
+from data.pricestore import PriceStore
+from security import Equity
+
+
+def make_minutes(times: pd.DatetimeIndex, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 100 * np.cumprod(1 + rng.normal(0, 0.001, len(times)))
+    return pd.DataFrame(
+        {field: close for field in PRICE_FIELDS}, index=times, columns=PRICE_FIELDS
+    )
+
+
+def write_store(root) -> PriceStore:
+    store = PriceStore(str(root))
+    days = [pd.Timestamp("2024-01-02 09:30"), pd.Timestamp("2024-01-03 09:30")]
+    minutes = pd.DatetimeIndex(
+        [day + pd.Timedelta(minutes=i) for day in days for i in range(30)]
+    )
+    store.write("AAA", make_minutes(minutes, 0))
+    # BBB misses some minutes, so the securities only align on the others
+    store.write("BBB", make_minutes(minutes.delete([3, 4, 17, 31, 45]), 1))
+    return store
+
+
+def test_pct_returns_matches_pandas(tmp_path):
+    store = write_store(tmp_path)
+    securities = [Equity("AAA"), Equity("BBB")]
+    data_source = MinuteBackTestDataSource(pd.Timestamp("2024-01-02 09:30"), store)
+    for time in store.read("AAA").index:
+        data_source.curr_time = time
+        for bar_count in (5, 12, None):
+            histories = [
+                data_source.price_history(security, bar_count=bar_count)["Close"]
+                for security in securities
+            ]
+            expected = pd.concat(histories, axis=1, join="inner").pct_change().dropna()
+            returns = data_source.pct_returns(securities, "Close", bar_count)
+            assert np.allclose(returns.values, expected.values)
+            assert (returns.index == expected.index).all()
+            matrix, times = data_source.pct_returns_dated(
+                securities, "Close", bar_count
+            )
+            assert np.array_equal(matrix, returns.values)
+            assert np.array_equal(times, expected.index.values)
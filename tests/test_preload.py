@@ -0,0 +1,52 @@
+import pytest
+
+from benchmarks.synthetic import SyntheticFetcher
+from data.pricestore import PriceStore
+
+pytest.importorskip("yfinance")
+
+from data.yahoo import preload_universe  # noqa: E402
+
+SYMBOLS = [f"SYM{i}" for i in range(7)]
+
+
+def test_preload_universe_chunks_and_retries(tmp_path):
+    store = PriceStore(str(tmp_path))
+    fetcher = SyntheticFetcher(day_count=30, failures=1, missing=["SYM6"])
+    failed = preload_universe(
+        SYMBOLS, chunk_size=3, backoff=0, fetcher=fetcher, store=store, log=False
+    )
+    assert failed == ["SYM6"]
+    # three chunks plus one retry
+    assert len(fetcher.calls) == 4
+    assert all(len(symbols) <= 3 for symbols, _ in fetcher.calls)
+    for symbol in SYMBOLS[:6]:
+        assert store.row_count(symbol) == 30
+    assert not store.has("SYM6")
+
+
+def test_preload_universe_resumes(tmp_path):
+    store = PriceStore(str(tmp_path))
+    # the first chunk fails on every attempt, as if the run was interrupted
+    fetcher = SyntheticFetcher(day_count=30, failures=2)
+    failed = preload_universe(
+        SYMBOLS,
+        chunk_size=3,
+        max_workers=1,
+        retries=1,
+        backoff=0,
+        fetcher=fetcher,
+        store=store,
+        log=False,
+    )
+    assert sorted(failed) == SYMBOLS[:3]
+
+    fetcher = SyntheticFetcher(day_count=30)
+    failed = preload_universe(
+        SYMBOLS, chunk_size=3, fetcher=fetcher, store=store, log=False
+    )
+    assert failed == []
+    # symbols refreshed by the first run are skipped
+    assert sorted(symbol for symbols, _ in fetcher.calls for symbol in symbols) == (
+        SYMBOLS[:3]
+    )
@@ -0,0 +1,18 @@
+import pickle
+
+from security import Equity, Security, SecurityType
+
+
+def test_equities_are_interned():
+    equity = Equity("IWM")
+    assert Equity("IWM") is equity
+    assert Security.from_id(equity.id) is equity
+    assert pickle.loads(pickle.dumps(equity)) is equity
+
+
+def test_interning_is_per_class():
+    security = Security("QQQ", SecurityType.EQUITY)
+    equity = Equity("QQQ")
+    assert isinstance(equity, Equity)
+    assert equity is not security
+    assert Security("QQQ", SecurityType.EQUITY) is security
@@ -0,0 +1,71 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import SyntheticFetcher, synthetic_prices, synthetic_tickers
+from data.alignedprices import AlignedPrices
+from data.pricestore import PriceStore
+from security import Equity
+
+pytest.importorskip("yfinance")
+
+from data.stream import OPEN, TICK, StreamingDataSource, YahooQuoteFeed  # noqa: E402
+from data.yahoolive import YahooLiveDataSource  # noqa: E402
+from strategy.buy_and_hold import BuyAndHold  # noqa: E402
+from trading_environments.live_environment import run_replay  # noqa: E402
+
+
+def test_quote_feed_refreshes_history_once_a_day(tmp_path):
+    quotes = list()
+
+    def quote(symbol: str):
+        quotes.append(symbol)
+        return {"Close": 50.0 + len(quotes)}
+
+    async def stream():
+        with YahooLiveDataSource(
+            history_fetcher=SyntheticFetcher(day_count=30),
+            quote_fetcher=quote,
+            store=PriceStore(str(tmp_path)),
+        ) as data_source:
+            refreshes = list()
+            refresh = data_source._refresh
+
+            def counted_refresh(chunk):
+                refreshes.append(chunk)
+                refresh(chunk)
+
+            data_source._refresh = counted_refresh
+            feed = YahooQuoteFeed(["AAA", "BBB"], data_source)
+            events = [await feed._event(OPEN), await feed._event(TICK)]
+            # the next event on a new day refreshes the history again
+            feed._history_day -= pd.Timedelta(days=1)
+            events.append(await feed._event(TICK))
+            return refreshes, events
+
+    refreshes, events = asyncio.run(stream())
+    assert refreshes == [["AAA", "BBB"], ["AAA", "BBB"]]
+    assert len(quotes) == 6
+    # every event carries the quotes fetched for it
+    np.testing.assert_allclose(events[1].bars[3], [53, 54])
+
+
+def test_streaming_from_an_empty_history():
+    prices = synthetic_prices(2, 20)
+    history = AlignedPrices(
+        prices.trading_days[:0], prices.bars[:, :0].copy(), prices.tickers
+    )
+    data_source = StreamingDataSource(history)
+    assert data_source.curr_index == -1
+    data_source.start_day(prices.trading_days[0])
+    assert data_source.curr_index == 0
+    results = run_replay(
+        [BuyAndHold(synthetic_tickers(2))],
+        10000,
+        prices,
+        prices.trading_days[0],
+        prices.trading_days[-1],
+    )
+    assert len(results[0].equity) == 20
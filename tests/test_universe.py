@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from data.alignedprices import AlignedPrices
+from data.data import PRICE_FIELDS
+from universe import Universe
+
+
+def make_universe() -> Universe:
+    return Universe(
+        ["MSFT", "XOM", "AAPL", "BRK.B", "CVX"],
+        ["Tech", "Energy", "Tech", "Financials", "Energy"],
+    )
+
+
+def test_symbols_are_grouped_by_sector():
+    universe = make_universe()
+    assert universe.symbols == ["CVX", "XOM", "BRK-B", "AAPL", "MSFT"]
+    assert universe.sector_symbols("Tech") == ["AAPL", "MSFT"]
+    assert universe.id("BRK.B") == 2
+    assert [security.ticker for security in universe.securities] == universe.symbols
+
+
+def test_sector_neutral_demeans_each_sector():
+    weights = np.array([0.1, 0.3, 0.5, 0.2, -0.2])
+    neutral = make_universe().sector_neutral(weights)
+    np.testing.assert_allclose(neutral, [-0.1, 0.1, 0.0, 0.2, -0.2])
+
+
+def test_columns_follow_aligned_prices():
+    # prices hold the tickers in a different order than the universe
+    tickers = ["SPY", "MSFT", "XOM", "AAPL", "CVX"]
+    days = pd.bdate_range("2020-01-01", periods=2)
+    prices = AlignedPrices(days, np.ones((len(PRICE_FIELDS), 2, 5)), tickers)
+    universe = make_universe()
+    np.testing.assert_array_equal(universe.columns(prices), [4, 2, -1, 3, 1])
+    np.testing.assert_array_equal(universe.columns(prices, "Tech"), [3, 1])
+
+
+def test_subset_keeps_sectors():
+    subset = make_universe().subset(["MSFT", "XOM"])
+    assert subset.symbols == ["XOM", "MSFT"]
+    assert subset.sectors == ["Energy", "Tech"]
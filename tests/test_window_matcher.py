@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from tests.test_aligned_prices import make_prices
+
+pytest.importorskip("yfinance")
+
+from data.yahoobacktest import YahooBackTestDataSource  # noqa: E402
+from security import Equity  # noqa: E402
+from strategy.util import BatchedWindowMatcher, WindowMatcher  # noqa: E402
+
+
+def test_incremental_matches_stateless():
+    rng = np.random.default_rng(0)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (120, 3)), axis=0))
+    close[70, 1] = np.nan
+    prices = make_prices(close)
+    symbols = [Equity("T0"), Equity("T1"), Equity("T2")]
+    stateless = WindowMatcher(symbols, 30, 5)
+    incremental = WindowMatcher(symbols, 30, 5, incremental=True)
+    data_source = YahooBackTestDataSource(prices.trading_days[0], prices)
+    for day_index in range(40, 120):
+        data_source.curr_index = day_index
+        for is_open in (True, False):
+            data_source.is_open = is_open
+            expected_returns, expected_scores = stateless.match(data_source)
+            returns, scores = incremental.match(data_source)
+            np.testing.assert_allclose(returns, expected_returns)
+            np.testing.assert_allclose(scores, expected_scores, atol=1e-12)
+
+
+def test_batched_matches_standalone_with_dropped_rows():
+    rng = np.random.default_rng(1)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (120, 3)), axis=0))
+    close[70, 1] = np.nan
+    close[95, 2] = np.nan
+    prices = make_prices(close)
+    symbols = [Equity("T0"), Equity("T1"), Equity("T2")]
+    pairs = [(40, 5), (20, 5), (30, 3), (12, 3)]
+    batched = BatchedWindowMatcher(
+        symbols,
+        [bar_count for bar_count, _ in pairs],
+        [match_length for _, match_length in pairs],
+    )
+    standalone = [WindowMatcher(symbols, *pair) for pair in pairs]
+    data_source = YahooBackTestDataSource(prices.trading_days[0], prices)
+    for day_index in range(45, 120):
+        data_source.curr_index = day_index
+        for (returns, scores), matcher in zip(batched.match(data_source), standalone):
+            expected_returns, expected_scores = matcher.match(data_source)
+            np.testing.assert_allclose(returns, expected_returns)
+            np.testing.assert_allclose(scores, expected_scores, atol=1e-12)
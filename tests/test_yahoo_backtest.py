@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from tests.test_aligned_prices import make_prices
+
+pytest.importorskip("yfinance")
+
+from broker.transparent import TransparentBroker  # noqa: E402
+from data.yahoobacktest import YahooBackTestDataSource  # noqa: E402
+from security import Equity  # noqa: E402
+
+
+def test_returns_at_open_span_missing_bars():
+    close = np.array([[10.0, 20.0], [np.nan, 22.0], [12.0, 24.0], [13.0, 26.0]])
+    prices = make_prices(close)
+    data_source = YahooBackTestDataSource(prices.trading_days[2], prices)
+    data_source.is_open = True
+    returns = data_source.pct_returns_matrix([Equity("T0"), Equity("T1")], "Close", 3)
+    # the current day's return is the open relative to the last close before it
+    np.testing.assert_allclose(returns[-1], [12.12 / 10 - 1, 24.24 / 22 - 1])
+
+
+def test_returns_at_open_on_first_day_have_no_lookahead():
+    prices = make_prices(np.array([[10.0], [11.0], [12.0]]))
+    data_source = YahooBackTestDataSource(prices.trading_days[0], prices)
+    data_source.is_open = True
+    returns = data_source.pct_returns([Equity("T0")], "Close", 2)
+    assert len(returns) == 0
+
+
+def test_snapshot_values_a_gap_at_the_last_close():
+    close = np.array([[10.0, 20.0], [11.0, np.nan], [np.nan, np.nan], [13.0, 26.0]])
+    prices = make_prices(close)
+    data_source = YahooBackTestDataSource(prices.trading_days[0], prices)
+    securities = [Equity("T0"), Equity("T1")]
+    broker = TransparentBroker(1000, data_source)
+    broker.place_order(Equity("T1"), 10)
+    data_source.curr_index = 2
+    np.testing.assert_allclose(data_source.price_snapshot(securities), [11, 20])
+    np.testing.assert_allclose(data_source.price_snapshot(securities, "Volume"), [0, 0])
+    assert broker.get_portfolio_value() == 1000
+    data_source.is_open = True
+    np.testing.assert_allclose(data_source.price_snapshot(securities), [11, 20])
+    data_source.curr_index = 3
+    np.testing.assert_allclose(data_source.price_snapshot(securities), [13.13, 26.26])
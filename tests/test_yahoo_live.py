@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from benchmarks.synthetic import SyntheticFetcher
+from data.pricestore import PriceStore
+from security import Equity
+
+pytest.importorskip("yfinance")
+
+from data.yahoolive import YahooLiveDataSource  # noqa: E402
+
+
+def quote(symbol: str):
+    if symbol == "DOWN":
+        raise ConnectionError("Quote failed")
+    return {"Close": 50.0}
+
+
+def test_quote_errors_are_recorded(tmp_path):
+    async def fetch():
+        with YahooLiveDataSource(
+            retries=0,
+            history_fetcher=SyntheticFetcher(day_count=30),
+            quote_fetcher=quote,
+            store=PriceStore(str(tmp_path)),
+        ) as data_source:
+            await data_source.wait([Equity("UP"), Equity("DOWN")])
+            return data_source
+
+    data_source = asyncio.run(fetch())
+    assert list(data_source.errors) == ["DOWN"]
+    assert data_source.price_history(Equity("UP"))["Close"].iloc[-1] == 50
+    # the history of a symbol without a quote ends at its last stored bar
+    assert len(data_source.price_history(Equity("DOWN"))) == 30
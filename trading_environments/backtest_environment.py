@@ -1,16 +1,42 @@
-import math
+import warnings
+from contextlib import nullcontext
 from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
 
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import seaborn as sns
-from scipy import stats
 
 from broker.transparent import TransparentBroker
+from data.alignedprices import AlignedPrices
 from data.yahoo import YahooDataSource
 from data.yahoobacktest import YahooBackTestDataSource
 from security import Equity
 from strategy.strategy import OpenCloseStrategy
+from trading_environments import metrics
+from trading_environments.profiler import (
+    BROKER_METHODS,
+    DATA_SOURCE_METHODS,
+    STRATEGY_METHODS,
+    Profiler,
+)
+
+
+class BacktestResult(NamedTuple):
+    """
+    The compact result of `evaluate_open_close`. `equity` is the portfolio value at the close
+    of each trading day and `daily_returns` its percent change (NaN on the first day). The
+    Sharpe ratio is annualized over the whole backtest, while the mean rolling Sharpe ratio is
+    the mean of the 180 day rolling Sharpe ratio of the tear sheet.
+    """
+
+    trading_days: np.ndarray
+    equity: np.ndarray
+    daily_returns: np.ndarray
+    cumulative_return: float
+    sharpe_ratio: float
+    mean_rolling_sharpe_ratio: float
+    daily_return_std: float
+    max_drawdown: float
 
 
 def run_open_close(
@@ -21,151 +47,319 @@ def run_open_close(
     benchmark: Equity = Equity("SPY"),
     plot_metrics: bool = True,
     log: bool = True,
+    prices: Optional[AlignedPrices] = None,
+    profiler: Optional[Profiler] = None,
 ) -> pd.DataFrame:
-    yahoo_datasource = YahooDataSource()
+    return run_open_close_many(
+        [strategy],
+        initial_capital,
+        start_date,
+        end_date,
+        benchmark=benchmark,
+        plot_metrics=plot_metrics,
+        log=log,
+        prices=prices,
+        profiler=profiler,
+    )[0]
+
+
+def run_open_close_many(
+    strategies: List[OpenCloseStrategy],
+    initial_capital: float,
+    start_date: datetime,
+    end_date: datetime,
+    benchmark: Equity = Equity("SPY"),
+    plot_metrics: bool = True,
+    log: bool = True,
+    prices: Optional[AlignedPrices] = None,
+    profiler: Optional[Profiler] = None,
+) -> List[pd.DataFrame]:
+    """
+    Backtests many strategies side by side in one pass over the trading calendar. The price
+    data and calendar are prepared once and shared, and every strategy trades through its own
+    broker, so this is equivalent to but faster than calling `run_open_close` per strategy.
+    To compare parameter sets, pass one instance of the strategy per set of parameters.
+    :param profiler: if given, times the strategy hooks, data source queries, and broker
+    calls of the run (see `Profiler`)
+    :return: the tear sheet of each strategy
+    """
+    active_trading_days, portfolio_values, data_source = _simulate(
+        strategies, initial_capital, start_date, end_date, log, prices, profiler
+    )
+
+    if log:
+        print("Calculating tear sheet")
+    benchmark_value = data_source.price_history(
+        benchmark, bar_count=len(active_trading_days)
+    )["Close"]
+    tear_sheets = _tear_sheets(active_trading_days, portfolio_values, benchmark_value)
+    if plot_metrics:
+        if log:
+            print("Plotting metrics")
+        for strategy, tear_sheet in zip(strategies, tear_sheets):
+            _plot_tear_sheet(tear_sheet, strategy.name)
+    return tear_sheets
+
+
+def evaluate_open_close(
+    strategy: OpenCloseStrategy,
+    initial_capital: float,
+    start_date: datetime,
+    end_date: datetime,
+    prices: Optional[AlignedPrices] = None,
+) -> BacktestResult:
+    """
+    A lean version of `run_open_close` for optimizers: no logging, plotting, or tear sheet
+    """
+    return evaluate_open_close_many(
+        [strategy], initial_capital, start_date, end_date, prices
+    )[0]
+
+
+def evaluate_open_close_many(
+    strategies: List[OpenCloseStrategy],
+    initial_capital: float,
+    start_date: datetime,
+    end_date: datetime,
+    prices: Optional[AlignedPrices] = None,
+) -> List[BacktestResult]:
+    """
+    A lean version of `run_open_close_many` for optimizers: no logging, plotting, or tear sheets
+    :return: the result of each strategy
+    """
+    active_trading_days, portfolio_values, _ = _simulate(
+        strategies, initial_capital, start_date, end_date, False, prices
+    )
+    return backtest_results(active_trading_days, portfolio_values)
+
+
+def backtest_results(
+    trading_days: pd.DatetimeIndex, portfolio_values: np.ndarray
+) -> List[BacktestResult]:
+    """
+    Summarizes the daily portfolio values of many strategies
+    :param trading_days: the day of each row of `portfolio_values`
+    :param portfolio_values: a (days, strategies) array of end of day portfolio values
+    :return: the result of each strategy
+    """
+    daily_returns = metrics.daily_returns(portfolio_values)
+    cumulative_returns = metrics.cumulative_returns(portfolio_values)[-1]
+    max_drawdowns = metrics.max_drawdown(portfolio_values)
+    rolling_sharpe = metrics.rolling_sharpe(daily_returns, 180)
+    with warnings.catch_warnings():
+        # strategies that never trade or runs shorter than the Sharpe window give NaNs
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        mean_rolling_sharpe = np.nanmean(rolling_sharpe, axis=0)
+        daily_return_std = np.nanstd(daily_returns, axis=0, ddof=1)
+        sharpe = (
+            (np.nanmean(daily_returns, axis=0) - metrics.DAILY_RISK_FREE_RATE)
+            / np.nanstd(daily_returns, axis=0)
+            * np.sqrt(metrics.TRADING_DAYS_PER_YEAR)
+        )
+    trading_days = pd.DatetimeIndex(trading_days).values
+    return [
+        BacktestResult(
+            trading_days,
+            portfolio_values[:, i],
+            daily_returns[:, i],
+            float(cumulative_returns[i]),
+            float(sharpe[i]),
+            float(mean_rolling_sharpe[i]),
+            float(daily_return_std[i]),
+            float(max_drawdowns[i]),
+        )
+        for i in range(portfolio_values.shape[1])
+    ]
+
+
+def _simulate(
+    strategies: List[OpenCloseStrategy],
+    initial_capital: float,
+    start_date: datetime,
+    end_date: datetime,
+    log: bool,
+    prices: Optional[AlignedPrices],
+    profiler: Optional[Profiler] = None,
+) -> Tuple[pd.DatetimeIndex, np.ndarray, YahooBackTestDataSource]:
+    if prices is None:
+        prices = AlignedPrices(YahooDataSource().price_history(Equity("SPY")).index)
 
     # Get the first valid trading day since start_date
-    trading_days = yahoo_datasource.price_history(Equity("SPY")).index
+    trading_days = prices.trading_days
     start_index = 0
     for start_index, trading_day in enumerate(trading_days):
         if trading_day >= start_date:
             break
 
-    # Broker & Data Source
-    data_source = YahooBackTestDataSource(trading_days[start_index])
-    broker = TransparentBroker(initial_capital, data_source)
+    # Brokers & Data Source
+    data_source = YahooBackTestDataSource(trading_days[start_index], prices)
+    brokers = [TransparentBroker(initial_capital, data_source) for _ in strategies]
 
     # Metrics
-    active_trading_days = list()
-    portfolio_value = list()
+    end_index = max(int(trading_days.searchsorted(end_date, side="right")), start_index)
+    portfolio_values = np.empty((end_index - start_index, len(strategies)))
+
+    if profiler is not None:
+        profiler.instrument(data_source, DATA_SOURCE_METHODS)
+        for broker in brokers:
+            profiler.instrument(broker, BROKER_METHODS)
+        for strategy in strategies:
+            profiler.instrument(strategy, STRATEGY_METHODS, strategy.name)
+    try:
+        with profiler.section("backtest") if profiler is not None else nullcontext():
+            _trade(
+                strategies,
+                brokers,
+                data_source,
+                start_index,
+                end_index,
+                portfolio_values,
+                log,
+                profiler,
+            )
+    finally:
+        if profiler is not None:
+            profiler.restore()
+
+    if log:
+        print("Done trading")
+        for strategy, broker in zip(strategies, brokers):
+            print(f"{strategy.name} Final Positions:")
+            for symbol, quantity in broker.positions.items():
+                print(f"\t{symbol.ticker}: {quantity}")
+            print(f"Final Portfolio Value: ${broker.get_portfolio_value():.2f}")
+            print(f"Portfolio Liquid Capital: ${broker.liquid_capital:.2f}")
+
+    active_trading_days = trading_days[start_index:end_index]
+    return active_trading_days, portfolio_values, data_source
 
-    # Start Trading
+
+def _trade(
+    strategies: List[OpenCloseStrategy],
+    brokers: List[TransparentBroker],
+    data_source: YahooBackTestDataSource,
+    start_index: int,
+    end_index: int,
+    portfolio_values: np.ndarray,
+    log: bool,
+    profiler: Optional[Profiler] = None,
+):
+    trading_days = data_source.prices.trading_days
     if log:
         print("Starting trades")
-    for date_index in range(start_index, len(trading_days)):
+    for date_index in range(start_index, end_index):
         curr_day = trading_days[date_index]
-        if curr_day > end_date:
-            break
 
         if log:
             if date_index % 50 == 0:
                 print(f"Trading on day: {curr_day}")
+        if profiler is not None:
+            profiler.start_day(curr_day)
 
-        data_source.curr_date = curr_day
+        data_source.curr_index = date_index
 
         data_source.is_open = True
-        strategy.on_open(broker, data_source)
+        for strategy, broker in zip(strategies, brokers):
+            strategy.on_open(broker, data_source)
         data_source.is_open = False
-        strategy.before_close(broker, data_source)
+        for strategy, broker in zip(strategies, brokers):
+            strategy.before_close(broker, data_source)
 
-        active_trading_days.append(curr_day)
-        portfolio_value.append(broker.get_portfolio_value())
+        for i, broker in enumerate(brokers):
+            portfolio_values[date_index - start_index, i] = broker.get_portfolio_value()
 
-    if log:
-        print("Done trading")
-        print("Final Positions:")
-        for symbol, quantity in broker.positions.items():
-            print(f"\t{symbol.ticker}: {quantity}")
-        print(f"Final Portfolio Value: ${broker.get_portfolio_value():.2f}")
-        print(f"Portfolio Liquid Capital: ${broker.liquid_capital:.2f}")
 
-    if log:
-        print("Calculating tear sheet")
-    tear_sheet = pd.DataFrame(index=active_trading_days)
-    benchmark_value = yahoo_datasource.price_history(benchmark)[start_date:end_date][
-        "Close"
-    ]
-    tear_sheet["Portfolio Value"] = portfolio_value
-    tear_sheet["Benchmark Value"] = benchmark_value
+def _tear_sheets(
+    active_trading_days: pd.DatetimeIndex,
+    portfolio_values: np.ndarray,
+    benchmark_value: pd.Series,
+) -> List[pd.DataFrame]:
+    # the benchmark may have fewer days (e.g. it was listed after the start), so align by date
+    benchmark_value = benchmark_value.reindex(active_trading_days)
+    # compute the metrics of every portfolio and the benchmark at once
+    values = np.column_stack([portfolio_values, benchmark_value.values])
+    cumulative_returns = metrics.cumulative_returns(values)
+    daily_returns = metrics.daily_returns(values)
+    sharpe_ratios = metrics.rolling_sharpe(daily_returns, 180)
 
-    tear_sheet["Portfolio Cumulative Returns"] = (
-        tear_sheet["Portfolio Value"] / tear_sheet["Portfolio Value"][0] - 1
-    )
-    tear_sheet["Benchmark Cumulative Returns"] = (
-        tear_sheet["Benchmark Value"] / tear_sheet["Benchmark Value"][0] - 1
-    )
+    tear_sheets = list()
+    for i in range(portfolio_values.shape[1]):
+        tear_sheet = pd.DataFrame(index=active_trading_days)
+        tear_sheet["Portfolio Value"] = values[:, i]
+        tear_sheet["Benchmark Value"] = values[:, -1]
+        tear_sheet["Portfolio Cumulative Returns"] = cumulative_returns[:, i]
+        tear_sheet["Benchmark Cumulative Returns"] = cumulative_returns[:, -1]
+        tear_sheet["Portfolio Daily Returns"] = daily_returns[:, i]
+        tear_sheet["Benchmark Daily Returns"] = daily_returns[:, -1]
+        tear_sheet["Portfolio Sharpe Ratio"] = sharpe_ratios[:, i]
+        tear_sheet["Benchmark Sharpe Ratio"] = sharpe_ratios[:, -1]
+        tear_sheets.append(tear_sheet)
+    return tear_sheets
 
-    tear_sheet["Portfolio Daily Returns"] = tear_sheet["Portfolio Value"].pct_change()
-    tear_sheet["Benchmark Daily Returns"] = tear_sheet["Benchmark Value"].pct_change()
-
-    time_period = 180
-    risk_free_rate = (1 + 0.12 / 100)**(1 / 252) - 1
-    tear_sheet["Portfolio Sharpe Ratio"] = (
-        tear_sheet["Portfolio Daily Returns"]
-        .rolling(time_period)
-        .apply(lambda x: (x.mean() - risk_free_rate) / x.std(), raw=True)
-    ) * math.sqrt(252)
-    tear_sheet["Benchmark Sharpe Ratio"] = (
-        tear_sheet["Benchmark Daily Returns"]
-        .rolling(time_period)
-        .apply(lambda x: (x.mean() - risk_free_rate) / x.std(), raw=True)
-    ) * math.sqrt(252)
 
-    if plot_metrics:
-        if log:
-            print("Plotting metrics")
-        fig, axs = plt.subplots(2, 2)
-        fig.set_size_inches(10, 10)
-        fig.suptitle(strategy.name, fontsize=16)
-
-        # Plot portfolio vs benchmark cumulative returns
-        tear_sheet["Portfolio Cumulative Returns"].plot(ax=axs[0, 0])
-        tear_sheet["Benchmark Cumulative Returns"].plot(ax=axs[0, 0])
-        portfolio_cumulative_returns = tear_sheet["Portfolio Cumulative Returns"][-1]
-        benchmark_cumulative_returns = tear_sheet["Benchmark Cumulative Returns"][-1]
-        axs[0, 0].legend(
-            [
-                f"Portfolio cumulative returns: {portfolio_cumulative_returns:.3f}",
-                f"Benchmark cumulative returns: {benchmark_cumulative_returns:.3f}",
-            ]
-        )
-        axs[0, 0].set_title("Cumulative Returns")
-
-        # Plot estimated portfolio annual returns
-        annual_returns = (
-            tear_sheet["Portfolio Daily Returns"]
-            .dropna()
-            .expanding(180)
-            .apply(lambda x: (1 + x.mean()) ** 252 - 1, raw=True)
-        )
-        annual_returns.name = "Estimated Annual Returns"
-        annual_returns.dropna(inplace=True)
-        annual_returns.plot(ax=axs[0, 1])
-        axs[0, 1].legend([f"Average: {annual_returns.mean():.3f}"])
-        axs[0, 1].set_title("Estimated Annual Returns")
-
-        # Plot portfolio vs benchmark daily returns
-        beta, alpha, corr_coef, p_val, stderr = stats.linregress(
-            tear_sheet["Benchmark Daily Returns"].dropna(),
-            tear_sheet["Portfolio Daily Returns"].dropna(),
-        )
-        sns.regplot(
-            x=tear_sheet["Benchmark Daily Returns"],
-            y=tear_sheet["Portfolio Daily Returns"],
-            ax=axs[1, 0],
-        )
-        axs[1, 0].set_title("Daily Returns")
-        axs[1, 0].legend(
-            [
-                f"β = {beta:.3f}, α = {alpha:.3f}, r^2 = {corr_coef**2:.3f}, p = {p_val:.3f}, std err = {stderr:.3f}",
-            ]
-        )
+def _plot_tear_sheet(tear_sheet: pd.DataFrame, name: str):
+    # plotting libraries are slow to import, so only load them when plotting
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
-        # Plot portfolio and benchmark Sharpe ratios
-        tear_sheet["Portfolio Sharpe Ratio"].plot(ax=axs[1, 1])
-        tear_sheet["Benchmark Sharpe Ratio"].plot(ax=axs[1, 1])
-        portfolio_avg_sr = tear_sheet["Portfolio Sharpe Ratio"].mean()
-        benchmark_avg_sr = tear_sheet["Benchmark Sharpe Ratio"].mean()
-        portfolio_total_sharpe = tear_sheet["Portfolio Sharpe Ratio"][-1]
-        benchmark_total_sharpe = tear_sheet["Benchmark Sharpe Ratio"][-1]
-        axs[1, 1].legend(
-            [
-                f"Portfolio avg SR: {portfolio_avg_sr:.3f} - Final: {portfolio_total_sharpe:.3f}",
-                f"Benchmark avg SR: {benchmark_avg_sr:.3f} - Final: {benchmark_total_sharpe:.3f}",
-            ]
-        )
-        axs[1, 1].set_title("Sharpe Ratio")
+    fig, axs = plt.subplots(2, 2)
+    fig.set_size_inches(10, 10)
+    fig.suptitle(name, fontsize=16)
 
-        plt.show()
+    # Plot portfolio vs benchmark cumulative returns
+    tear_sheet["Portfolio Cumulative Returns"].plot(ax=axs[0, 0])
+    tear_sheet["Benchmark Cumulative Returns"].plot(ax=axs[0, 0])
+    portfolio_cumulative_returns = tear_sheet["Portfolio Cumulative Returns"][-1]
+    benchmark_cumulative_returns = tear_sheet["Benchmark Cumulative Returns"][-1]
+    axs[0, 0].legend(
+        [
+            f"Portfolio cumulative returns: {portfolio_cumulative_returns:.3f}",
+            f"Benchmark cumulative returns: {benchmark_cumulative_returns:.3f}",
+        ]
+    )
+    axs[0, 0].set_title("Cumulative Returns")
+
+    # Plot estimated portfolio annual returns
+    annual_returns = pd.Series(
+        metrics.expanding_annual_returns(tear_sheet["Portfolio Daily Returns"], 180),
+        index=tear_sheet.index,
+        name="Estimated Annual Returns",
+    )
+    annual_returns.dropna(inplace=True)
+    annual_returns.plot(ax=axs[0, 1])
+    axs[0, 1].legend([f"Average: {annual_returns.mean():.3f}"])
+    axs[0, 1].set_title("Estimated Annual Returns")
+
+    # Plot portfolio vs benchmark daily returns
+    beta, alpha, corr_coef, p_val, stderr = metrics.beta_alpha(
+        tear_sheet["Benchmark Daily Returns"].values,
+        tear_sheet["Portfolio Daily Returns"].values,
+    )
+    sns.regplot(
+        x=tear_sheet["Benchmark Daily Returns"],
+        y=tear_sheet["Portfolio Daily Returns"],
+        ax=axs[1, 0],
+    )
+    axs[1, 0].set_title("Daily Returns")
+    axs[1, 0].legend(
+        [
+            f"β = {beta:.3f}, α = {alpha:.3f}, r^2 = {corr_coef**2:.3f}, p = {p_val:.3f}, std err = {stderr:.3f}",
+        ]
+    )
+
+    # Plot portfolio and benchmark Sharpe ratios
+    tear_sheet["Portfolio Sharpe Ratio"].plot(ax=axs[1, 1])
+    tear_sheet["Benchmark Sharpe Ratio"].plot(ax=axs[1, 1])
+    portfolio_avg_sr = tear_sheet["Portfolio Sharpe Ratio"].mean()
+    benchmark_avg_sr = tear_sheet["Benchmark Sharpe Ratio"].mean()
+    portfolio_total_sharpe = tear_sheet["Portfolio Sharpe Ratio"][-1]
+    benchmark_total_sharpe = tear_sheet["Benchmark Sharpe Ratio"][-1]
+    axs[1, 1].legend(
+        [
+            f"Portfolio avg SR: {portfolio_avg_sr:.3f} - Final: {portfolio_total_sharpe:.3f}",
+            f"Benchmark avg SR: {benchmark_avg_sr:.3f} - Final: {benchmark_total_sharpe:.3f}",
+        ]
+    )
+    axs[1, 1].set_title("Sharpe Ratio")
 
-    return tear_sheet
+    plt.show()
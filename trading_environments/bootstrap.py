@@ -0,0 +1,361 @@
+"""
+Monte Carlo robustness testing of strategies on resampled price paths.
+
+Synthetic paths are built by resampling whole days of the realized history, so each day keeps
+its cross-sectional structure (every ticker moves together as it did that day) and its bar
+shape (open, high, and low relative to the close). Days are drawn in blocks to keep some of
+the serial dependence of returns: fixed length blocks for the block bootstrap, and blocks of
+geometrically distributed length for the stationary bootstrap (Politis & Romano, 1994).
+
+Paths are generated and evaluated in chunks, so memory stays bounded by the chunk size no
+matter how many paths are run.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Type
+
+import numpy as np
+import pandas as pd
+
+from data.alignedprices import FIELD_INDEX, AlignedPrices
+from strategy.strategy import OpenCloseStrategy
+from trading_environments import metrics
+from trading_environments.backtest_environment import evaluate_open_close_many
+from trading_environments.sweep import ParameterSweep
+
+BLOCK = "block"
+STATIONARY = "stationary"
+
+
+def block_bootstrap_indices(
+    rng: np.random.Generator,
+    day_count: int,
+    path_length: int,
+    path_count: int,
+    block_length: int,
+) -> np.ndarray:
+    """
+    Draws paths of day indices made of consecutive blocks of `block_length` days, wrapping
+    around the end of the history
+    :return: a (path_count, path_length) array of indices into the `day_count` source days
+    """
+    block_count = -(-path_length // block_length)
+    starts = rng.integers(0, day_count, (path_count, block_count))
+    indices = (starts[:, :, None] + np.arange(block_length)) % day_count
+    return indices.reshape(path_count, -1)[:, :path_length]
+
+
+def stationary_bootstrap_indices(
+    rng: np.random.Generator,
+    day_count: int,
+    path_length: int,
+    path_count: int,
+    mean_block_length: float,
+) -> np.ndarray:
+    """
+    Draws paths of day indices made of blocks whose lengths are geometrically distributed
+    with mean `mean_block_length`, wrapping around the end of the history
+    :return: a (path_count, path_length) array of indices into the `day_count` source days
+    """
+    new_block = rng.random((path_count, path_length)) < 1 / mean_block_length
+    new_block[:, 0] = True
+    starts = rng.integers(0, day_count, (path_count, path_length))
+    positions = np.arange(path_length)
+    # the position where the block of each day started
+    block_starts = np.maximum.accumulate(np.where(new_block, positions, 0), axis=1)
+    first_days = np.take_along_axis(starts, block_starts, axis=1)
+    return (first_days + positions - block_starts) % day_count
+
+
+class BootstrapResult(NamedTuple):
+    """
+    The distributions of the metrics of a strategy over every resampled path
+    """
+
+    final_returns: np.ndarray
+    sharpe_ratios: np.ndarray
+    max_drawdowns: np.ndarray
+
+    def summary(self, quantiles: Sequence[float] = (0.05, 0.25, 0.5, 0.75, 0.95)):
+        """
+        :return: the mean and quantiles of every metric
+        """
+        columns = {
+            "Final Return": self.final_returns,
+            "Sharpe Ratio": self.sharpe_ratios,
+            "Max Drawdown": self.max_drawdowns,
+        }
+        summary = pd.DataFrame(
+            {
+                name: [np.nanmean(values)] + list(np.nanquantile(values, quantiles))
+                for name, values in columns.items()
+            },
+            index=["mean"] + [f"{quantile:.0%}" for quantile in quantiles],
+        )
+        return summary
+
+
+class PathResampler:
+    """
+    Resamples the daily bars of a set of tickers into synthetic price paths
+    """
+
+    def __init__(
+        self,
+        prices: AlignedPrices,
+        tickers: Sequence[str],
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        method: str = STATIONARY,
+        block_length: float = 20,
+    ):
+        """
+        :param prices: the realized prices to resample
+        :param tickers: the tickers of the paths
+        :param start_date: the first day to resample from (defaults to the first day)
+        :param end_date: the last day to resample from (defaults to the last day)
+        :param method: either `BLOCK` or `STATIONARY`
+        :param block_length: the (mean) number of consecutive days per block
+        """
+        assert method in (BLOCK, STATIONARY), f"Unknown bootstrap method {method}"
+        self.tickers = list(tickers)
+        self.method = method
+        self.block_length = block_length
+        columns = [prices.column(ticker) for ticker in self.tickers]
+        assert None not in columns, "Every ticker must be in the prices"
+
+        bars = prices.bars[:, :, columns]
+        close = bars[FIELD_INDEX["Close"]]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # every day as its close to close return plus its bar relative to its close
+            days = np.stack(
+                [
+                    bars[FIELD_INDEX["Open"]] / close,
+                    bars[FIELD_INDEX["High"]] / close,
+                    bars[FIELD_INDEX["Low"]] / close,
+                    prices.returns("Close")[:, columns],
+                    bars[FIELD_INDEX["Volume"]],
+                ]
+            )
+        valid = np.isfinite(days).all(axis=(0, 2))
+        trading_days = prices.trading_days
+        if start_date is not None:
+            valid &= trading_days >= start_date
+        if end_date is not None:
+            valid &= trading_days <= end_date
+        assert valid.sum() > 0, "No day has a bar for every ticker"
+        self._days = np.ascontiguousarray(days[:, valid])
+        self._first_close = close[np.argmax(valid)]
+        self.day_count = self._days.shape[1]
+
+    def indices(
+        self, rng: np.random.Generator, path_length: int, path_count: int
+    ) -> np.ndarray:
+        """
+        :return: a (path_count, path_length) array of resampled source days
+        """
+        if self.method == BLOCK:
+            return block_bootstrap_indices(
+                rng, self.day_count, path_length, path_count, int(self.block_length)
+            )
+        return stationary_bootstrap_indices(
+            rng, self.day_count, path_length, path_count, self.block_length
+        )
+
+    def returns(self, indices: np.ndarray) -> np.ndarray:
+        """
+        :param indices: resampled source days of any shape
+        :return: the close to close returns of every ticker on those days, with a trailing
+        tickers axis
+        """
+        return self._days[3][indices]
+
+    def bars(self, indices: np.ndarray) -> np.ndarray:
+        """
+        :param indices: the resampled source days of one path
+        :return: (fields, days, tickers) bars of the path
+        """
+        days = self._days[:, indices]
+        close = self._first_close * np.cumprod(1 + days[3], axis=0)
+        return np.stack(
+            [days[0] * close, days[1] * close, days[2] * close, close, days[4]]
+        )
+
+    def paths(
+        self,
+        path_count: int,
+        trading_days: pd.DatetimeIndex,
+        chunk_size: int = 64,
+        seed: Optional[int] = None,
+    ) -> Iterator[AlignedPrices]:
+        """
+        Generates price paths lazily, drawing the days of `chunk_size` paths at a time
+        :param path_count: the number of paths
+        :param trading_days: the calendar of every path
+        :param chunk_size: the number of paths to draw at once
+        :param seed: the random seed
+        """
+        rng = np.random.default_rng(seed)
+        for start in range(0, path_count, chunk_size):
+            count = min(chunk_size, path_count - start)
+            for indices in self.indices(rng, len(trading_days), count):
+                yield AlignedPrices(trading_days, self.bars(indices), self.tickers)
+
+
+def bootstrap_weights(
+    prices: AlignedPrices,
+    symbols: Sequence[str],
+    weights: np.ndarray,
+    path_count: int,
+    path_length: int,
+    method: str = STATIONARY,
+    block_length: float = 20,
+    chunk_size: int = 1024,
+    seed: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+) -> BootstrapResult:
+    """
+    Evaluates a portfolio rebalanced daily to constant `weights` over resampled paths. The
+    portfolio's returns are a matrix product with the resampled returns, so every path of a
+    chunk is evaluated at once without running a backtest.
+    :param prices: the realized prices to resample
+    :param symbols: the tickers of the portfolio
+    :param weights: the weight of each symbol
+    :param path_count: the number of paths
+    :param path_length: the number of days of each path
+    :param method: either `BLOCK` or `STATIONARY`
+    :param block_length: the (mean) number of consecutive days per block
+    :param chunk_size: the number of paths held in memory at once
+    :param seed: the random seed
+    :param start_date: the first day to resample from
+    :param end_date: the last day to resample from
+    """
+    resampler = PathResampler(
+        prices, symbols, start_date, end_date, method, block_length
+    )
+    weights = np.asarray(weights, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    results = list()
+    for start in range(0, path_count, chunk_size):
+        count = min(chunk_size, path_count - start)
+        indices = resampler.indices(rng, path_length, count)
+        # (days, paths) so each path is a column, as the metrics expect
+        daily_returns = (resampler.returns(indices) @ weights).T
+        values = np.vstack([np.ones(count), np.cumprod(1 + daily_returns, axis=0)])
+        results.append(_path_metrics(values))
+    return _concatenate(results)
+
+
+def bootstrap_strategy(
+    strategy_class: Type[OpenCloseStrategy],
+    strategy_kwargs: Dict[str, Any],
+    prices: AlignedPrices,
+    symbols: Sequence[str],
+    path_count: int,
+    path_length: int,
+    warmup_days: int = 0,
+    method: str = STATIONARY,
+    block_length: float = 20,
+    chunk_size: int = 8,
+    seed: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    initial_capital: float = 50000,
+    benchmark: str = "SPY",
+    processes: Optional[int] = None,
+) -> BootstrapResult:
+    """
+    Backtests a strategy on resampled paths in a pool of worker processes. Each worker
+    receives a chunk of paths to generate and backtest, so no more than `chunk_size` paths
+    per worker exist at once.
+    :param strategy_class: the strategy to test
+    :param strategy_kwargs: the arguments of the strategy
+    :param prices: the realized prices to resample
+    :param symbols: the tickers the strategy trades
+    :param path_count: the number of paths
+    :param path_length: the number of days of each path, including the warm up
+    :param warmup_days: the number of days at the start of each path that only serve as
+    history for the strategy
+    :param method: either `BLOCK` or `STATIONARY`
+    :param block_length: the (mean) number of consecutive days per block
+    :param chunk_size: the number of paths per task
+    :param seed: the random seed
+    :param start_date: the first day to resample from
+    :param end_date: the last day to resample from
+    :param initial_capital: the starting capital of each backtest
+    :param benchmark: a ticker to include in the paths alongside `symbols`
+    :param processes: the number of worker processes (defaults to the number of CPUs)
+    """
+    assert path_length <= len(prices.trading_days), "Paths can't outgrow the calendar"
+    assert warmup_days < path_length, "Paths must have days after the warm up"
+    tickers = list(dict.fromkeys([benchmark] + list(symbols)))
+    counts = [
+        min(chunk_size, path_count - start)
+        for start in range(0, path_count, chunk_size)
+    ]
+    # an independent random stream per chunk keeps results independent of the pool size
+    seeds = np.random.SeedSequence(seed).spawn(len(counts))
+    tasks = [
+        (
+            strategy_class,
+            strategy_kwargs,
+            tickers,
+            (start_date, end_date, method, block_length),
+            count,
+            path_length,
+            warmup_days,
+            initial_capital,
+            chunk_seed,
+        )
+        for count, chunk_seed in zip(counts, seeds)
+    ]
+    with ParameterSweep(None, prices, processes) as sweep:
+        return _concatenate(sweep.map(_run_paths, tasks))
+
+
+def _run_paths(task, prices: AlignedPrices) -> BootstrapResult:
+    (
+        strategy_class,
+        strategy_kwargs,
+        tickers,
+        resampler_args,
+        count,
+        path_length,
+        warmup_days,
+        initial_capital,
+        seed,
+    ) = task
+    resampler = PathResampler(prices, tickers, *resampler_args)
+    trading_days = prices.trading_days[-path_length:]
+    values = np.empty((path_length - warmup_days, count))
+    paths = resampler.paths(count, trading_days, chunk_size=count, seed=seed)
+    for i, path in enumerate(paths):
+        result = evaluate_open_close_many(
+            [strategy_class(**strategy_kwargs)],
+            initial_capital,
+            trading_days[warmup_days],
+            trading_days[-1],
+            prices=path,
+        )[0]
+        values[:, i] = result.equity
+    return _path_metrics(values)
+
+
+def _path_metrics(values: np.ndarray) -> BootstrapResult:
+    daily_returns = metrics.daily_returns(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sharpe = (
+            (np.nanmean(daily_returns, axis=0) - metrics.DAILY_RISK_FREE_RATE)
+            / np.nanstd(daily_returns, axis=0)
+            * np.sqrt(metrics.TRADING_DAYS_PER_YEAR)
+        )
+    return BootstrapResult(
+        metrics.cumulative_returns(values)[-1],
+        sharpe,
+        metrics.max_drawdown(values),
+    )
+
+
+def _concatenate(results: List[BootstrapResult]) -> BootstrapResult:
+    return BootstrapResult(*(np.concatenate(values) for values in zip(*results)))
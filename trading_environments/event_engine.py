@@ -0,0 +1,211 @@
+import heapq
+import time
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from broker.simulated import SimulatedBroker
+from broker.simulated.models import CommissionModel, SlippageModel
+from data.alignedprices import AlignedPrices
+from data.yahoo import YahooDataSource
+from data.yahoobacktest import YahooBackTestDataSource
+from security import Equity
+from strategy.strategy import OpenCloseStrategy
+from trading_environments.backtest_environment import BacktestResult, backtest_results
+
+# The phases of every bar, in the order they run
+OPEN = 0  # strategies' `on_open`
+MATCH = 1  # open orders are matched against the bar
+CLOSE = 2  # strategies' `before_close`
+MARK = 3  # portfolios are valued at the close
+
+# An event callback receives the index of its bar
+EventCallback = Callable[[int], None]
+
+
+class EventEngine:
+    """
+    An event-driven backtest over aligned daily bars.
+
+    Events are compact (bar, phase, sequence, callback) records in a priority queue, so they
+    run in time order and, within a bar, in phase order (see `OPEN`, `MATCH`, `CLOSE`, and
+    `MARK`). Each bar schedules the next one when it is marked, and anything else can be
+    scheduled for a later bar with `schedule`. Every strategy trades through its own
+    `SimulatedBroker`, whose open orders are matched against the bar on `MATCH`: orders placed
+    in `before_close` fill against the next bar and orders placed in `on_open` against the
+    current one.
+    """
+
+    def __init__(
+        self,
+        strategies: List[OpenCloseStrategy],
+        initial_capital: float,
+        start_date: datetime,
+        end_date: datetime,
+        commission: Optional[CommissionModel] = None,
+        slippage: Optional[SlippageModel] = None,
+        volume_limit: Optional[float] = 0.025,
+        prices: Optional[AlignedPrices] = None,
+    ):
+        """
+        :param strategies: the strategies to run
+        :param initial_capital: the starting capital of each strategy
+        :param start_date: the first day of the backtest
+        :param end_date: the last day of the backtest
+        :param commission: the commission model of every broker
+        :param slippage: the slippage model of every broker
+        :param volume_limit: the fraction of a bar's volume orders may fill (see `SimulatedBroker`)
+        :param prices: the aligned prices to trade on (if None, securities are loaded as they
+        are requested)
+        """
+        if prices is None:
+            prices = AlignedPrices(YahooDataSource().price_history(Equity("SPY")).index)
+        self.strategies = strategies
+        trading_days = prices.trading_days
+        self.start_index = int(trading_days.searchsorted(start_date, side="left"))
+        self.end_index = max(
+            int(trading_days.searchsorted(end_date, side="right")), self.start_index
+        )
+        self.trading_days = trading_days[self.start_index : self.end_index]
+        self.data_source = YahooBackTestDataSource(
+            trading_days[min(self.start_index, len(trading_days) - 1)], prices
+        )
+        self.brokers = [
+            SimulatedBroker(
+                initial_capital, self.data_source, commission, slippage, volume_limit
+            )
+            for _ in strategies
+        ]
+        self.portfolio_values = np.empty(
+            (self.end_index - self.start_index, len(strategies))
+        )
+        self.events_processed = 0
+        self._events: List[Tuple[int, int, int, EventCallback]] = list()
+        self._sequence = 0
+
+    def schedule(self, bar_index: int, phase: int, callback: EventCallback):
+        """
+        Schedules `callback` to run in `phase` of the bar at `bar_index`. Events of the same
+        bar and phase run in the order they were scheduled.
+        """
+        heapq.heappush(self._events, (bar_index, phase, self._sequence, callback))
+        self._sequence += 1
+
+    def run(self, log: bool = True) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+        """
+        Runs every event up to the end of the backtest
+        :return: a tuple of the trading days and a (days, strategies) array of the portfolio
+        value of each strategy at the close of each day
+        """
+        if self.start_index < self.end_index:
+            self._schedule_bar(self.start_index)
+        if log:
+            print("Starting trades")
+        start_time = time.time()
+        while self._events and self._events[0][0] < self.end_index:
+            bar_index, _, _, callback = heapq.heappop(self._events)
+            self.data_source.curr_index = bar_index
+            callback(bar_index)
+            self.events_processed += 1
+
+        if log:
+            elapsed = max(time.time() - start_time, 1e-9)
+            fills = sum(len(broker.fills) for broker in self.brokers)
+            print(
+                f"Done trading: {self.events_processed} events and {fills} fills "
+                f"({self.events_processed / elapsed:.0f} events/s)"
+            )
+            for strategy, broker in zip(self.strategies, self.brokers):
+                print(f"{strategy.name} Final Positions:")
+                for symbol, quantity in broker.positions.items():
+                    print(f"\t{symbol.ticker}: {quantity}")
+                print(f"Final Portfolio Value: ${broker.get_portfolio_value():.2f}")
+                print(f"Portfolio Liquid Capital: ${broker.liquid_capital:.2f}")
+        return self.trading_days, self.portfolio_values
+
+    def _schedule_bar(self, bar_index: int):
+        self.schedule(bar_index, OPEN, self._open)
+        self.schedule(bar_index, MATCH, self._match)
+        self.schedule(bar_index, CLOSE, self._close)
+        self.schedule(bar_index, MARK, self._mark)
+
+    def _open(self, bar_index: int):
+        self.data_source.is_open = True
+        for strategy, broker in zip(self.strategies, self.brokers):
+            strategy.on_open(broker, self.data_source)
+
+    def _match(self, bar_index: int):
+        # orders are matched against the whole bar
+        self.data_source.is_open = False
+        for broker in self.brokers:
+            broker.match()
+
+    def _close(self, bar_index: int):
+        self.data_source.is_open = False
+        for strategy, broker in zip(self.strategies, self.brokers):
+            strategy.before_close(broker, self.data_source)
+
+    def _mark(self, bar_index: int):
+        self.data_source.is_open = False
+        for i, broker in enumerate(self.brokers):
+            self.portfolio_values[bar_index - self.start_index, i] = (
+                broker.get_portfolio_value()
+            )
+        if bar_index + 1 < self.end_index:
+            self._schedule_bar(bar_index + 1)
+
+
+def run_event_driven(
+    strategy: OpenCloseStrategy,
+    initial_capital: float,
+    start_date: datetime,
+    end_date: datetime,
+    commission: Optional[CommissionModel] = None,
+    slippage: Optional[SlippageModel] = None,
+    volume_limit: Optional[float] = 0.025,
+    prices: Optional[AlignedPrices] = None,
+    log: bool = True,
+) -> BacktestResult:
+    return run_event_driven_many(
+        [strategy],
+        initial_capital,
+        start_date,
+        end_date,
+        commission=commission,
+        slippage=slippage,
+        volume_limit=volume_limit,
+        prices=prices,
+        log=log,
+    )[0]
+
+
+def run_event_driven_many(
+    strategies: List[OpenCloseStrategy],
+    initial_capital: float,
+    start_date: datetime,
+    end_date: datetime,
+    commission: Optional[CommissionModel] = None,
+    slippage: Optional[SlippageModel] = None,
+    volume_limit: Optional[float] = 0.025,
+    prices: Optional[AlignedPrices] = None,
+    log: bool = True,
+) -> List[BacktestResult]:
+    """
+    Backtests strategies with an `EventEngine`, so that orders rest in an order book and fill
+    against later bars with commission, slippage, and volume limits
+    :return: the result of each strategy
+    """
+    engine = EventEngine(
+        strategies,
+        initial_capital,
+        start_date,
+        end_date,
+        commission,
+        slippage,
+        volume_limit,
+        prices,
+    )
+    trading_days, portfolio_values = engine.run(log)
+    return backtest_results(trading_days, portfolio_values)
@@ -0,0 +1,107 @@
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from broker.transparent import TransparentBroker
+from data.minutebacktest import MinuteBackTestDataSource
+from data.pricestore import PriceStore
+from security import Equity
+from strategy.strategy import IntradayStrategy
+from trading_environments.backtest_environment import BacktestResult, backtest_results
+
+_NS_PER_DAY = 24 * 60 * 60 * 10**9
+
+
+def run_intraday(
+    strategy: IntradayStrategy,
+    initial_capital: float,
+    start_time: datetime,
+    end_time: datetime,
+    clock: Equity = Equity("SPY"),
+    store: Optional[PriceStore] = None,
+    log: bool = True,
+) -> BacktestResult:
+    return run_intraday_many(
+        [strategy],
+        initial_capital,
+        start_time,
+        end_time,
+        clock=clock,
+        store=store,
+        log=log,
+    )[0]
+
+
+def run_intraday_many(
+    strategies: List[IntradayStrategy],
+    initial_capital: float,
+    start_time: datetime,
+    end_time: datetime,
+    clock: Equity = Equity("SPY"),
+    store: Optional[PriceStore] = None,
+    log: bool = True,
+) -> List[BacktestResult]:
+    """
+    Backtests intraday strategies bar by bar over minute data. The minutes of `clock` are the
+    bars of the backtest, and every strategy trades through its own broker against one shared
+    `MinuteBackTestDataSource`, so bars are read from disk as they are needed rather than
+    loaded up front. Portfolios are valued at the last bar of every trading day.
+    :param strategies: the strategies to run
+    :param initial_capital: the starting capital of each strategy
+    :param start_time: the time of the first bar
+    :param end_time: the time of the last bar
+    :param clock: the security whose bars define the trading minutes
+    :param store: the store of minute bars (defaults to the minute store under `data_cache/`)
+    :param log: whether to print progress
+    :return: the result of each strategy, with one row per trading day
+    """
+    data_source = MinuteBackTestDataSource(start_time, store)
+    brokers = [TransparentBroker(initial_capital, data_source) for _ in strategies]
+
+    clock_dates = data_source.bar_times(clock)
+    start_index = int(
+        clock_dates.searchsorted(pd.Timestamp(start_time).value, side="left")
+    )
+    end_index = int(
+        clock_dates.searchsorted(pd.Timestamp(end_time).value, side="right")
+    )
+    bar_times = np.array(clock_dates[start_index:end_index])
+    days = bar_times // _NS_PER_DAY
+    first_bars = np.ones(len(days), dtype=bool)
+    first_bars[1:] = days[1:] != days[:-1]
+    last_bars = np.ones(len(days), dtype=bool)
+    last_bars[:-1] = days[1:] != days[:-1]
+
+    portfolio_values = np.empty((int(last_bars.sum()), len(strategies)))
+    day_index = 0
+
+    if log:
+        print("Starting trades")
+    for bar_time, first_bar, last_bar in zip(bar_times, first_bars, last_bars):
+        data_source.curr_time_ns = int(bar_time)
+
+        if first_bar:
+            if log and day_index % 20 == 0:
+                print(f"Trading on day: {data_source.curr_time.date()}")
+            for strategy, broker in zip(strategies, brokers):
+                strategy.on_open(broker, data_source)
+        for strategy, broker in zip(strategies, brokers):
+            strategy.on_bar(broker, data_source)
+        if last_bar:
+            for strategy, broker in zip(strategies, brokers):
+                strategy.before_close(broker, data_source)
+            for i, broker in enumerate(brokers):
+                portfolio_values[day_index, i] = broker.get_portfolio_value()
+            day_index += 1
+
+    if log:
+        print("Done trading")
+        for strategy, broker in zip(strategies, brokers):
+            print(f"{strategy.name} Final Portfolio Value: ${broker.total_value:.2f}")
+
+    trading_days = pd.DatetimeIndex(
+        (days[last_bars] * _NS_PER_DAY).astype("datetime64[ns]")
+    )
+    return backtest_results(trading_days, portfolio_values)
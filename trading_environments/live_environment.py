@@ -0,0 +1,156 @@
+import asyncio
+from datetime import datetime
+from typing import AsyncIterable, Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from broker.transparent import TransparentBroker
+from data.alignedprices import AlignedPrices
+from data.stream import (
+    BEFORE_CLOSE,
+    CLOSE,
+    OPEN,
+    TICK,
+    FeedEvent,
+    ReplayFeed,
+    StreamingDataSource,
+)
+from strategy.strategy import OpenCloseStrategy
+from trading_environments.backtest_environment import BacktestResult, backtest_results
+
+# Called with a strategy and its broker whenever the strategy's target positions are recomputed
+PositionsCallback = Callable[[OpenCloseStrategy, TransparentBroker], None]
+
+
+class LiveRunner:
+    """
+    A long-running live trading loop driven by a feed of `FeedEvent`s.
+
+    The runner keeps its data source, brokers, and strategies in memory between days, so
+    strategies keep their state (e.g. an incremental `WindowMatcher`) and every event only
+    updates the current day's bars. Strategies' `on_open` runs on `OPEN` and `before_close`
+    on `BEFORE_CLOSE`, and also on every `TICK` if `on_tick` is set. Portfolios are valued on
+    `CLOSE`. Every broker trades instantly at the current price, so its positions are the
+    target positions to place with a real broker.
+    """
+
+    def __init__(
+        self,
+        strategies: List[OpenCloseStrategy],
+        initial_capital: float,
+        data_source: StreamingDataSource,
+        on_tick: bool = False,
+        on_positions: Optional[PositionsCallback] = None,
+        log: bool = True,
+    ):
+        """
+        :param strategies: the strategies to run
+        :param initial_capital: the starting capital of each strategy
+        :param data_source: the data source holding the price history so far
+        :param on_tick: whether to recompute target positions on every tick as well
+        :param on_positions: called with every strategy and its broker after its target
+        positions are recomputed
+        :param log: whether to print the positions at every close
+        """
+        self.strategies = strategies
+        self.data_source = data_source
+        self.brokers = [
+            TransparentBroker(initial_capital, data_source) for _ in strategies
+        ]
+        self.on_tick = on_tick
+        self.on_positions = on_positions
+        self.log = log
+        self.trading_days: List[pd.Timestamp] = list()
+        self._portfolio_values: List[np.ndarray] = list()
+
+    @property
+    def portfolio_values(self) -> np.ndarray:
+        """
+        The (days, strategies) portfolio value of each strategy at every close so far
+        """
+        return np.array(self._portfolio_values).reshape(-1, len(self.strategies))
+
+    async def run(
+        self, feed: AsyncIterable[FeedEvent]
+    ) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+        """
+        Handles every event of `feed` until it ends
+        :return: a tuple of the trading days and a (days, strategies) array of the portfolio
+        value of each strategy at the close of each day
+        """
+        async for event in feed:
+            self.handle(event)
+        return pd.DatetimeIndex(self.trading_days), self.portfolio_values
+
+    def handle(self, event: FeedEvent):
+        if event.kind == OPEN:
+            self.data_source.start_day(event.time)
+            self.data_source.update(event.tickers, event.bars)
+            self.data_source.is_open = True
+            for strategy, broker in zip(self.strategies, self.brokers):
+                strategy.on_open(broker, self.data_source)
+            self.data_source.is_open = False
+        elif event.kind == TICK:
+            self.data_source.update(event.tickers, event.bars)
+            if self.on_tick:
+                self._recompute()
+        elif event.kind == BEFORE_CLOSE:
+            self._recompute()
+        elif event.kind == CLOSE:
+            self.data_source.update(event.tickers, event.bars)
+            self.trading_days.append(self.data_source.curr_date)
+            self._portfolio_values.append(
+                np.array([broker.get_portfolio_value() for broker in self.brokers])
+            )
+            if self.log:
+                self._print_positions()
+
+    def _recompute(self):
+        for strategy, broker in zip(self.strategies, self.brokers):
+            strategy.before_close(broker, self.data_source)
+            if self.on_positions is not None:
+                self.on_positions(strategy, broker)
+
+    def _print_positions(self):
+        print(f"Close of {self.data_source.curr_date}")
+        for strategy, broker in zip(self.strategies, self.brokers):
+            print(f"{strategy.name} positions:")
+            for symbol, quantity in broker.positions.items():
+                print(f"\t{symbol.ticker}: {quantity}")
+            print(f"Portfolio Value: ${broker.get_portfolio_value():.2f}")
+
+
+def run_replay(
+    strategies: List[OpenCloseStrategy],
+    initial_capital: float,
+    prices: AlignedPrices,
+    start_date: datetime,
+    end_date: datetime,
+    ticks_per_day: int = 0,
+    on_tick: bool = False,
+    log: bool = False,
+) -> List[BacktestResult]:
+    """
+    Runs strategies through a `LiveRunner` fed by a `ReplayFeed` of `prices`, with no network
+    access. Without ticks this gives the same results as `evaluate_open_close_many`.
+    :param strategies: the strategies to run
+    :param initial_capital: the starting capital of each strategy
+    :param prices: the aligned prices to replay, including the history before `start_date`
+    :param start_date: the first day to replay
+    :param end_date: the last day to replay
+    :param ticks_per_day: the number of intermediate ticks of every day (see `ReplayFeed`)
+    :param on_tick: whether to recompute target positions on every tick as well
+    :param log: whether to print the positions at every close
+    :return: the result of each strategy
+    """
+    feed = ReplayFeed(prices, start_date, end_date, ticks_per_day=ticks_per_day)
+    runner = LiveRunner(
+        strategies,
+        initial_capital,
+        StreamingDataSource(feed.history()),
+        on_tick=on_tick,
+        log=log,
+    )
+    trading_days, portfolio_values = asyncio.run(runner.run(feed))
+    return backtest_results(trading_days, portfolio_values)
@@ -0,0 +1,161 @@
+"""
+Performance metrics over arrays of daily values, with one column per portfolio for 2-D input.
+Rolling and expanding statistics use cumulative sums, so they are O(days) for any window.
+"""
+
+import math
+from typing import Tuple
+
+import numpy as np
+
+TRADING_DAYS_PER_YEAR = 252
+# Annual risk free rate of 0.12% as a daily rate
+DAILY_RISK_FREE_RATE = (1 + 0.12 / 100) ** (1 / TRADING_DAYS_PER_YEAR) - 1
+
+
+def daily_returns(values: np.ndarray) -> np.ndarray:
+    """
+    :param values: portfolio values by day
+    :return: the percent change of each day (NaN on the first day)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    returns = np.full(values.shape, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        returns[1:] = values[1:] / values[:-1] - 1
+    return returns
+
+
+def cumulative_returns(values: np.ndarray) -> np.ndarray:
+    """
+    :param values: portfolio values by day
+    :return: the return since the first day
+    """
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return values / values[0] - 1
+
+
+def rolling_sharpe(
+    returns: np.ndarray,
+    window: int = 180,
+    risk_free_rate: float = DAILY_RISK_FREE_RATE,
+) -> np.ndarray:
+    """
+    Annualized Sharpe ratio over a trailing window of daily returns, using the population
+    standard deviation. Days whose window is incomplete or contains a NaN are NaN.
+    :param returns: daily returns
+    :param window: the number of days in each window
+    :param risk_free_rate: the daily risk free rate
+    """
+    mean, std = _rolling_mean_std(returns, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (mean - risk_free_rate) / std * math.sqrt(TRADING_DAYS_PER_YEAR)
+
+
+def expanding_annual_returns(returns: np.ndarray, min_periods: int = 180) -> np.ndarray:
+    """
+    Annual returns estimated from the mean of all daily returns so far, ignoring NaNs.
+    Days with fewer than `min_periods` returns so far, or with a NaN return, are NaN.
+    :param returns: daily returns
+    :param min_periods: the minimum number of returns to estimate from
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    valid = ~np.isnan(returns)
+    counts = np.cumsum(valid, axis=0)
+    totals = np.cumsum(np.where(valid, returns, 0), axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        annual = (1 + totals / counts) ** TRADING_DAYS_PER_YEAR - 1
+    annual[(counts < min_periods) | ~valid] = np.nan
+    return annual
+
+
+def drawdown(values: np.ndarray) -> np.ndarray:
+    """
+    :param values: portfolio values (or cumulative returns plus one) by day
+    :return: the fractional decline of each day from the highest value so far
+    """
+    values = np.asarray(values, dtype=np.float64)
+    peaks = np.fmax.accumulate(values, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        draw_down = (values - peaks) / peaks
+    draw_down[np.isinf(draw_down)] = 0
+    return draw_down
+
+
+def max_drawdown(values: np.ndarray) -> np.ndarray:
+    """
+    :param values: portfolio values (or cumulative returns plus one) by day
+    :return: the largest drawdown of each portfolio (as a negative number)
+    """
+    return np.nanmin(drawdown(values), axis=0)
+
+
+def beta_alpha(
+    benchmark_returns: np.ndarray, returns: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Regresses the daily returns of each portfolio on the benchmark's, ignoring days where either
+    is NaN. As with `scipy.stats.linregress`, the p-value is of the two-sided test that beta is
+    zero, with a t-distribution of n - 2 degrees of freedom.
+    :param benchmark_returns: the daily returns of the benchmark
+    :param returns: the daily returns of the portfolios
+    :return: a tuple of beta, alpha, the correlation coefficient, the p-value, and the standard
+    error of beta of each portfolio
+    """
+    # scipy is slow to import, so only load it when it's needed
+    from scipy import special
+
+    returns = np.asarray(returns, dtype=np.float64)
+    benchmark_returns = np.asarray(benchmark_returns, dtype=np.float64)
+    if returns.ndim == 2:
+        benchmark_returns = benchmark_returns[:, None]
+    valid = ~(np.isnan(returns) | np.isnan(benchmark_returns))
+    count = valid.sum(axis=0)
+    x = np.where(valid, benchmark_returns, 0)
+    y = np.where(valid, returns, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean = x.sum(axis=0) / count
+        y_mean = y.sum(axis=0) / count
+        x_centered = np.where(valid, x - x_mean, 0)
+        y_centered = np.where(valid, y - y_mean, 0)
+        covariance = (x_centered * y_centered).sum(axis=0)
+        x_variance = (x_centered**2).sum(axis=0)
+        y_variance = (y_centered**2).sum(axis=0)
+        beta = covariance / x_variance
+        alpha = y_mean - beta * x_mean
+        correlation = covariance / np.sqrt(x_variance * y_variance)
+        degrees_of_freedom = np.where(count > 2, count - 2, np.nan)
+        std_err = np.sqrt(
+            np.maximum(1 - correlation**2, 0)
+            * y_variance
+            / (degrees_of_freedom * x_variance)
+        )
+        p_value = 2 * special.stdtr(degrees_of_freedom, -np.abs(beta / std_err))
+    return beta, alpha, correlation, p_value, std_err
+
+
+def _rolling_mean_std(values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    # center each column first so the sums of squares don't lose precision
+    center = np.nanmean(values, axis=0) if valid.any() else 0
+    centered = np.where(valid, values - center, 0)
+
+    def window_sums(x):
+        sums = np.cumsum(x, axis=0)
+        sums[window:] = sums[window:] - sums[:-window]
+        return sums
+
+    sums = window_sums(centered)
+    squares = window_sums(centered**2)
+    nan_counts = window_sums((~valid).astype(np.int64))
+
+    mean = sums / window
+    variance = np.maximum(squares / window - mean**2, 0)
+    mean += center
+    std = np.sqrt(variance)
+    incomplete = nan_counts > 0
+    incomplete[: window - 1] = True
+    mean[incomplete] = np.nan
+    std[incomplete] = np.nan
+    return mean, std
@@ -0,0 +1,186 @@
+import functools
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+
+class Profiler:
+    """
+    Opt-in wall time instrumentation of a backtest.
+
+    Pass a profiler to `run_open_close` to time every strategy hook, data source query, and
+    broker call of the run. Calls are timed by wrapping the methods of the instances taking
+    part in the run, and the wrappers are removed afterwards, so a backtest run without a
+    profiler pays nothing.
+
+    Sections nest: time spent in a section called from another counts towards the inclusive
+    time of both but towards the self time of the innermost one only. Results are available as
+    a summary table, a table of the time spent in each section per day, and a collapsed stack
+    trace that flame graph tools (e.g. flamegraph.pl or speedscope) read directly.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, int] = defaultdict(int)
+        self._inclusive: Dict[str, float] = defaultdict(float)
+        self._self: Dict[str, float] = defaultdict(float)
+        # self time by ";" separated stack of section names
+        self._stacks: Dict[str, float] = defaultdict(float)
+        # (name, start time, time spent in children, day count at start) of every open section
+        self._open: List[List[Any]] = list()
+        self._days: List[Tuple[Any, Dict[str, float]]] = list()
+        self._instrumented: List[Tuple[Any, str]] = list()
+
+    @contextmanager
+    def section(self, name: str):
+        """
+        Times the body of a `with` block as the section `name`
+        """
+        self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def start_day(self, day: Any):
+        """
+        Starts attributing section times to `day`
+        """
+        self._days.append((day, defaultdict(float)))
+
+    def instrument(
+        self, instance: Any, methods: Sequence[str], prefix: Optional[str] = None
+    ):
+        """
+        Times every call to `methods` of `instance` until `restore` is called
+        :param instance: the object to instrument
+        :param methods: the names of the methods to time
+        :param prefix: the prefix of the section names (defaults to the class name)
+        """
+        prefix = prefix or type(instance).__name__
+        for method_name in methods:
+            if method_name in vars(instance):
+                # already instrumented (e.g. the same data source shared by many brokers)
+                continue
+            method = getattr(instance, method_name)
+            setattr(
+                instance,
+                method_name,
+                self._timed(method, f"{prefix}.{method_name}"),
+            )
+            self._instrumented.append((instance, method_name))
+
+    def restore(self):
+        """
+        Removes every wrapper added by `instrument`
+        """
+        for instance, method_name in reversed(self._instrumented):
+            delattr(instance, method_name)
+        self._instrumented = list()
+
+    def summary(self) -> pd.DataFrame:
+        """
+        :return: the number of calls, inclusive and self time, and mean time per call of every
+        section, sorted by self time
+        """
+        total = sum(self._self.values())
+        names = list(self._calls.keys())
+        summary = pd.DataFrame(
+            {
+                "Calls": [self._calls[name] for name in names],
+                "Total (s)": [self._inclusive[name] for name in names],
+                "Self (s)": [self._self[name] for name in names],
+                "Mean (us)": [
+                    self._inclusive[name] / self._calls[name] * 1e6 for name in names
+                ],
+                "% of Total": [self._self[name] / total * 100 for name in names],
+            },
+            index=pd.Index(names, name="Section"),
+        )
+        return summary.sort_values("Self (s)", ascending=False)
+
+    def day_times(self) -> pd.DataFrame:
+        """
+        :return: the inclusive time in seconds spent in every section on every day
+        """
+        return pd.DataFrame(
+            [times for _, times in self._days],
+            index=[day for day, _ in self._days],
+        ).fillna(0)
+
+    def collapsed_stacks(self) -> List[str]:
+        """
+        :return: one "frame;frame;frame microseconds" line per call stack, the collapsed stack
+        format that flame graph tools read
+        """
+        return [
+            f"{stack} {int(round(seconds * 1e6))}"
+            for stack, seconds in sorted(self._stacks.items())
+        ]
+
+    def write_collapsed_stacks(self, path: str):
+        with open(path, "w") as f:
+            f.write("\n".join(self.collapsed_stacks()) + "\n")
+
+    def print_summary(self, rows: Optional[int] = 20):
+        with pd.option_context("display.float_format", "{:.3f}".format):
+            print(self.summary().head(rows).to_string())
+
+    def _timed(self, method, name: str):
+        enter = self._enter
+        exit_ = self._exit
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            enter(name)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                exit_()
+
+        return timed
+
+    def _enter(self, name: str):
+        self._open.append([name, time.perf_counter(), 0.0, len(self._days)])
+
+    def _exit(self):
+        end = time.perf_counter()
+        name, start, child_time, day_count = self._open[-1]
+        elapsed = end - start
+        self_time = elapsed - child_time
+        stack = ";".join(section[0] for section in self._open)
+        self._open.pop()
+        if self._open:
+            self._open[-1][2] += elapsed
+
+        self._calls[name] += 1
+        # recursive calls would count twice towards inclusive time, so only count the outermost
+        if all(section[0] != name for section in self._open):
+            self._inclusive[name] += elapsed
+            # sections spanning many days (e.g. the whole run) aren't attributed to a day
+            if self._days and day_count == len(self._days):
+                self._days[-1][1][name] += elapsed
+        self._self[name] += self_time
+        self._stacks[stack] += self_time
+
+
+# The methods `run_open_close` instruments when given a profiler
+DATA_SOURCE_METHODS = (
+    "price_history",
+    "price_array",
+    "price_snapshot",
+    "pct_returns",
+    "pct_returns_matrix",
+    "pct_returns_dated",
+)
+BROKER_METHODS = (
+    "place_order",
+    "place_limit_order",
+    "place_order_proportion",
+    "place_limit_order_proportion",
+    "rebalance_to_weights",
+    "get_portfolio_value",
+)
+STRATEGY_METHODS = ("on_open", "before_close")
@@ -0,0 +1,253 @@
+"""
+An on-disk cache of backtest results.
+
+Results are content addressed: the key of a backtest hashes the strategy class (and the source
+of its module), its parameters, the initial capital, the trading days it runs over, and the
+fingerprint of the prices up to its last day. Re-running a backtest with the same inputs, e.g.
+a repeated parameter set of a Bayesian optimization or a resumed sweep, reads its result back
+instead of simulating it again, while any change to the inputs (including Yahoo re-adjusting
+the history for a split) gives a new key. Changes to code outside the strategy's module (e.g.
+the broker) aren't detected, so `clear` the cache after changing them.
+
+Every result is a file named after its key. Reading a result marks it as recently used, and
+the least recently used results are deleted once the cache grows beyond `max_bytes`. Files
+are written atomically, so worker processes of a `ParameterSweep` can share one cache.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import tempfile
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Type
+
+import numpy as np
+
+from data.alignedprices import AlignedPrices
+from security import Security
+from strategy.strategy import OpenCloseStrategy
+from trading_environments.backtest_environment import (
+    BacktestResult,
+    evaluate_open_close_many,
+)
+
+DEFAULT_RESULT_CACHE_ROOT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "data_cache",
+    "results",
+)
+
+# Part of every key, to be bumped whenever results computed by older code are invalid
+_CACHE_VERSION = 1
+
+
+class ResultCache:
+    def __init__(
+        self, root: str = DEFAULT_RESULT_CACHE_ROOT, max_bytes: int = 512 * 2**20
+    ):
+        """
+        :param root: the directory of the cache
+        :param max_bytes: the size the cache is pruned down to
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        # the size of the cache as of the last scan plus everything written since
+        self._size: Optional[int] = None
+
+    def key(
+        self,
+        strategy_class: Type[OpenCloseStrategy],
+        params: Dict[str, Any],
+        initial_capital: float,
+        start_date: datetime,
+        end_date: datetime,
+        prices: AlignedPrices,
+    ) -> str:
+        """
+        :param strategy_class: the strategy of the backtest
+        :param params: the keyword arguments the strategy is built with
+        :param initial_capital: the starting capital of the backtest
+        :param start_date: the first day of the backtest
+        :param end_date: the last day of the backtest
+        :param prices: the aligned prices of the backtest
+        :return: the key of the backtest's result
+        """
+        trading_days = prices.trading_days
+        start_index = int(trading_days.searchsorted(start_date, side="left"))
+        end_index = max(
+            int(trading_days.searchsorted(end_date, side="right")), start_index
+        )
+        # dates that select the same trading days give the same result
+        days = [
+            str(trading_days[i]) if i < len(trading_days) else None
+            for i in (start_index, end_index - 1)
+        ]
+        description = json.dumps(
+            {
+                "version": _CACHE_VERSION,
+                "strategy": f"{strategy_class.__module__}.{strategy_class.__qualname__}",
+                "source": _module_source_hash(strategy_class),
+                "params": _canonical(params),
+                "initial_capital": float(initial_capital),
+                "days": days,
+                "prices": prices.fingerprint(end_index),
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[BacktestResult]:
+        """
+        :return: the cached result of `key`, or None if there is none
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+            # mark as recently used
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return result
+
+    def put(self, key: str, result: BacktestResult):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(file, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+        if self._size is None:
+            self._size = self._scan_size()
+        else:
+            self._size += os.path.getsize(path)
+        if self._size > self.max_bytes:
+            self.prune()
+
+    def prune(self, max_bytes: Optional[int] = None):
+        """
+        Deletes the least recently used results until the cache is at most `max_bytes`
+        (defaults to 90% of the cache's `max_bytes`, so pruning doesn't run on every write)
+        """
+        max_bytes = int(0.9 * self.max_bytes) if max_bytes is None else max_bytes
+        entries = list()
+        for path in self._paths():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        size = sum(entry[1] for entry in entries)
+        for _, file_size, path in entries:
+            if size <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # another process removed it first
+                pass
+            size -= file_size
+        self._size = size
+
+    def clear(self):
+        self.prune(0)
+
+    def __len__(self):
+        return len(self._paths())
+
+    def _path(self, key: str) -> str:
+        # spread the results over subdirectories to keep directories small
+        return os.path.join(self.root, key[:2], key + ".pkl")
+
+    def _paths(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return list()
+        return [
+            os.path.join(self.root, directory, name)
+            for directory in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, directory))
+            for name in os.listdir(os.path.join(self.root, directory))
+            if name.endswith(".pkl")
+        ]
+
+    def _scan_size(self) -> int:
+        size = 0
+        for path in self._paths():
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+
+def evaluate_cached(
+    strategy_class: Type[OpenCloseStrategy],
+    params: Sequence[Dict[str, Any]],
+    initial_capital: float,
+    start_date: datetime,
+    end_date: datetime,
+    prices: AlignedPrices,
+    cache: Optional[ResultCache] = None,
+) -> List[BacktestResult]:
+    """
+    Same as `evaluate_open_close_many` for strategies built as `strategy_class(**p)` for every
+    `p` in `params`, but only backtests the parameter sets whose results aren't cached yet
+    :param cache: the result cache (if None, every parameter set is backtested)
+    :return: the result of each parameter set
+    """
+    if cache is None:
+        return evaluate_open_close_many(
+            [strategy_class(**p) for p in params],
+            initial_capital,
+            start_date,
+            end_date,
+            prices=prices,
+        )
+
+    keys = [
+        cache.key(strategy_class, p, initial_capital, start_date, end_date, prices)
+        for p in params
+    ]
+    results: List[Optional[BacktestResult]] = [cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        new_results = evaluate_open_close_many(
+            [strategy_class(**params[i]) for i in missing],
+            initial_capital,
+            start_date,
+            end_date,
+            prices=prices,
+        )
+        for i, result in zip(missing, new_results):
+            cache.put(keys[i], result)
+            results[i] = result
+    return results
+
+
+def _canonical(value: Any) -> Any:
+    # a JSON representation that is the same for equal parameters
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, Security):
+        return value.ticker
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return repr(value)
+
+
+@lru_cache(maxsize=None)
+def _module_source_hash(strategy_class: type) -> Optional[str]:
+    try:
+        source = inspect.getsource(inspect.getmodule(strategy_class))
+    except (OSError, TypeError):
+        return None
+    return hashlib.sha256(source.encode()).hexdigest()
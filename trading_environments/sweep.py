@@ -0,0 +1,218 @@
+import itertools
+import multiprocessing
+import random
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data.alignedprices import AlignedPrices
+
+# An objective takes a set of parameters and the shared prices and returns a value to minimize
+Objective = Callable[[Dict[str, Any], AlignedPrices], float]
+SweepResults = List[Tuple[Dict[str, Any], float]]
+
+
+class SharedPrices:
+    """
+    Copies the bars of an `AlignedPrices` into shared memory once so worker processes can attach
+    to them instead of receiving a pickled copy or downloading them again.
+    """
+
+    def __init__(self, prices: AlignedPrices):
+        bars = prices.bars
+        self._memory = shared_memory.SharedMemory(create=True, size=max(bars.nbytes, 1))
+        shared_bars = np.ndarray(bars.shape, dtype=np.float64, buffer=self._memory.buf)
+        shared_bars[:] = bars
+        self.spec = (
+            self._memory.name,
+            bars.shape,
+            list(prices.tickers),
+            prices.trading_days.values.astype("datetime64[ns]").view(np.int64),
+        )
+
+    @staticmethod
+    def attach(spec) -> Tuple[AlignedPrices, shared_memory.SharedMemory]:
+        """
+        Attaches to shared prices created in another process
+        :param spec: the `spec` of the `SharedPrices` instance
+        :return: a tuple of the prices and the shared memory backing them, which must be kept
+        alive for as long as the prices are used
+        """
+        name, shape, tickers, trading_days = spec
+        memory = shared_memory.SharedMemory(name=name)
+        bars = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+        prices = AlignedPrices(
+            pd.DatetimeIndex(trading_days.astype("datetime64[ns]")), bars, tickers
+        )
+        return prices, memory
+
+    def close(self):
+        self._memory.close()
+        self._memory.unlink()
+
+
+_worker_prices: Optional[AlignedPrices] = None
+_worker_memory: Optional[shared_memory.SharedMemory] = None
+
+
+def _init_worker(spec):
+    global _worker_prices, _worker_memory
+    _worker_prices, _worker_memory = SharedPrices.attach(spec)
+
+
+def _call(args):
+    function, item = args
+    return function(item, _worker_prices)
+
+
+class ParameterSweep:
+    """
+    Evaluates an objective over many parameter sets in a pool of worker processes that share
+    one copy of the price data.
+
+    Use as a context manager:
+
+        with ParameterSweep(objective, prices) as sweep:
+            results = sweep.random({"look_back_window": (20, 200)}, n_calls=100)
+
+    Every search returns a list of (parameters, objective value) pairs in evaluation order.
+    Objectives are minimized and must be picklable (e.g. module level functions).
+    """
+
+    def __init__(
+        self,
+        objective: Optional[Objective],
+        prices: AlignedPrices,
+        processes: Optional[int] = None,
+    ):
+        """
+        :param objective: the function to minimize (may be None if only `map` is used)
+        :param prices: the prices every evaluation runs against
+        :param processes: the number of worker processes (defaults to the number of CPUs)
+        """
+        self.objective = objective
+        self.prices = prices
+        self.processes = processes or multiprocessing.cpu_count()
+        self._shared_prices = None
+        self._pool = None
+
+    def __enter__(self):
+        self._shared_prices = SharedPrices(self.prices)
+        self._pool = multiprocessing.Pool(
+            self.processes,
+            initializer=_init_worker,
+            initargs=(self._shared_prices.spec,),
+        )
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._pool.terminate()
+        self._pool.join()
+        self._shared_prices.close()
+
+    def evaluate(self, candidates: Sequence[Dict[str, Any]]) -> List[float]:
+        """
+        Evaluates a batch of parameter sets in parallel
+        :param candidates: the parameter sets to evaluate
+        :return: the objective value of each parameter set
+        """
+        assert self.objective is not None, "ParameterSweep has no objective"
+        return self.map(self.objective, candidates)
+
+    def map(
+        self, function: Callable[[Any, AlignedPrices], Any], items: Sequence[Any]
+    ) -> List[Any]:
+        """
+        Calls `function(item, prices)` for every item in parallel against the shared prices
+        :param function: a picklable function (e.g. a module level function)
+        :param items: the first argument of each call
+        :return: the result of each call
+        """
+        assert (
+            self._pool is not None
+        ), "ParameterSweep must be used as a context manager"
+        chunk_size = max(1, len(items) // (self.processes * 4))
+        return self._pool.map(
+            _call,
+            [(function, item) for item in items],
+            chunksize=chunk_size,
+        )
+
+    def grid(self, space: Dict[str, Sequence[Any]]) -> SweepResults:
+        """
+        Evaluates every combination of parameter values
+        :param space: the values to try for each parameter
+        """
+        names = list(space.keys())
+        candidates = [
+            dict(zip(names, values)) for values in itertools.product(*space.values())
+        ]
+        return list(zip(candidates, self.evaluate(candidates)))
+
+    def random(
+        self,
+        space: Dict[str, Any],
+        n_calls: int,
+        seed: Optional[int] = None,
+    ) -> SweepResults:
+        """
+        Evaluates parameter sets sampled uniformly at random
+        :param space: for each parameter, either a (low, high) tuple, sampled as integers if both
+        bounds are integers and as floats otherwise, or a list of values to choose from
+        :param n_calls: the number of parameter sets to evaluate
+        :param seed: the random seed
+        """
+        rng = random.Random(seed)
+
+        def sample(bounds):
+            if isinstance(bounds, tuple):
+                low, high = bounds
+                if isinstance(low, int) and isinstance(high, int):
+                    return rng.randint(low, high)
+                return rng.uniform(low, high)
+            return rng.choice(bounds)
+
+        candidates = [
+            {name: sample(bounds) for name, bounds in space.items()}
+            for _ in range(n_calls)
+        ]
+        return list(zip(candidates, self.evaluate(candidates)))
+
+    def bayesian(
+        self,
+        dimensions: Dict[str, Any],
+        n_calls: int,
+        batch_size: Optional[int] = None,
+        **optimizer_kwargs,
+    ) -> SweepResults:
+        """
+        Runs Bayesian optimization, evaluating a batch of suggested points in parallel on each
+        step through skopt's ask/tell interface
+        :param dimensions: the skopt dimension (e.g. `Integer(20, 200)`) of each parameter
+        :param n_calls: the total number of parameter sets to evaluate
+        :param batch_size: the number of points to evaluate per step (defaults to the number
+        of worker processes)
+        :param optimizer_kwargs: extra arguments to `skopt.Optimizer`
+        """
+        from skopt import Optimizer
+
+        names = list(dimensions.keys())
+        optimizer = Optimizer(list(dimensions.values()), **optimizer_kwargs)
+        batch_size = batch_size or self.processes
+        results = list()
+        while len(results) < n_calls:
+            points = optimizer.ask(n_points=min(batch_size, n_calls - len(results)))
+            candidates = [dict(zip(names, point)) for point in points]
+            values = self.evaluate(candidates)
+            optimizer.tell(points, values)
+            results.extend(zip(candidates, values))
+        return results
+
+
+def best(results: SweepResults) -> Tuple[Dict[str, Any], float]:
+    """
+    :return: the parameter set with the lowest objective value and that value
+    """
+    return min(results, key=lambda result: result[1])
@@ -0,0 +1,210 @@
+"""
+Walk-forward validation of strategy parameters.
+
+The calendar is split into consecutive folds, each with a training window followed by a test
+window. For every fold the parameters with the lowest loss over the training window are
+picked and scored over the test window, so every reported test metric is out of sample.
+
+Folds overlap, so instead of backtesting every fold separately each candidate parameter set is
+backtested once over the whole calendar and every fold is scored from slices of that one run.
+This reuses the aligned prices and any incremental strategy state (e.g. the incremental
+`WindowMatcher`) across folds. The candidates are simulated in parallel in a `ParameterSweep`
+pool that shares one copy of the prices.
+"""
+
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Type
+
+import numpy as np
+
+from data.alignedprices import AlignedPrices
+from strategy.strategy import OpenCloseStrategy
+from trading_environments.backtest_environment import BacktestResult, backtest_results
+from trading_environments.result_cache import ResultCache, evaluate_cached
+from trading_environments.sweep import ParameterSweep
+
+# A loss takes the result of a backtest window and returns a value to minimize
+Loss = Callable[[BacktestResult], float]
+
+
+class Fold(NamedTuple):
+    """
+    The [start, end) day indices of the training and test windows of a fold, relative to the
+    first day of the walk-forward
+    """
+
+    train_start: int
+    train_end: int
+    test_start: int
+    test_end: int
+
+
+class FoldResult(NamedTuple):
+    fold: Fold
+    params: Dict[str, Any]
+    train_loss: float
+    train: BacktestResult
+    test: BacktestResult
+
+
+class WalkForwardResult(NamedTuple):
+    """
+    The result of every fold and of the out-of-sample equity curve stitched together from the
+    test windows of every fold
+    """
+
+    folds: List[FoldResult]
+    test: BacktestResult
+
+
+def walk_forward_folds(
+    day_count: int, train_days: int, test_days: int, anchored: bool = False
+) -> List[Fold]:
+    """
+    Splits `day_count` days into folds whose test windows follow each other without overlap
+    :param day_count: the number of days to split
+    :param train_days: the number of days of each training window (of the first one if anchored)
+    :param test_days: the number of days of each test window
+    :param anchored: if True, every training window starts on the first day and grows with
+    each fold, otherwise it rolls forward
+    """
+    assert train_days > 0 and test_days > 0, "Windows must have at least one day"
+    folds = list()
+    test_start = train_days
+    while test_start < day_count:
+        train_start = 0 if anchored else test_start - train_days
+        folds.append(
+            Fold(
+                train_start,
+                test_start,
+                test_start,
+                min(test_start + test_days, day_count),
+            )
+        )
+        test_start += test_days
+    return folds
+
+
+def default_loss(result: BacktestResult) -> float:
+    """
+    The negative cumulative return per unit of daily volatility
+    """
+    if np.isnan(result.cumulative_return) or not result.daily_return_std > 0:
+        return 0.0
+    return -(result.cumulative_return + 1) / result.daily_return_std
+
+
+def walk_forward(
+    strategy_class: Type[OpenCloseStrategy],
+    strategy_kwargs: Dict[str, Any],
+    candidates: Sequence[Dict[str, Any]],
+    prices: AlignedPrices,
+    start_date: datetime,
+    end_date: datetime,
+    train_days: int,
+    test_days: int,
+    anchored: bool = False,
+    loss: Loss = default_loss,
+    initial_capital: float = 50000,
+    processes: Optional[int] = None,
+    cache: Optional[ResultCache] = None,
+) -> WalkForwardResult:
+    """
+    Walk-forward validates parameter sets of a strategy
+    :param strategy_class: the strategy to validate
+    :param strategy_kwargs: the arguments shared by every candidate (e.g. the symbols)
+    :param candidates: the parameter sets to choose from in every fold
+    :param prices: the aligned prices to backtest on
+    :param start_date: the first day of the first training window
+    :param end_date: the last day of the last test window
+    :param train_days: the number of trading days of each training window
+    :param test_days: the number of trading days of each test window
+    :param anchored: whether training windows all start on `start_date` (see `walk_forward_folds`)
+    :param loss: the function to minimize over each training window
+    :param initial_capital: the starting capital of each backtest
+    :param processes: the number of worker processes (defaults to the number of CPUs)
+    :param cache: a cache of backtest results, so candidates already backtested over the same
+    calendar aren't backtested again
+    """
+    trading_days = prices.trading_days
+    trading_days = trading_days[
+        (trading_days >= start_date) & (trading_days <= end_date)
+    ]
+    folds = walk_forward_folds(len(trading_days), train_days, test_days, anchored)
+    assert len(folds) > 0, "The calendar is too short for one training window"
+
+    with ParameterSweep(None, prices, processes) as sweep:
+        # spread the candidates over the workers; each worker backtests its share side by side
+        batch_count = min(len(candidates), sweep.processes)
+        batches = [
+            (
+                strategy_class,
+                strategy_kwargs,
+                list(candidates[i::batch_count]),
+                initial_capital,
+                trading_days[0],
+                trading_days[-1],
+                cache,
+            )
+            for i in range(batch_count)
+        ]
+        batch_values = sweep.map(_simulate_batch, batches)
+    # undo the round robin split so that column i is candidate i
+    portfolio_values = np.empty((len(trading_days), len(candidates)))
+    for i, values in enumerate(batch_values):
+        portfolio_values[:, i::batch_count] = values
+
+    fold_results = list()
+    for fold in folds:
+        train_days_slice = slice(fold.train_start, fold.train_end)
+        train_results = backtest_results(
+            trading_days[train_days_slice], portfolio_values[train_days_slice]
+        )
+        train_losses = [loss(result) for result in train_results]
+        best = int(np.argmin(train_losses))
+        # start the test window from the last training close so its first return counts
+        test_days_slice = slice(max(fold.test_start - 1, 0), fold.test_end)
+        test_result = backtest_results(
+            trading_days[test_days_slice], portfolio_values[test_days_slice, [best]]
+        )[0]
+        fold_results.append(
+            FoldResult(
+                fold,
+                dict(candidates[best]),
+                float(train_losses[best]),
+                train_results[best],
+                test_result,
+            )
+        )
+
+    # chain the daily returns of every test window into one out-of-sample equity curve
+    test_returns = np.concatenate(
+        [
+            np.nan_to_num(fold_result.test.daily_returns[1:])
+            for fold_result in fold_results
+        ]
+    )
+    test_equity = initial_capital * np.cumprod(
+        np.concatenate([[1.0], 1 + test_returns])
+    )
+    first_test_day = max(folds[0].test_start - 1, 0)
+    test_result = backtest_results(
+        trading_days[first_test_day : folds[-1].test_end], test_equity[:, None]
+    )[0]
+    return WalkForwardResult(fold_results, test_result)
+
+
+def _simulate_batch(batch, prices: AlignedPrices) -> np.ndarray:
+    strategy_class, strategy_kwargs, candidates, initial_capital, start, end, cache = (
+        batch
+    )
+    results = evaluate_cached(
+        strategy_class,
+        [{**strategy_kwargs, **params} for params in candidates],
+        initial_capital,
+        start,
+        end,
+        prices,
+        cache,
+    )
+    return np.column_stack([result.equity for result in results])
@@ -0,0 +1 @@
+from universe.universe import Universe, load_sp500
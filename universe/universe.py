@@ -0,0 +1,183 @@
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data.alignedprices import AlignedPrices
+from security import Equity
+
+SP500_CONSTITUENTS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "data_cache",
+    "s&p500_constituents.csv",
+)
+
+
+class Universe:
+    """
+    An indexed set of symbols and their sectors.
+
+    Every symbol has a dense integer id (its position in `symbols`) and every sector a dense
+    integer id (its position in `sectors`), so per-sector selections are integer or boolean
+    masks that can index the columns of a returns matrix directly. Symbols are grouped by
+    sector, so each sector is also a contiguous range of ids and its columns can be sliced
+    without a copy.
+
+    The sector helpers expect matrices whose columns are in universe order, such as the
+    returns of `securities` from a data source (e.g. `get_pct_returns_matrix`), which maps
+    every security to its own column of the underlying prices. The columns of `AlignedPrices`
+    are in the order tickers were added, so select from those with `columns` instead.
+    """
+
+    def __init__(
+        self,
+        symbols: Sequence[str],
+        sectors: Sequence[str],
+        names: Optional[Sequence[str]] = None,
+    ):
+        """
+        :param symbols: the tickers of the universe
+        :param sectors: the sector of each symbol
+        :param names: the company name of each symbol
+        """
+        assert len(symbols) == len(sectors), "Need one sector per symbol"
+        names = list(names) if names is not None else [""] * len(symbols)
+        # Yahoo uses "-" where other sources use "." (e.g. BRK.B)
+        symbols = [symbol.replace(".", "-") for symbol in symbols]
+        order = sorted(range(len(symbols)), key=lambda i: (sectors[i], symbols[i]))
+
+        self.symbols: List[str] = [symbols[i] for i in order]
+        self.names: List[str] = [names[i] for i in order]
+        self.sectors: List[str] = sorted(set(sectors))
+        sector_index = {sector: i for i, sector in enumerate(self.sectors)}
+        self.sector_ids = np.array(
+            [sector_index[sectors[i]] for i in order], dtype=np.int64
+        )
+        self._ids = {symbol: i for i, symbol in enumerate(self.symbols)}
+        # sector i spans ids [_sector_starts[i], _sector_starts[i + 1])
+        self._sector_starts = np.searchsorted(
+            self.sector_ids, np.arange(len(self.sectors) + 1)
+        )
+
+    @property
+    def securities(self) -> List[Equity]:
+        """
+        The securities of the universe, in universe order
+        """
+        return [Equity(symbol) for symbol in self.symbols]
+
+    @classmethod
+    def from_csv(cls, path: str) -> "Universe":
+        """
+        Loads a universe from a CSV file with "Symbol", "Name", and "Sector" columns
+        """
+        constituents = pd.read_csv(path)
+        return cls(
+            list(constituents["Symbol"]),
+            list(constituents["Sector"]),
+            list(constituents["Name"]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def subset(self, symbols: Sequence[str]) -> "Universe":
+        """
+        :return: a universe of `symbols` with the same sectors and names
+        """
+        ids = self.ids(symbols)
+        return Universe(
+            [self.symbols[i] for i in ids],
+            [self.sectors[self.sector_ids[i]] for i in ids],
+            [self.names[i] for i in ids],
+        )
+
+    def id(self, symbol: str) -> int:
+        return self._ids[symbol.replace(".", "-")]
+
+    def ids(self, symbols: Sequence[str]) -> np.ndarray:
+        return np.array([self.id(symbol) for symbol in symbols], dtype=np.int64)
+
+    def sector_id(self, sector: str) -> int:
+        return self.sectors.index(sector)
+
+    def sector_range(self, sector: str) -> Tuple[int, int]:
+        """
+        :return: the (start, end) range of the ids of the symbols in `sector`
+        """
+        i = self.sector_id(sector)
+        return int(self._sector_starts[i]), int(self._sector_starts[i + 1])
+
+    def sector_slice(self, sector: str) -> slice:
+        """
+        :return: a slice that selects the columns of `sector` from a matrix whose columns are
+        in universe order (e.g. the returns of `securities`), without copying
+        """
+        return slice(*self.sector_range(sector))
+
+    def sector_mask(self, sector: str) -> np.ndarray:
+        """
+        :return: a boolean mask over the universe of the symbols in `sector`
+        """
+        return self.sector_ids == self.sector_id(sector)
+
+    def sector_symbols(self, sector: str) -> List[str]:
+        return self.symbols[self.sector_slice(sector)]
+
+    def sector_means(self, values: np.ndarray) -> np.ndarray:
+        """
+        Averages the columns of each sector, ignoring NaNs
+        :param values: a (rows, symbols) matrix in universe order
+        :return: a (rows, sectors) matrix
+        """
+        valid = ~np.isnan(values)
+        starts = self._sector_starts[:-1]
+        sums = np.add.reduceat(np.where(valid, values, 0), starts, axis=-1)
+        counts = np.add.reduceat(valid, starts, axis=-1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums / counts
+
+    def sector_neutral(self, values: np.ndarray) -> np.ndarray:
+        """
+        Subtracts the sector mean from every column, e.g. to make portfolio weights neutral
+        with respect to each sector
+        :param values: a (rows, symbols) matrix in universe order
+        :return: a matrix of the same shape
+        """
+        return values - self.sector_means(values)[..., self.sector_ids]
+
+    def columns(
+        self, prices: AlignedPrices, sector: Optional[str] = None
+    ) -> np.ndarray:
+        """
+        Maps every symbol of the universe (or of one sector) to its column in `prices`, e.g. to
+        select sector columns from `AlignedPrices.returns`
+        :param prices: the aligned prices
+        :param sector: the sector to map (if None, map every symbol)
+        :return: an array of the column of each symbol in universe order (-1 if `prices` does
+        not have it)
+        """
+        symbols = self.symbols if sector is None else self.sector_symbols(sector)
+        columns = np.full(len(symbols), -1, dtype=np.int64)
+        for i, symbol in enumerate(symbols):
+            column = prices.column(symbol)
+            if column is not None:
+                columns[i] = column
+        return columns
+
+
+@lru_cache(maxsize=None)
+def load_sp500() -> Universe:
+    """
+    :return: the S&P 500 universe in `data_cache/s&p500_constituents.csv` (loaded once)
+    """
+    return Universe.from_csv(SP500_CONSTITUENTS)
+
+
+def sector_groups(universe: Universe) -> Dict[str, slice]:
+    """
+    :return: the slice of the columns of every sector of `universe`
+    """
+    return {sector: universe.sector_slice(sector) for sector in universe.sectors}